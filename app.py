@@ -1,10 +1,16 @@
 import time
-from collections import defaultdict, deque
+import threading
+from collections import defaultdict, deque, OrderedDict
 import heapq
+import bisect
+import math
+import re
 import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 import ast
 from uuid import uuid4
+from functools import partial
 import random
 import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
@@ -13,8 +19,12 @@ from flask_cors import CORS
 from bs4 import BeautifulSoup
 import requests
 import pandas as pd
+import numpy as np
 import google.generativeai as genai
 import json
+import copy
+import pickle
+import hashlib
 from dotenv import load_dotenv
 import os
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -43,6 +53,13 @@ if not os.path.exists(TOKEN_TOTAL_FILE):
     with open(TOKEN_TOTAL_FILE, 'w') as f:
         json.dump({"total_tokens": 0}, f)
 
+# On-disk cache of validated AI schedules, shared across restarts. The
+# directory is created on the first store
+AI_RESPONSE_CACHE_DIR = os.getenv("AI_RESPONSE_CACHE_DIR", "ai_response_cache")
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+ai_response_cache_stats = {'hits': 0, 'misses': 0,
+                           'tokens_saved': 0, 'cost_saved': 0.0}
+
 # Cost tracking CSV file
 COST_TRACKING_FILE = "cost_tracking.csv"
 COMPANY_COST_FILE = "company_total_cost.txt"
@@ -71,15 +88,20 @@ if not os.path.exists(COMPANY_COST_FILE):
         f.write("=" * 50 + "\n")
 
 
+# The log is rewritten in full on every entry, so writers take turns
+_log_file_lock = threading.Lock()
+
+
 def save_log_entry(timestamp=datetime.now(timezone.utc), message=""):
     log_entry = {
         timestamp.isoformat(): message
     }
-    with open(log_file, 'r+') as f:
-        logs = json.load(f)
-        logs.append(log_entry)
-        f.seek(0)
-        json.dump(logs, f, indent=4)
+    with _log_file_lock:
+        with open(log_file, 'r+') as f:
+            logs = json.load(f)
+            logs.append(log_entry)
+            f.seek(0)
+            json.dump(logs, f, indent=4)
 
 
 def load_json_file(file_path):
@@ -319,7 +341,9 @@ def get_company_cost_summary():
 #         return False
 
 
-def generate_schedule_pdf(schedule_data, inputColors):
+def generate_schedule_pdf(schedule_data, inputColors, conflict_crns=None):
+    """Render the schedule table and calendar to a PDF; rows whose CRN is in
+    conflict_crns are highlighted"""
     try:
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter)
@@ -337,13 +361,17 @@ def generate_schedule_pdf(schedule_data, inputColors):
             ])
 
         table = Table(table_data, repeatRows=1)
-        table.setStyle(TableStyle([
+        table_style = [
             ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
             ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ]))
+        ]
+        for row, cls in enumerate(schedule_data, start=1):
+            if conflict_crns and str(cls["crn"]) in conflict_crns:
+                table_style.append(('BACKGROUND', (0, row), (-1, row), colors.mistyrose))
+        table.setStyle(TableStyle(table_style))
         elements.append(table)
         elements.append(Spacer(1, 20))
 
@@ -442,64 +470,31 @@ def update_total_tokens(tokens):
     return total
 
 
-def ai_maker(prompt, courses):
-    ai_start_time = time.time()
-
-    # Configure the API key
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-    # Use the model from environment variable
-    model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-
-    # Fallback models if the primary one fails
-    fallback_models = ["gemini-2.5-pro", "gemini-2.5-flash-lite"]
-    current_model_index = 0
-
-    max_retries = 20  # Increased retries for complex course combinations
-    retry_count = 0
-    total_tokens = 0
-    total_input_tokens = 0
-    total_output_tokens = 0
-
-    # Track cumulative cost across all models and attempts
-    cumulative_cost = 0.0
-    model_usage = []  # Track usage per model
-
-    while retry_count < max_retries:
-        print(
-            f"AI Schedule Generation - Attempt {retry_count + 1}/{max_retries}")
-        # Create the structured output schema
-        schema = {
-            "type": "object",
-            "properties": {
-                "classes": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "crn": {"type": "string"},
-                            "courseNumber": {"type": "string"},
-                            "courseName": {"type": "string"},
-                            "professorName": {"type": "string"},
-                            "days": {"type": "string"},
-                            "time": {"type": "string"},
-                            "location": {"type": "string"},
-                            "isLab": {"type": "boolean"}
-                        },
-                        "required": ["crn", "courseNumber", "courseName", "professorName", "days", "time", "location"]
-                    }
-                }
-            },
-            "required": ["classes"]
+AI_SCHEDULE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "classes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "crn": {"type": "string"},
+                    "courseNumber": {"type": "string"},
+                    "courseName": {"type": "string"},
+                    "professorName": {"type": "string"},
+                    "days": {"type": "string"},
+                    "time": {"type": "string"},
+                    "location": {"type": "string"},
+                    "isLab": {"type": "boolean"}
+                },
+                "required": ["crn", "courseNumber", "courseName", "professorName", "days", "time", "location"]
+            }
         }
+    },
+    "required": ["classes"]
+}
 
-        try:
-            # Create the model
-            model = genai.GenerativeModel(model_name)
-
-            # Generate content with structured output
-            response = model.generate_content(
-                f"""You are a virtual timetable generator.
+AI_SCHEDULER_INSTRUCTIONS = """You are a virtual timetable generator.
 !!! IMPORTANT !!!
 IF ANY COURSE IS CLASHING WITH ANOTHER COURSE, RETURN NOTHING AT ALL UNTIL THE CLASH IS RESOLVED.
 
@@ -574,271 +569,1099 @@ BEFORE RETURNING ANY SCHEDULE:
 4. If any of these checks fail, return nothing and try another combination
 5. If no valid combination is found after trying all possibilities, return "NO_VALID_SCHEDULE_FOUND"
 
-{prompt}""",
-                generation_config=genai.types.GenerationConfig(
-                    response_mime_type="application/json",
-                    response_schema=schema
-                )
+"""
+
+AI_RETRY_INSTRUCTIONS = """You are fixing a timetable that was almost valid.
+Rules:
+- The classes in <fixed_classes> are already chosen. Do not change or return them.
+- For each course in <sections>, pick exactly one CRN per schedule type and include all of that CRN's meetings.
+- Nothing may overlap another chosen or fixed class, and consecutive classes need at least a 5-minute gap.
+- Course codes are DEPARTMENTNUMBER without hyphens; times use 12-hour format like 9:30AM - 10:45AM.
+Return only the classes for the courses in <sections>.
+
+"""
+
+# Gemini attempts launched concurrently per round; 1 keeps attempts sequential
+AI_HEDGE_ATTEMPTS = int(os.getenv("AI_HEDGE_ATTEMPTS", "1"))
+# Models and temperatures the extra hedged attempts rotate through
+AI_HEDGE_MODELS = [model for model in os.getenv(
+    "AI_HEDGE_MODELS", "").split(",") if model]
+AI_HEDGE_TEMPERATURES = [float(t) for t in os.getenv(
+    "AI_HEDGE_TEMPERATURES", "0.4,0.8").split(",") if t]
+# Shared worker pool for Gemini attempts, sized for a few concurrent hedged requests
+AI_HEDGE_POOL_SIZE = int(os.getenv("AI_HEDGE_POOL_SIZE", str(max(AI_HEDGE_ATTEMPTS, 1) * 4)))
+ai_attempt_pool = ThreadPoolExecutor(
+    max_workers=AI_HEDGE_POOL_SIZE, thread_name_prefix="ai-attempt")
+# Spending cap (USD) for one hedged ai_maker call
+AI_HEDGE_MAX_COST = float(os.getenv("AI_HEDGE_MAX_COST", "0.05"))
+# Output size assumed when estimating the cost of an attempt
+AI_ESTIMATED_OUTPUT_TOKENS = 1500
+
+# Model backend: "gemini" calls the real API, "mock" serves schedules built
+# locally from the prompt so the AI path can be load and cost tested offline
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "gemini")
+MOCK_GEMINI_LATENCY = float(os.getenv("MOCK_GEMINI_LATENCY", "0.5"))  # Mean seconds per call
+MOCK_GEMINI_LATENCY_JITTER = float(os.getenv("MOCK_GEMINI_LATENCY_JITTER", "0.2"))  # +/- fraction
+MOCK_GEMINI_TOKEN_SCALE = float(os.getenv("MOCK_GEMINI_TOKEN_SCALE", "1.0"))  # Multiplies reported tokens
+MOCK_GEMINI_OVERLAP_RATE = float(os.getenv("MOCK_GEMINI_OVERLAP_RATE", "0.0"))  # Replies with a clash
+MOCK_GEMINI_MISSING_RATE = float(os.getenv("MOCK_GEMINI_MISSING_RATE", "0.0"))  # Replies missing a course
+MOCK_GEMINI_INVALID_JSON_RATE = float(os.getenv("MOCK_GEMINI_INVALID_JSON_RATE", "0.0"))
+MOCK_GEMINI_ERROR_RATE = float(os.getenv("MOCK_GEMINI_ERROR_RATE", "0.0"))  # Calls that raise
+# Optional JSON file of canned replies ({"classes": [...]} or a list of them), served in turn
+MOCK_GEMINI_RESPONSE_FILE = os.getenv("MOCK_GEMINI_RESPONSE_FILE")
+MOCK_GEMINI_SEED = os.getenv("MOCK_GEMINI_SEED")
+
+# Process-wide Gemini client state: the SDK is configured once and model and
+# generation config objects are shared by every request and attempt, so the
+# client (and its connections) is not rebuilt per attempt
+_gemini_lock = threading.Lock()
+_gemini_configured = False
+_gemini_models = {}
+_gemini_generation_configs = {}
+
+
+def get_gemini_model(model_name):
+    """Shared GenerativeModel for model_name, configuring the SDK on first use"""
+    global _gemini_configured
+    with _gemini_lock:
+        if GEMINI_BACKEND == "mock":
+            model = _gemini_models.get(model_name)
+            if model is None:
+                model = _gemini_models[model_name] = MockGenerativeModel(
+                    model_name)
+            return model
+        if not _gemini_configured:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _gemini_configured = True
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = _gemini_models[model_name] = genai.GenerativeModel(
+                model_name)
+        return model
+
+
+def get_generation_config(schema_name="schedule", temperature=None):
+    """Prebuilt JSON-output GenerationConfig for one of GEMINI_SCHEMAS"""
+    key = (schema_name, temperature)
+    with _gemini_lock:
+        config = _gemini_generation_configs.get(key)
+        if config is None:
+            config = _gemini_generation_configs[key] = genai.types.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=GEMINI_SCHEMAS[schema_name],
+                temperature=temperature
             )
+        return config
+
+
+def set_gemini_backend(backend):
+    """Switch between the "gemini" and "mock" backends at runtime"""
+    global GEMINI_BACKEND
+    if backend not in ("gemini", "mock"):
+        raise ValueError(f"Unknown Gemini backend: {backend}")
+    with _gemini_lock:
+        GEMINI_BACKEND = backend
+        _gemini_models.clear()
+
+
+class MockGenerativeModel:
+    """Local stand-in for genai.GenerativeModel.
+
+    Schedule prompts are answered with a schedule picked from the prompt's own
+    <sections> (or a canned reply from MOCK_GEMINI_RESPONSE_FILE), perturbed
+    with overlaps, missing courses, invalid JSON or errors at the configured
+    MOCK_GEMINI_* rates. Latency and token counts are simulated too.
+    """
+
+    _canned_lock = threading.Lock()
+    _canned_index = 0
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        seed = f"{MOCK_GEMINI_SEED}:{model_name}" if MOCK_GEMINI_SEED is not None else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None):
+        with self.lock:
+            latency = MOCK_GEMINI_LATENCY * (
+                1 + self.rng.uniform(-MOCK_GEMINI_LATENCY_JITTER, MOCK_GEMINI_LATENCY_JITTER))
+            fail = self.rng.random() < MOCK_GEMINI_ERROR_RATE
+            invalid_json = self.rng.random() < MOCK_GEMINI_INVALID_JSON_RATE
+            if getattr(generation_config, 'response_schema', None) is PREFERENCE_SCHEMA:
+                reply = {"weights": _preference_weights(prompt.rsplit("Preferences:", 1)[-1]),
+                         "constraints": {}}
+            else:
+                reply = {"classes": self._schedule(prompt)}
+        time.sleep(max(latency, 0))
+        if fail:
+            raise RuntimeError(f"Mock {self.model_name}: 503 Service Unavailable")
+
+        text = json.dumps(reply)
+        if invalid_json:
+            text = text[:len(text) // 2]
+        input_tokens = int(estimate_tokens(prompt) * MOCK_GEMINI_TOKEN_SCALE)
+        output_tokens = int(estimate_tokens(text) * MOCK_GEMINI_TOKEN_SCALE)
+        usage = type('MockUsageMetadata', (), {
+            'prompt_token_count': input_tokens,
+            'candidates_token_count': output_tokens,
+            'total_token_count': input_tokens + output_tokens})()
+        return type('MockResponse', (), {'text': text, 'usage_metadata': usage})()
+
+    def _schedule(self, prompt):
+        """Classes for a schedule prompt, perturbed at the configured rates"""
+        canned = self._canned_reply()
+        if canned is not None:
+            classes = copy.deepcopy(canned)
+        else:
+            classes = []
+            chosen_intervals = _parse_fixed_intervals(prompt)
+            for (course_code, _), sections in _parse_prompt_sections(prompt).items():
+                # Prefer a section that fits, like a model that mostly follows the rules
+                sections = self.rng.sample(sections, len(sections))
+                pick = next((section for section in sections
+                             if not _sections_clash(_meeting_intervals(section), chosen_intervals)),
+                            sections[0])
+                chosen_intervals.extend(_meeting_intervals(pick))
+                classes.extend(_section_to_ai_classes(pick))
+
+        course_codes = sorted({cls['courseNumber'] for cls in classes})
+        if len(course_codes) > 1 and self.rng.random() < MOCK_GEMINI_MISSING_RATE:
+            dropped = self.rng.choice(course_codes)
+            classes = [cls for cls in classes if cls['courseNumber'] != dropped]
+        timed = [cls for cls in classes if '-' in cls['time'] and cls['days'] not in ('ARR', 'Online')]
+        if len(timed) > 1 and self.rng.random() < MOCK_GEMINI_OVERLAP_RATE:
+            source, target = self.rng.sample(timed, 2)
+            target['days'], target['time'] = source['days'], source['time']
+        return classes
+
+    def _canned_reply(self):
+        if not MOCK_GEMINI_RESPONSE_FILE:
+            return None
+        with open(MOCK_GEMINI_RESPONSE_FILE) as f:
+            replies = json.load(f)
+        if isinstance(replies, dict):
+            replies = [replies]
+        with MockGenerativeModel._canned_lock:
+            reply = replies[MockGenerativeModel._canned_index % len(replies)]
+            MockGenerativeModel._canned_index += 1
+        return reply['classes']
+
+
+def _parse_fixed_intervals(prompt):
+    """(day, start, end) intervals of a follow-up prompt's <fixed_classes>"""
+    match = re.search(r"<fixed_classes>(.*?)</fixed_classes>", prompt, re.DOTALL)
+    intervals = []
+    for line in (match.group(1).strip().splitlines() if match else []):
+        fields = line.split('|')
+        if len(fields) != 4 or ' - ' not in fields[3]:
+            continue
+        try:
+            start, end = (parse_time_minutes(part) for part in fields[3].split(' - '))
+        except ValueError:
+            continue
+        intervals.extend((day, start, end) for day in _parse_day_codes(fields[2]))
+    return intervals
+
+
+def _parse_prompt_sections(prompt):
+    """Sections of a compact schedule prompt, grouped by (course, schedule type)
+    in the shape _merge_section_rows produces"""
+    def table(tag):
+        match = re.search(f"<{tag}>(.*?)</{tag}>", prompt, re.DOTALL)
+        entries = match.group(1).split(';') if match and match.group(1) else []
+        return dict(entry.split('=', 1) for entry in entries if '=' in entry)
+
+    instructors = table('instructors')
+    locations = table('locations')
+    groups = OrderedDict()
+    blocks = re.finditer(
+        r"<course_number>(.*?)</course_number>\s*<course_name>(.*?)</course_name>.*?"
+        r"<sections>\n?(.*?)</sections>", prompt, re.DOTALL)
+    for block in blocks:
+        course_code, title, lines = block.groups()
+        for line in lines.strip().splitlines():
+            fields = line.split('|')
+            if len(fields) != 5:
+                continue
+            crn, schedule_type, modality, instructor, meeting_text = fields
+            meetings = []
+            for meeting in meeting_text.split(';'):
+                meeting, _, location = meeting.partition(' @')
+                days, _, meeting_time = meeting.partition(' ')
+                begin, _, end = meeting_time.partition('-')
+                if begin == 'ARR':
+                    begin = ''
+                meetings.append({'days': '' if days == '-' else days, 'begin': begin,
+                                 'end': end, 'location': locations.get(location, location)})
+            groups.setdefault((course_code, schedule_type), []).append({
+                'crn': crn, 'course_code': course_code, 'title': title,
+                'schedule_type': schedule_type, 'modality': modality,
+                'instructor': instructors.get(instructor, instructor),
+                'meetings': meetings})
+    return groups
+
+
+def normalize_time_format(time_str):
+    """Ensure consistent spacing around dashes in time strings"""
+    # Replace dash without spaces with dash with spaces
+    time_str = time_str.replace('-', ' - ')
+    # Clean up any double spaces
+    time_str = ' '.join(time_str.split())
+    return time_str
+
+
+# "9:30AM - 10:45AM", "9:30 am-10:45 am", "14:00-15:15"
+TIME_RANGE_PATTERN = re.compile(
+    r"^\s*(\d{1,2})(?::(\d{2}))?\s*([AP]M)?\s*-\s*(\d{1,2})(?::(\d{2}))?\s*([AP]M)?\s*$",
+    re.IGNORECASE)
+
+
+def _clock_minutes(hours, minutes, period):
+    hours, minutes = int(hours), int(minutes or 0)
+    if period:
+        period = period.upper()
+        if period == 'PM' and hours != 12:
+            hours += 12
+        elif period == 'AM' and hours == 12:
+            hours = 0
+    return hours * 60 + minutes
+
+
+def parse_time_range(time_str):
+    """(start, end) minutes since midnight for a class time range, or None
+    for ARR/online/unparseable times"""
+    match = TIME_RANGE_PATTERN.match(str(time_str or ''))
+    if match is None:
+        return None
+    start_h, start_m, start_p, end_h, end_m, end_p = match.groups()
+    # "9:30 - 10:45AM" shares the end's period
+    start = _clock_minutes(start_h, start_m, start_p or end_p)
+    end = _clock_minutes(end_h, end_m, end_p)
+    return (start, end) if start < end else None
+
+
+def _sweep_conflicts(intervals_by_day, min_gap):
+    """Every clashing pair from {day: [(start, end, key)]}, swept in start
+    order with a heap of open meetings. Returns (day, key_a, key_b, overlap)
+    tuples where key_a starts first and overlap <= 0 means a too-small gap."""
+    conflicts = []
+    for day, intervals in intervals_by_day.items():
+        intervals.sort()
+        active = []  # Heap of (end, start, key) still open at the sweep line
+        for start, end, key in intervals:
+            while active and active[0][0] + min_gap <= start:
+                heapq.heappop(active)
+            for other_end, _, other_key in active:
+                conflicts.append((day, other_key, key, min(end, other_end) - start))
+            heapq.heappush(active, (end, start, key))
+    return conflicts
+
+
+def validate_schedule(classes, required_courses=None, min_gap=None, known_crns=None):
+    """Check a schedule (response-format classes) for clashes, missing or
+    extra courses and unknown CRNs.
+
+    Each class is parsed once and every day is swept in start order, so all
+    conflicts are found, not just clashes between neighbours. Two meetings
+    conflict when they overlap or sit closer than min_gap minutes (default
+    AI_MIN_GAP_MINUTES). Returns
+    a dict with valid, missing (required course codes not scheduled),
+    extra (scheduled course codes that weren't required), unknown_crns
+    (CRNs not in known_crns, when given), conflicts (one entry per clashing
+    pair and day) and unparsed (indexes of classes without a usable time,
+    e.g. ARR or online).
+    """
+    if min_gap is None:
+        min_gap = AI_MIN_GAP_MINUTES
+    scheduled_courses = set()
+    unknown_crns = set()
+    intervals_by_day = defaultdict(list)
+    unparsed = []
+    for index, cls in enumerate(classes):
+        course_code = str(cls.get("courseNumber", "")).replace("-", "")
+        scheduled_courses.add(course_code)
+        crn = str(cls.get("crn", "")).strip()
+        if known_crns is not None and crn not in known_crns:
+            unknown_crns.add(crn)
+        interval = parse_time_range(cls.get("time"))
+        if interval is None:
+            unparsed.append(index)
+            continue
+        for day in _parse_day_codes(cls.get("days", "")):
+            intervals_by_day[day].append((interval[0], interval[1], index))
+
+    conflicts = []
+    for day, first, second, overlap in _sweep_conflicts(intervals_by_day, min_gap):
+        conflicts.append({
+            'day': day,
+            'course_a': str(classes[first].get("courseNumber", "")).replace("-", ""),
+            'crn_a': str(classes[first].get("crn", "")),
+            'course_b': str(classes[second].get("courseNumber", "")).replace("-", ""),
+            'crn_b': str(classes[second].get("crn", "")),
+            'overlap_minutes': max(0, overlap),
+            'kind': 'overlap' if overlap > 0 else 'gap'
+        })
+
+    missing = []
+    extra = []
+    if required_courses is not None:
+        required = set(code.replace("-", "") for code in required_courses)
+        missing = sorted(required - scheduled_courses)
+        extra = sorted(scheduled_courses - required)
+    return {
+        'valid': not conflicts and not missing and not extra and not unknown_crns,
+        'missing': missing,
+        'extra': extra,
+        'unknown_crns': sorted(unknown_crns),
+        'conflicts': conflicts,
+        'unparsed': unparsed
+    }
 
-            responseText = response.text
-
-            # Track input and output tokens separately for pricing
-            if response.usage_metadata:
-                input_tokens = response.usage_metadata.prompt_token_count if hasattr(
-                    response.usage_metadata, 'prompt_token_count') else 0
-                output_tokens = response.usage_metadata.candidates_token_count if hasattr(
-                    response.usage_metadata, 'candidates_token_count') else 0
-                total_tokens = response.usage_metadata.total_token_count
-
-                total_input_tokens += input_tokens
-                total_output_tokens += output_tokens
-
-                # Calculate cost for this attempt
-                attempt_cost_info = calculate_gemini_cost(
-                    input_tokens, output_tokens, model_name)
-                cumulative_cost += attempt_cost_info['total_cost']
-
-                # Track model usage
-                model_usage.append({
-                    'model': model_name,
-                    'attempt': retry_count + 1,
-                    'input_tokens': input_tokens,
-                    'output_tokens': output_tokens,
-                    'cost': attempt_cost_info['total_cost'],
-                    'success': False  # Will be updated if successful
-                })
 
-                print(
-                    f"Token usage: {input_tokens} input + {output_tokens} output = {total_tokens} total tokens")
-                print(
-                    f"Attempt cost: ${attempt_cost_info['total_cost']} | Cumulative cost: ${cumulative_cost:.4f}")
+def classes_over_daily_limit(classes, max_classes_per_day):
+    """Days on which more than max_classes_per_day distinct CRNs meet"""
+    if not max_classes_per_day:
+        return []
+    crns_by_day = defaultdict(set)
+    for cls in classes:
+        if parse_time_range(cls.get("time")) is None:
+            continue
+        for day in _parse_day_codes(cls.get("days", "")):
+            crns_by_day[day].add(str(cls.get("crn", "")))
+    return sorted(day for day, crns in crns_by_day.items()
+                  if len(crns) > max_classes_per_day)
+
+
+def validate_ai_schedule(response_dict, courses, courses_data=None, constraints=None,
+                         preferences=""):
+    """Check an AI schedule for missing courses, overlaps and days over
+    max_classes_per_day.
+
+    Near misses are repaired from the catalog when courses_data is given,
+    under the same hard constraints and preferences as the request.
+    Returns (classes, repaired, problems); classes is None if the response
+    is unusable, and problems then lists the missing courses and the
+    clashing course pairs for a follow-up prompt.
+    """
+    classes = response_dict["classes"]
+    repaired = False
+    course_codes = [course['department'] + course['number'] for course in courses]
+    known_crns = None
+    if courses_data:
+        known_crns = {str(crn).strip() for code in course_codes
+                      if courses_data.get(code) is not None
+                      for crn in courses_data[code]['CRN'] if str(crn).strip()}
+    result = validate_schedule(classes, course_codes, known_crns=known_crns)
+    problems = {
+        'missing': set(result['missing']),
+        'extra': set(result['extra']),
+        'unknown_crns': set(result['unknown_crns']),
+        'conflicts': [(conflict['course_a'], conflict['course_b'], conflict['day'])
+                      for conflict in result['conflicts']]
+    }
+    over_limit = classes_over_daily_limit(
+        classes, (constraints or {}).get('max_classes_per_day'))
+    if problems['missing']:
+        print(f"Missing courses in schedule: {sorted(problems['missing'])}")
+    if problems['extra'] or problems['unknown_crns']:
+        print(f"Schedule has extra courses {sorted(problems['extra'])} "
+              f"and unknown CRNs {sorted(problems['unknown_crns'])}")
+    if problems['conflicts']:
+        print(f"{len(problems['conflicts'])} conflicts in schedule: {problems['conflicts']}")
+
+    if not result['valid'] or over_limit:
+        # Swap out missing or clashing sections locally before re-prompting
+        classes = repair_ai_schedule(classes, courses, courses_data, constraints, preferences)
+        if classes is None:
+            return None, False, problems
+        repaired = True
+
+    # Normalize time formats in the response before returning
+    for cls in classes:
+        if "time" in cls:
+            cls["time"] = normalize_time_format(cls["time"])
+    return classes, repaired, problems
+
+
+def build_ai_retry_prompt(classes, problems, courses, courses_data, preferences="", constraints=None):
+    """Short follow-up prompt that only re-asks for the courses that failed.
+
+    The classes of every other course are sent as fixed busy times, and only
+    the sections of the missing or clashing courses are included, under the
+    same preferences and hard constraints as the first prompt. Returns
+    (prompt, kept_classes, retry_courses) or None if everything failed.
+    """
+    # Courses with made-up CRNs are re-asked; courses nobody requested are dropped
+    bad_codes = set(problems['missing']) | set(problems['extra'])
+    bad_codes |= {cls["courseNumber"].replace("-", "") for cls in classes
+                  if str(cls.get("crn", "")).strip() in problems['unknown_crns']}
+    # One side of each clash is enough to re-ask; the other stays fixed
+    for course_a, course_b, _ in problems['conflicts']:
+        if course_a not in bad_codes:
+            bad_codes.add(course_b)
+    retry_courses = [course for course in courses
+                     if course['department'] + course['number'] in bad_codes]
+    kept_classes = [cls for cls in classes
+                    if cls["courseNumber"].replace("-", "") not in bad_codes]
+    if not retry_courses or not kept_classes:
+        return None
+
+    problem_lines = [f"- Missing course: {code}" for code in sorted(problems['missing'])]
+    problem_lines += [f"- Unknown CRN: {crn}" for crn in sorted(problems['unknown_crns'])]
+    problem_lines += [f"- {course_a} and {course_b} overlap on {day}"
+                      for course_a, course_b, day in problems['conflicts']]
+    sections_prompt, _ = build_ai_prompt(
+        retry_courses, courses_data, preferences, constraints, with_stats=False)
+
+    retry_prompt = "<problems>\n" + "\n".join(problem_lines) + "\n</problems>\n"
+    retry_prompt += "<fixed_classes>\n" + "\n".join(
+        f"{cls['courseNumber']}|{cls['crn']}|{cls['days']}|{cls['time']}" for cls in kept_classes)
+    retry_prompt += "\n</fixed_classes>\n" + sections_prompt
+    return retry_prompt, kept_classes, retry_courses
+
+
+def _ai_attempt(model_name, prompt, temperature=None, instructions=None):
+    """Make one Gemini schedule request.
+
+    Returns (response_dict, input_tokens, output_tokens, latency);
+    response_dict is None when the reply isn't valid JSON.
+    """
+    attempt_start = time.time()
+    response = get_gemini_model(model_name).generate_content(
+        (instructions or AI_SCHEDULER_INSTRUCTIONS) + prompt,
+        generation_config=get_generation_config("schedule", temperature)
+    )
+
+    # Track input and output tokens separately for pricing
+    input_tokens = output_tokens = 0
+    if response.usage_metadata:
+        input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
+        output_tokens = getattr(
+            response.usage_metadata, 'candidates_token_count', 0)
+
+    # Runs on ai_attempt_pool threads, so the caller logs a bad reply
+    try:
+        response_dict = json.loads(response.text)
+    except json.JSONDecodeError:
+        response_dict = None
+    return response_dict, input_tokens, output_tokens, time.time() - attempt_start
+
+
+# Per-attempt model telemetry used to route ai_maker between models.
+# "static" (the default) keeps the fixed GEMINI_MODEL -> fallback_models
+# order; "telemetry" picks the cheapest expected model per attempt
+AI_MODEL_ROUTING = os.getenv("AI_MODEL_ROUTING", "static")
+MODEL_TELEMETRY_FILE = "model_telemetry.jsonl"
+AI_ROUTER_WINDOW = 200  # Recent attempts kept per model
+# The file is rewritten from the in-memory windows once it grows past this
+MODEL_TELEMETRY_MAX_LINES = int(os.getenv("MODEL_TELEMETRY_MAX_LINES", "5000"))
+AI_ROUTER_MIN_SAMPLES = 5  # Below this, size-matched samples fall back to all samples
+AI_ROUTER_FAILURE_DECAY = 0.7  # Success odds left after each failure on the same prompt
+AI_ROUTER_DEFAULT_LATENCY = 10.0  # Seconds assumed for a model with no history
+# Dollar value of one second of user waiting, so latency counts toward cost
+AI_ROUTER_LATENCY_COST = float(os.getenv("AI_ROUTER_LATENCY_COST", "0.0005"))
+
+model_telemetry = defaultdict(lambda: deque(maxlen=AI_ROUTER_WINDOW))
+_telemetry_lock = threading.Lock()
+# Serializes file appends and compaction, so file I/O never holds up routing
+_telemetry_file_lock = threading.Lock()
+telemetry_file_lines = 0
+
+
+def _load_model_telemetry():
+    """Warm the router with attempts recorded by earlier processes"""
+    global telemetry_file_lines
+    try:
+        with open(MODEL_TELEMETRY_FILE, 'r') as f:
+            for line in f:
+                telemetry_file_lines += 1
+                entry = json.loads(line)
+                model_telemetry[entry['model']].append(entry)
+    except (OSError, ValueError, KeyError):
+        pass
+
+
+_load_model_telemetry()
+
+
+def record_model_attempt(model_name, input_tokens, success, latency, cost):
+    """Add one Gemini attempt to the routing telemetry"""
+    entry = {
+        'model': model_name,
+        'timestamp': time.time(),
+        'input_tokens': input_tokens,
+        'success': success,
+        'latency': round(latency, 3) if latency is not None else None,
+        'cost': cost
+    }
+    with _telemetry_lock:
+        model_telemetry[model_name].append(entry)
+
+    global telemetry_file_lines
+    with _telemetry_file_lock:
+        try:
+            if telemetry_file_lines >= MODEL_TELEMETRY_MAX_LINES:
+                # Older lines can never be loaded back into the windows anyway
+                with _telemetry_lock:
+                    window = sorted((e for history in model_telemetry.values() for e in history),
+                                    key=lambda e: e['timestamp'])
+                temp_file = MODEL_TELEMETRY_FILE + ".tmp"
+                with open(temp_file, 'w') as f:
+                    f.writelines(json.dumps(e) + "\n" for e in window)
+                os.replace(temp_file, MODEL_TELEMETRY_FILE)
+                telemetry_file_lines = len(window)
             else:
-                total_tokens = 0
-                input_tokens = 0
-                output_tokens = 0
-                print(
-                    f"Token usage: {input_tokens} input + {output_tokens} output = {total_tokens} total tokens")
+                with open(MODEL_TELEMETRY_FILE, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+                telemetry_file_lines += 1
+        except OSError as e:
+            save_log_entry(message=f"Error recording model telemetry: {e}")
+
+
+def model_route_stats(model_name, prompt_tokens, failures=0):
+    """Rolling success rate, cost and latency of a model for prompts of
+    about this size, and the expected cost to get one valid schedule.
+
+    Attempts are treated as independent tries, so the expected cost is
+    (cost + latency value) / success rate. Each failure already seen on
+    this prompt lowers the success odds by AI_ROUTER_FAILURE_DECAY.
+    """
+    with _telemetry_lock:
+        history = list(model_telemetry[model_name])
+    samples = [entry for entry in history
+               if prompt_tokens / 2 <= entry['input_tokens'] <= prompt_tokens * 2]
+    if len(samples) < AI_ROUTER_MIN_SAMPLES:
+        samples = history
+
+    # Laplace-smoothed so unseen models start at 50%. Abandoned hedged
+    # attempts (success None) only count toward cost and latency
+    outcomes = [entry['success'] for entry in samples if entry['success'] is not None]
+    success_rate = (sum(1 for success in outcomes if success) + 1) / (len(outcomes) + 2)
+    costs = [entry['cost'] for entry in samples if entry['input_tokens']]
+    cost = (sum(costs) / len(costs) if costs else calculate_gemini_cost(
+        prompt_tokens, AI_ESTIMATED_OUTPUT_TOKENS, model_name)['total_cost'])
+    latencies = [entry['latency'] for entry in samples if entry['latency'] is not None]
+    latency = sum(latencies) / len(latencies) if latencies else AI_ROUTER_DEFAULT_LATENCY
+
+    effective_rate = max(success_rate * AI_ROUTER_FAILURE_DECAY ** failures, 1e-6)
+    return {
+        'samples': len(samples),
+        'success_rate': round(success_rate, 3),
+        'avg_cost': round(cost, 6),
+        'avg_latency': round(latency, 2),
+        'expected_cost_to_success': (cost + AI_ROUTER_LATENCY_COST * latency) / effective_rate
+    }
+
+
+def route_model(candidate_models, prompt_tokens, failures):
+    """Pick the candidate with the lowest expected cost to success; ties keep
+    the configured order"""
+    return min(candidate_models, key=lambda model: model_route_stats(
+        model, prompt_tokens, failures.get(model, 0))['expected_cost_to_success'])
+
+
+# Spending limits for the AI path. Per-request caps can be lowered per call
+AI_REQUEST_MAX_COST = float(os.getenv("AI_REQUEST_MAX_COST", "0.10"))  # USD
+AI_REQUEST_MAX_TOKENS = int(os.getenv("AI_REQUEST_MAX_TOKENS", "200000"))
+AI_GLOBAL_DAILY_BUDGET = float(os.getenv("AI_GLOBAL_DAILY_BUDGET", "20.0"))  # USD per rolling 24h
+AI_SPEND_WINDOW = 86400  # 24 hours
+
+# Circuit breaker over upstream Gemini errors
+AI_BREAKER_WINDOW = 60  # Seconds of call outcomes considered
+AI_BREAKER_MIN_CALLS = 10
+AI_BREAKER_ERROR_RATE = 0.5
+AI_BREAKER_COOLDOWN = 120  # Seconds the breaker stays open before a trial call
+
+AI_BUDGET_STOP_STATUSES = ('request_budget_exceeded', 'global_budget_exceeded', 'circuit_open')
+
+ai_spend_log = deque()  # (timestamp, cost)
+upstream_outcomes = deque()  # (timestamp, ok)
+ai_breaker = {'opened_at': None, 'trial_in_flight': False}
+_budget_lock = threading.Lock()
+
+
+def _load_recent_spend():
+    """Seed the global budget window from today's cost tracking rows"""
+    try:
+        df = pd.read_csv(COST_TRACKING_FILE)
+        timestamps = pd.to_datetime(df['timestamp'], errors='coerce')
+        cutoff = datetime.now() - pd.Timedelta(seconds=AI_SPEND_WINDOW)
+        for ts, cost in zip(timestamps, df['total_cost']):
+            if pd.notna(ts) and ts >= cutoff and cost > 0:
+                ai_spend_log.append((ts.timestamp(), float(cost)))
+    except Exception as e:
+        print(f"Error loading recent AI spend: {e}")
+
+
+_load_recent_spend()
+
+
+def record_ai_spend(cost):
+    with _budget_lock:
+        ai_spend_log.append((time.time(), cost))
+
+
+def global_ai_spend():
+    """USD spent on Gemini in the rolling AI_SPEND_WINDOW"""
+    cutoff = time.time() - AI_SPEND_WINDOW
+    with _budget_lock:
+        while ai_spend_log and ai_spend_log[0][0] < cutoff:
+            ai_spend_log.popleft()
+        return sum(cost for _, cost in ai_spend_log)
+
+
+def record_upstream_result(ok, trial=False):
+    """Feed one Gemini call outcome to the circuit breaker; trial marks the
+    half-open trial call handed out by ai_breaker_acquire"""
+    now = time.time()
+    with _budget_lock:
+        if trial:
+            # Half-open: the trial call decides, closing starts a fresh window
+            ai_breaker['trial_in_flight'] = False
+            ai_breaker['opened_at'] = None if ok else now
+            upstream_outcomes.clear()
+            upstream_outcomes.append((now, ok))
+            return
+
+        upstream_outcomes.append((now, ok))
+        while upstream_outcomes and upstream_outcomes[0][0] < now - AI_BREAKER_WINDOW:
+            upstream_outcomes.popleft()
+
+        errors = sum(1 for _, outcome in upstream_outcomes if not outcome)
+        if (ai_breaker['opened_at'] is None and len(upstream_outcomes) >= AI_BREAKER_MIN_CALLS and
+                errors / len(upstream_outcomes) >= AI_BREAKER_ERROR_RATE):
+            ai_breaker['opened_at'] = now
+            save_log_entry(
+                message=f"AI circuit breaker opened: {errors}/{len(upstream_outcomes)} upstream errors")
+
+
+def ai_breaker_acquire():
+    """Ask the breaker for permission right before submitting Gemini calls.
+
+    Returns 'closed' when calls may go out, 'trial' once the cooldown has
+    passed and the caller now holds the single half-open trial call, or
+    None while the breaker is open. A trial must end in
+    record_upstream_result(..., trial=True) or ai_breaker_release_trial().
+    """
+    with _budget_lock:
+        if ai_breaker['opened_at'] is None:
+            return 'closed'
+        if ai_breaker['trial_in_flight'] or time.time() - ai_breaker['opened_at'] < AI_BREAKER_COOLDOWN:
+            return None
+        ai_breaker['trial_in_flight'] = True
+        return 'trial'
+
+
+def ai_breaker_release_trial():
+    """Give back a trial that was acquired but never sent"""
+    with _budget_lock:
+        ai_breaker['trial_in_flight'] = False
+
+
+def ai_budget_stop_reason(spent_cost, spent_tokens, next_cost, next_tokens,
+                          max_cost=None, max_tokens=None):
+    """Why the next AI attempt must not run, or None if it may"""
+    if spent_cost + next_cost > (max_cost if max_cost is not None else AI_REQUEST_MAX_COST):
+        return 'request_budget_exceeded'
+    if spent_tokens + next_tokens > (max_tokens if max_tokens is not None else AI_REQUEST_MAX_TOKENS):
+        return 'request_budget_exceeded'
+    if global_ai_spend() + next_cost > AI_GLOBAL_DAILY_BUDGET:
+        return 'global_budget_exceeded'
+    return None
+
+
+def _settle_ai_attempt(model_name, trial, future):
+    """Done-callback for every submitted attempt: bills its tokens to the
+    global budget and reports the outcome to the breaker, also for attempts
+    that finish after ai_maker has returned"""
+    if future.cancelled():
+        if trial:
+            ai_breaker_release_trial()
+        return
+    try:
+        _, input_tokens, output_tokens, _ = future.result()
+    except Exception:
+        record_upstream_result(False, trial=trial)
+        return
+    record_upstream_result(True, trial=trial)
+    record_ai_spend(calculate_gemini_cost(
+        input_tokens, output_tokens, model_name)['total_cost'])
+
+
+def _record_abandoned_attempt(model_name, future):
+    """Telemetry for an attempt ai_maker stopped waiting for"""
+    if future.cancelled():
+        return
+    try:
+        _, input_tokens, output_tokens, latency = future.result()
+    except Exception:
+        record_model_attempt(model_name, 0, False, None, 0.0)
+        return
+    record_model_attempt(model_name, input_tokens, None, latency, calculate_gemini_cost(
+        input_tokens, output_tokens, model_name)['total_cost'])
+
+
+def _print_model_breakdown(model_breakdown, cumulative_cost, failed=False):
+    """Print the per-model attempt and cost summary of an ai_maker call"""
+    print("\n" + "="*60)
+    print("DETAILED MODEL BREAKDOWN (FAILED):" if failed else "DETAILED MODEL BREAKDOWN:")
+    print("="*60)
 
+    for model, stats in model_breakdown.items():
+        print(f"\n📊 {model.upper()}:")
+        print(f"   • Total Attempts: {stats['total_attempts']}")
+        print(f"   • Successful Attempts: {stats['successful_attempts']}")
+        print(f"   • Success Rate: {stats['success_rate']}%")
+        print(f"   • Total Tokens: {stats['total_tokens']:,}")
+        print(f"   • Total Cost: ${stats['total_cost']:.4f}")
+        print(f"   • Avg Tokens/Attempt: {stats['avg_tokens_per_attempt']:,}")
+        print(f"   • Avg Cost/Attempt: ${stats['avg_cost_per_attempt']:.4f}")
+
+    print(f"\n💰 TOTAL COST ACROSS ALL MODELS: ${cumulative_cost:.4f}")
+    print("="*60)
+
+
+def ai_response_cache_key(model_name, prompt):
+    """Hash of everything that determines a Gemini schedule response"""
+    payload = json.dumps(
+        [model_name, AI_SCHEDULER_INSTRUCTIONS, prompt, AI_SCHEDULE_SCHEMA], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load_ai_response(model_names, prompt, max_age):
+    """Return the freshest-model cached response for this prompt, if any"""
+    for model_name in model_names:
+        path = os.path.join(AI_RESPONSE_CACHE_DIR,
+                            ai_response_cache_key(model_name, prompt) + ".json")
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if time.time() - entry['timestamp'] > max_age:
             try:
-                response_dict = json.loads(responseText)
-
-                # If we got a valid schedule, check for overlaps and completeness
-                if "classes" in response_dict and response_dict["classes"]:
-                    # First, check if all requested courses are included
-                    requested_courses = set()
-                    for course in courses:
-                        requested_courses.add(
-                            course['department'] + course['number'])
-
-                    scheduled_courses = set()
-                    for cls in response_dict["classes"]:
-                        # Normalize course number by removing hyphens
-                        course_number = cls["courseNumber"].replace("-", "")
-                        scheduled_courses.add(course_number)
-
-                    if requested_courses != scheduled_courses:
-                        print(
-                            f"Missing courses in schedule. Requested: {requested_courses}, Scheduled: {scheduled_courses}")
-                        retry_count += 1
-                        continue
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        return entry
+    return None
+
+
+def store_ai_response(model_name, prompt, classes, total_tokens, total_cost):
+    """Persist a validated schedule so identical prompts skip the model"""
+    path = os.path.join(AI_RESPONSE_CACHE_DIR,
+                        ai_response_cache_key(model_name, prompt) + ".json")
+    entry = {
+        'timestamp': time.time(),
+        'model': model_name,
+        'classes': classes,
+        'total_tokens': total_tokens,
+        'total_cost': total_cost
+    }
+    try:
+        os.makedirs(AI_RESPONSE_CACHE_DIR, exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        prune_ai_response_cache()
+    except OSError as e:
+        save_log_entry(message=f"Error caching AI response: {str(e)}")
+
+
+def prune_ai_response_cache(max_age=None):
+    """Delete cached responses older than max_age (default CACHE_DURATION,
+    the longest TTL any caller uses), then the oldest ones beyond
+    AI_RESPONSE_CACHE_MAX_ENTRIES. Returns how many files were removed."""
+    max_age = CACHE_DURATION if max_age is None else max_age
+    entries = []
+    for name in os.listdir(AI_RESPONSE_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(AI_RESPONSE_CACHE_DIR, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age
+    stale = [path for index, (mtime, path) in enumerate(entries)
+             if mtime < cutoff or index >= AI_RESPONSE_CACHE_MAX_ENTRIES]
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return len(stale)
+
+
+def ai_maker(prompt, courses, courses_data=None, hedge_attempts=None, cache_ttl=None,
+             max_cost=None, constraints=None, preferences=""):
+    """Ask Gemini for a schedule, retrying until a valid one comes back.
+
+    With hedge_attempts > 1 each round launches that many attempts
+    concurrently (rotating through AI_HEDGE_MODELS and
+    AI_HEDGE_TEMPERATURES) and the first valid schedule wins. Rounds shrink
+    so the estimated spend stays under AI_HEDGE_MAX_COST. Losing attempts
+    that are already in flight can't be aborted; their replies are ignored
+    but their tokens are still billed to the global budget and telemetry
+    when they finish (see cost_info['attempts_in_flight']).
+
+    Validated schedules are cached on disk for cache_ttl seconds (default
+    CACHE_DURATION, matching the course data they were built from). Near
+    misses are repaired locally under the request's constraints and
+    preferences (see validate_ai_schedule).
+
+    Attempts stop early, with cost_info['status'] set to the reason, once the
+    projected spend would pass the request cap (max_cost, at most
+    AI_REQUEST_MAX_COST), the global daily budget, or while the upstream
+    circuit breaker is open. A half-open breaker gets a single trial call.
+    """
+    ai_start_time = time.time()
 
-                    # Normalize time format to ensure consistent spacing
-                    def normalize_time_format(time_str):
-                        """Ensure consistent spacing around dashes in time strings"""
-                        # Replace dash without spaces with dash with spaces
-                        time_str = time_str.replace('-', ' - ')
-                        # Clean up any double spaces
-                        time_str = ' '.join(time_str.split())
-                        return time_str
-
-                    # Convert time strings to minutes for easier comparison
-                    def time_to_minutes(time_str):
-                        # Normalize the time format first
-                        time_str = normalize_time_format(time_str)
-
-                        # Handle different time formats
-                        if ' ' in time_str:
-                            time, period = time_str.split()
-                        else:
-                            # If no space, find where the time ends and period begins
-                            for i, char in enumerate(time_str):
-                                if char.isalpha():
-                                    time = time_str[:i]
-                                    period = time_str[i:]
-                                    break
-                            else:
-                                # If no period found, assume 24-hour format
-                                time = time_str
-                                period = ''
-
-                        # Parse hours and minutes
-                        if ':' in time:
-                            hours, minutes = map(int, time.split(':'))
-                        else:
-                            hours = int(time)
-                            minutes = 0
-
-                        # Convert to 24-hour format
-                        if period:
-                            if period.upper() == 'PM' and hours != 12:
-                                hours += 12
-                            elif period.upper() == 'AM' and hours == 12:
-                                hours = 0
-
-                        return hours * 60 + minutes
-
-                    # Group classes by day
-                    classes_by_day = {}
-                    for cls in response_dict["classes"]:
-                        try:
-                            days = list(cls["days"])
-                            # Log the time string for debugging
-                            print(f"Processing time string: {cls['time']}")
-
-                            # Normalize and split time string
-                            normalized_time = normalize_time_format(
-                                cls["time"])
-                            time_parts = normalized_time.split(" - ")
-                            if len(time_parts) != 2:
-                                print(
-                                    f"Invalid time format: {cls['time']} (normalized: {normalized_time})")
-                                continue
-
-                            start_time, end_time = time_parts
+    # Use the model from environment variable
+    model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
 
-                            for day in days:
-                                if day not in classes_by_day:
-                                    classes_by_day[day] = []
-                                classes_by_day[day].append({
-                                    "start": time_to_minutes(start_time),
-                                    "end": time_to_minutes(end_time),
-                                    "crn": cls["crn"],
-                                    "course": cls["courseNumber"]
-                                })
-                        except Exception as e:
-                            save_log_entry(
-                                message=f"Error processing class {cls['courseNumber']}: {str(e)}")
-                            continue
-
-                    # Check for overlaps in each day
-                    has_overlap = False
-                    for day, classes in classes_by_day.items():
-                        # Sort classes by start time
-                        classes.sort(key=lambda x: x["start"])
-
-                        # Check each consecutive pair
-                        for i in range(len(classes) - 1):
-                            current = classes[i]
-                            next_class = classes[i + 1]
-
-                            # Check for overlap or insufficient gap
-                            if current["end"] > next_class["start"] or \
-                               (next_class["start"] - current["end"]) < 5:  # 5-minute gap requirement
-                                has_overlap = True
-                                print(
-                                    f"Overlap found on {day} between {current['course']} and {next_class['course']}")
-                                break
-
-                        if has_overlap:
-                            break
-
-                    if not has_overlap:
-                        # Normalize time formats in the response before returning
-                        for cls in response_dict["classes"]:
-                            if "time" in cls:
-                                cls["time"] = normalize_time_format(
-                                    cls["time"])
-                        ai_end_time = time.time()
-                        ai_total_time = ai_end_time - ai_start_time
-
-                        # Mark the successful attempt
-                        if model_usage:
-                            model_usage[-1]['success'] = True
-
-                        # Create comprehensive cost info with detailed breakdowns
-                        comprehensive_cost_info = {
-                            'input_cost': sum(usage['cost'] for usage in model_usage if usage['model'] == model_name),
-                            'output_cost': 0,  # Will be calculated from total
-                            'total_cost': cumulative_cost,
-                            'input_tokens': total_input_tokens,
-                            'output_tokens': total_output_tokens,
-                            'model_used': model_name,
-                            'cumulative_cost': cumulative_cost,
-                            'total_attempts': len(model_usage),
-                            'models_used': list(set(usage['model'] for usage in model_usage)),
-                            'model_usage_breakdown': model_usage,
-                            'model_cost_breakdown': _calculate_model_breakdown(model_usage),
-                            'total_cost_all_models': cumulative_cost
-                        }
+    # Fallback models if the primary one fails
+    fallback_models = ["gemini-2.5-pro", "gemini-2.5-flash-lite"]
+    current_model_index = 0
 
-                        print(
-                            f"AI generation successful after {ai_total_time:.2f} seconds and {total_tokens} tokens")
-                        print(
-                            f"Total cost: ${cumulative_cost:.4f} across {len(model_usage)} attempts using models: {comprehensive_cost_info['models_used']}")
-
-                        # Print detailed model breakdown
-                        model_breakdown = comprehensive_cost_info['model_cost_breakdown']
-                        print("\n" + "="*60)
-                        print("DETAILED MODEL BREAKDOWN:")
-                        print("="*60)
-
-                        for model, stats in model_breakdown.items():
-                            print(f"\n📊 {model.upper()}:")
-                            print(
-                                f"   • Total Attempts: {stats['total_attempts']}")
-                            print(
-                                f"   • Successful Attempts: {stats['successful_attempts']}")
-                            print(
-                                f"   • Success Rate: {stats['success_rate']}%")
-                            print(
-                                f"   • Total Tokens: {stats['total_tokens']:,}")
-                            print(
-                                f"   • Total Cost: ${stats['total_cost']:.4f}")
-                            print(
-                                f"   • Avg Tokens/Attempt: {stats['avg_tokens_per_attempt']:,}")
-                            print(
-                                f"   • Avg Cost/Attempt: ${stats['avg_cost_per_attempt']:.4f}")
+    # Serve identical prompts from the on-disk response cache
+    cache_ttl = CACHE_DURATION if cache_ttl is None else cache_ttl
+    cached = load_ai_response(
+        [model_name] + fallback_models + AI_HEDGE_MODELS, prompt, cache_ttl)
+    if cached is not None:
+        classes, _, _ = validate_ai_schedule(
+            {"classes": copy.deepcopy(cached['classes'])}, courses, courses_data,
+            constraints, preferences)
+        if classes is not None:
+            ai_response_cache_stats['hits'] += 1
+            ai_response_cache_stats['tokens_saved'] += cached['total_tokens']
+            ai_response_cache_stats['cost_saved'] += cached['total_cost']
+            print(
+                f"AI response cache hit ({cached['model']}), saved {cached['total_tokens']} tokens")
+            return {"classes": classes}, 0, {
+                'input_cost': 0.0,
+                'output_cost': 0.0,
+                'total_cost': 0.0,
+                'input_tokens': 0,
+                'output_tokens': 0,
+                'model_used': cached['model'],
+                'cumulative_cost': 0.0,
+                'total_attempts': 0,
+                'models_used': [cached['model']],
+                'model_usage_breakdown': [],
+                'model_cost_breakdown': {},
+                'total_cost_all_models': 0.0,
+                'repaired_locally': False,
+                'ai_cache_hit': True,
+                'tokens_saved': cached['total_tokens'],
+                'cost_saved': cached['total_cost'],
+                'ai_cache_stats': dict(ai_response_cache_stats)
+            }
+    ai_response_cache_stats['misses'] += 1
+
+    max_retries = 20  # Increased retries for complex course combinations
+    retry_count = 0
+    attempt_number = 0
+    total_input_tokens = 0
+    total_output_tokens = 0
+
+    # Track cumulative cost across all models and attempts
+    cumulative_cost = 0.0
+    model_usage = []  # Track usage per model
+
+    # Failures per model on this prompt, used by the router
+    candidate_models = list(dict.fromkeys([model_name] + fallback_models))
+    prompt_tokens = estimate_tokens(AI_SCHEDULER_INSTRUCTIONS + prompt)
+    model_failures = defaultdict(int)
+
+    hedge_attempts = min(max(1, int(hedge_attempts or AI_HEDGE_ATTEMPTS)), AI_HEDGE_POOL_SIZE)
+    pending = {}  # Submitted futures not yet consumed -> model
+    winner = None
+    gave_up = False
+    stop_reason = None
+    if max_cost is not None:
+        max_cost = min(float(max_cost), AI_REQUEST_MAX_COST)
+    # Follow-up prompt for the next attempt: (prompt, kept_classes, retry_courses)
+    retry_state = None
+    # True while this call holds the breaker's half-open trial
+    holding_trial = False
+
+    try:
+        while retry_count < max_retries and winner is None and not gave_up:
+            if AI_MODEL_ROUTING == "telemetry":
+                routed_model = route_model(
+                    candidate_models, prompt_tokens, model_failures)
+                if routed_model != model_name:
+                    print(f"Router switching to model: {routed_model}")
+                    model_name = routed_model
+
+            # Stop before an attempt the budgets won't allow
+            estimated_cost = calculate_gemini_cost(
+                prompt_tokens, AI_ESTIMATED_OUTPUT_TOKENS, model_name)['total_cost']
+            stop_reason = ai_budget_stop_reason(
+                cumulative_cost, total_input_tokens + total_output_tokens, estimated_cost,
+                prompt_tokens + AI_ESTIMATED_OUTPUT_TOKENS, max_cost)
+            if stop_reason:
+                print(f"Stopping AI attempts: {stop_reason}")
+                break
 
+            round_size = min(hedge_attempts, max_retries - retry_count)
+            if hedge_attempts > 1:
+                # Only launch what the remaining budget can pay for
+                hedge_cap = min(AI_HEDGE_MAX_COST, max_cost if max_cost is not None else AI_REQUEST_MAX_COST)
+                if estimated_cost > 0:
+                    affordable = int(
+                        (hedge_cap - cumulative_cost) / estimated_cost)
+                    if affordable < 1:
                         print(
-                            f"\n💰 TOTAL COST ACROSS ALL MODELS: ${cumulative_cost:.4f}")
-                        print("="*60)
+                            f"Hedged attempts stopped at the ${hedge_cap} cost cap")
+                        break
+                    round_size = min(round_size, affordable)
 
-                        return response_dict, total_tokens, comprehensive_cost_info
-                    else:
-                        print("Overlap detected, retrying...")
-                        retry_count += 1
-                        continue
+            # The breaker is checked last, right before anything is submitted
+            breaker = ai_breaker_acquire()
+            if breaker is None:
+                stop_reason = 'circuit_open'
+                print("Stopping AI attempts: circuit_open")
+                break
+            if breaker == 'trial':
+                holding_trial = True
+                round_size = 1
+
+            futures = {}
+            for slot in range(round_size):
+                attempt_number += 1
+                slot_model = model_name
+                temperature = None
+                if slot > 0:
+                    if AI_HEDGE_MODELS:
+                        slot_model = AI_HEDGE_MODELS[(slot - 1) % len(AI_HEDGE_MODELS)]
+                    if AI_HEDGE_TEMPERATURES:
+                        temperature = AI_HEDGE_TEMPERATURES[(slot - 1) % len(AI_HEDGE_TEMPERATURES)]
+                # The first slot follows up on the last failure with just the diff
+                slot_retry = retry_state if slot == 0 else None
+                print(
+                    f"AI Schedule Generation - Attempt {retry_count + slot + 1}/{max_retries} ({slot_model}{', follow-up' if slot_retry else ''})")
+                if slot_retry:
+                    future = ai_attempt_pool.submit(
+                        _ai_attempt, slot_model, slot_retry[0], temperature, AI_RETRY_INSTRUCTIONS)
                 else:
-                    return response_dict, total_tokens
-
-            except json.JSONDecodeError:
-                save_log_entry(message="Invalid JSON response, retrying...")
+                    future = ai_attempt_pool.submit(_ai_attempt, slot_model, prompt, temperature)
+                # Spend and breaker outcome are settled by the callback, whoever waits
+                future.add_done_callback(partial(_settle_ai_attempt, slot_model, holding_trial))
+                holding_trial = False
+                futures[future] = (slot_model, attempt_number, slot_retry)
+                pending[future] = slot_model
+            retry_state = None
+
+            api_failed = False
+            for future in as_completed(futures):
+                slot_model, number, slot_retry = futures[future]
+                del pending[future]
                 retry_count += 1
-                continue
-            except Exception as e:
-                save_log_entry(message=f"Error processing response: {str(e)}")
-                retry_count += 1
-                continue
+                attempt = {'input_tokens': 0, 'success': False, 'latency': None, 'cost': 0.0}
+                try:
+                    try:
+                        response_dict, input_tokens, output_tokens, latency = future.result()
+                    except Exception as e:
+                        save_log_entry(message=f"Error calling Gemini API: {str(e)}")
+                        api_failed = True
+                        continue
 
-        except Exception as e:
-            save_log_entry(message=f"Error calling Gemini API: {str(e)}")
-            retry_count += 1
+                    total_input_tokens += input_tokens
+                    total_output_tokens += output_tokens
+
+                    # Calculate cost for this attempt
+                    attempt_cost_info = calculate_gemini_cost(
+                        input_tokens, output_tokens, slot_model)
+                    cumulative_cost += attempt_cost_info['total_cost']
+                    attempt.update(input_tokens=input_tokens, latency=latency,
+                                   cost=attempt_cost_info['total_cost'])
+
+                    # Track model usage
+                    model_usage.append({
+                        'model': slot_model,
+                        'attempt': number,
+                        'input_tokens': input_tokens,
+                        'output_tokens': output_tokens,
+                        'cost': attempt_cost_info['total_cost'],
+                        'success': False  # Will be updated if successful
+                    })
 
-            # Try switching to a different model if we've had multiple failures
-            if retry_count > 10 and current_model_index < len(fallback_models):
-                current_model_index += 1
-                model_name = fallback_models[current_model_index - 1]
-                print(f"Switching to fallback model: {model_name}")
-                retry_count = 0  # Reset retry count for new model
+                    print(
+                        f"Token usage: {input_tokens} input + {output_tokens} output = {input_tokens + output_tokens} total tokens")
+                    print(
+                        f"Attempt cost: ${attempt_cost_info['total_cost']} | Cumulative cost: ${cumulative_cost:.4f}")
 
-            continue
+                    if response_dict is None:
+                        save_log_entry(message="Invalid JSON response, retrying...")
+                        continue
+                    if slot_retry and response_dict.get("classes"):
+                        # Merge the re-chosen courses back into the fixed ones
+                        retry_codes = {course['department'] + course['number']
+                                       for course in slot_retry[2]}
+                        response_dict["classes"] = slot_retry[1] + [
+                            cls for cls in response_dict["classes"]
+                            if cls.get("courseNumber", "").replace("-", "") in retry_codes]
+                    elif not response_dict.get("classes"):
+                        # The model reported that no valid schedule exists
+                        gave_up = not slot_retry
+                        continue
+
+                    try:
+                        classes, repaired, problems = validate_ai_schedule(
+                            response_dict, courses, courses_data, constraints, preferences)
+                    except Exception as e:
+                        save_log_entry(message=f"Error processing response: {str(e)}")
+                        continue
+                    if classes is None:
+                        print("Overlap detected, retrying...")
+                        if courses_data and retry_state is None:
+                            retry_state = build_ai_retry_prompt(
+                                response_dict["classes"], problems, courses, courses_data,
+                                preferences, constraints)
+                        continue
+
+                    response_dict["classes"] = classes
+                    model_usage[-1]['success'] = True
+                    model_usage[-1]['repaired'] = repaired
+                    attempt['success'] = True
+                    winner = (response_dict, slot_model)
+                    break
+                finally:
+                    record_model_attempt(slot_model, attempt['input_tokens'], attempt['success'],
+                                         attempt['latency'], attempt['cost'])
+                    if not attempt['success']:
+                        model_failures[slot_model] += 1
+
+            if AI_MODEL_ROUTING != "telemetry" and winner is None and not gave_up and api_failed:
+                # Try switching to a different model if we've had multiple failures
+                if retry_count > 10 and current_model_index < len(fallback_models):
+                    current_model_index += 1
+                    model_name = fallback_models[current_model_index - 1]
+                    print(f"Switching to fallback model: {model_name}")
+                    retry_count = 0  # Reset retry count for new model
+    finally:
+        if holding_trial:
+            ai_breaker_release_trial()
+        # Queued attempts are dropped; running ones are billed when they finish
+        for future, slot_model in pending.items():
+            if not future.cancel():
+                future.add_done_callback(partial(_record_abandoned_attempt, slot_model))
+    attempts_in_flight = sum(1 for future in pending if not future.done())
 
-    # If we've exhausted all retries
     ai_end_time = time.time()
     ai_total_time = ai_end_time - ai_start_time
+    total_tokens = total_input_tokens + total_output_tokens
+    if winner is not None:
+        response_dict, model_name = winner
 
-    # Create comprehensive cost info for failed attempts
+    # Create comprehensive cost info with detailed breakdowns
     comprehensive_cost_info = {
         'input_cost': sum(usage['cost'] for usage in model_usage if usage['model'] == model_name),
         'output_cost': 0,  # Will be calculated from total
@@ -852,40 +1675,155 @@ BEFORE RETURNING ANY SCHEDULE:
         'model_usage_breakdown': model_usage,
         'model_cost_breakdown': _calculate_model_breakdown(model_usage),
         'total_cost_all_models': cumulative_cost,
-        'status': 'failed'
+        'hedge_attempts': hedge_attempts,
+        'attempts_in_flight': attempts_in_flight
     }
 
+    if winner is not None:
+        comprehensive_cost_info['repaired_locally'] = model_usage[-1]['repaired'] if model_usage else False
+        comprehensive_cost_info['ai_cache_hit'] = False
+        comprehensive_cost_info['ai_cache_stats'] = dict(ai_response_cache_stats)
+        store_ai_response(model_name, prompt, response_dict["classes"],
+                          total_tokens, cumulative_cost)
+        print(
+            f"AI generation successful after {ai_total_time:.2f} seconds and {total_tokens} tokens")
+        print(
+            f"Total cost: ${cumulative_cost:.4f} across {len(model_usage)} attempts using models: {comprehensive_cost_info['models_used']}")
+        _print_model_breakdown(
+            comprehensive_cost_info['model_cost_breakdown'], cumulative_cost)
+        return response_dict, total_tokens, comprehensive_cost_info
+
+    # If we've exhausted all retries
+    comprehensive_cost_info['status'] = stop_reason or 'failed'
     print(
         f"AI generation failed after {ai_total_time:.2f} seconds and {total_tokens} tokens")
     print(
         f"Total cost: ${cumulative_cost:.4f} across {len(model_usage)} attempts using models: {comprehensive_cost_info['models_used']}")
+    _print_model_breakdown(
+        comprehensive_cost_info['model_cost_breakdown'], cumulative_cost, failed=True)
 
-    # Print detailed model breakdown for failed attempts
-    model_breakdown = comprehensive_cost_info['model_cost_breakdown']
-    print("\n" + "="*60)
-    print("DETAILED MODEL BREAKDOWN (FAILED):")
-    print("="*60)
+    return {"classes": []}, total_tokens, comprehensive_cost_info
 
-    for model, stats in model_breakdown.items():
-        print(f"\n📊 {model.upper()}:")
-        print(f"   • Total Attempts: {stats['total_attempts']}")
-        print(f"   • Successful Attempts: {stats['successful_attempts']}")
-        print(f"   • Success Rate: {stats['success_rate']}%")
-        print(f"   • Total Tokens: {stats['total_tokens']:,}")
-        print(f"   • Total Cost: ${stats['total_cost']:.4f}")
-        print(f"   • Avg Tokens/Attempt: {stats['avg_tokens_per_attempt']:,}")
-        print(f"   • Avg Cost/Attempt: ${stats['avg_cost_per_attempt']:.4f}")
 
-    print(f"\n💰 TOTAL COST ACROSS ALL MODELS: ${cumulative_cost:.4f}")
-    print("="*60)
+# Small model used to turn preferences into weights in hybrid mode
+HYBRID_MODEL = os.getenv("GEMINI_HYBRID_MODEL", "gemini-2.5-flash-lite")
+HYBRID_MAX_WEIGHT = 50
+
+
+def interpret_preferences(preferences):
+    """Turn free-text preferences into solver weights and hard constraints
+    with a single small Gemini call (hybrid mode).
+
+    Returns a dict with weights, constraints (raw, for
+    parse_schedule_constraints), tokens_used and cost_info. Falls back to the
+    keyword weights and no constraints if the call fails.
+    """
+    weights = _preference_weights(preferences)
+    result = {
+        'weights': weights,
+        'constraints': {},
+        'tokens_used': 0,
+        'cost_info': calculate_gemini_cost(0, 0, HYBRID_MODEL)
+    }
+    if not (preferences or "").strip():
+        return result
+    stop_reason = ai_budget_stop_reason(
+        0.0, 0, calculate_gemini_cost(1000, 500, HYBRID_MODEL)['total_cost'], 1500)
+    breaker = ai_breaker_acquire() if stop_reason is None else None
+    if stop_reason is None and breaker is None:
+        stop_reason = 'circuit_open'
+    if stop_reason:
+        print(f"Skipping preference interpretation: {stop_reason}")
+        return result
+    trial = breaker == 'trial'
+
+    weight_descriptions = "\n".join(
+        f"- {key}: {SCORER_WEIGHT_DESCRIPTIONS[key]}" for key in weights)
+    response = None
+    try:
+        response = get_gemini_model(HYBRID_MODEL).generate_content(
+            f"""Convert a student's timetable preferences into scoring weights and hard constraints for a schedule solver.
+
+Weights (0-{HYBRID_MAX_WEIGHT}, 0 means the user does not care):
+{weight_descriptions}
+
+Constraints are only for things the user says they cannot do. Days use M T W R F,
+times use 12-hour format like 9:30AM. Leave out anything not mentioned.
+
+Preferences:
+{preferences}""",
+            generation_config=get_generation_config("preferences")
+        )
+        record_upstream_result(True, trial=trial)
+        parsed = json.loads(response.text)
+
+        for key, value in (parsed.get("weights") or {}).items():
+            if key in weights:
+                weights[key] = int(min(max(round(float(value)), 0), HYBRID_MAX_WEIGHT))
+        result['constraints'] = parsed.get("constraints") or {}
+
+        if response.usage_metadata:
+            input_tokens = getattr(
+                response.usage_metadata, 'prompt_token_count', 0)
+            output_tokens = getattr(
+                response.usage_metadata, 'candidates_token_count', 0)
+            result['tokens_used'] = response.usage_metadata.total_token_count
+            result['cost_info'] = calculate_gemini_cost(
+                input_tokens, output_tokens, HYBRID_MODEL)
+            record_ai_spend(result['cost_info']['total_cost'])
+        print(f"Interpreted preferences: {weights} | constraints: {result['constraints']}")
+    except Exception as e:
+        if response is None:
+            record_upstream_result(False, trial=trial)
+        save_log_entry(message=f"Error interpreting preferences: {str(e)}")
+    return result
+
+
+def merge_schedule_constraints(base, extra):
+    """Combine two parsed constraint dicts, keeping the stricter limits"""
+    def stricter(a, b, pick):
+        return b if a is None else a if b is None else pick(a, b)
+
+    return {
+        'blocked_windows': base['blocked_windows'] + extra['blocked_windows'],
+        'days_off': base['days_off'] | extra['days_off'],
+        'max_classes_per_day': stricter(
+            base['max_classes_per_day'], extra['max_classes_per_day'], min),
+        'earliest_start': stricter(base['earliest_start'], extra['earliest_start'], max),
+        'latest_end': stricter(base['latest_end'], extra['latest_end'], min)
+    }
 
-    return {"classes": []}, total_tokens, comprehensive_cost_info
+
+# Worker processes for the exact (backtracking) search; 1 keeps the search
+# in-process and keeps large schedules on the GA
+EXACT_SEARCH_WORKERS = int(os.getenv("EXACT_SEARCH_WORKERS", "1"))
+# Searches smaller than this stay single-process
+PARALLEL_SEARCH_MIN_COMBINATIONS = 20_000
+# Largest search space routed to exact search instead of the GA when
+# EXACT_SEARCH_WORKERS > 1, independent of the host's core count
+EXACT_SEARCH_MAX_COMBINATIONS = int(os.getenv("EXACT_SEARCH_MAX_COMBINATIONS", "200000"))
+
+# Process pool shared by the parallel exact search and GA islands, created on
+# first use so requests don't pay process start-up
+SOLVER_PROCESS_WORKERS = int(os.getenv("SOLVER_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+_solver_pool = None
+_solver_pool_lock = threading.Lock()
+
+
+def get_solver_pool():
+    """The shared solver ProcessPoolExecutor, rebuilt if a worker died"""
+    global _solver_pool
+    with _solver_pool_lock:
+        if _solver_pool is None or getattr(_solver_pool, '_broken', False):
+            _solver_pool = ProcessPoolExecutor(max_workers=SOLVER_PROCESS_WORKERS)
+        return _solver_pool
 
 
 class SmartScheduleOptimizer:
-    def __init__(self):
+    def __init__(self, search_workers=EXACT_SEARCH_WORKERS):
         self.time_slots = self._generate_time_slots()
         self.day_mapping = {'M': 0, 'T': 1, 'W': 2, 'R': 3, 'F': 4}
+        self.search_workers = search_workers
 
     def _generate_time_slots(self):
         """Generate time slots from 7 AM to 10 PM in 15-minute intervals"""
@@ -1087,46 +2025,6 @@ class SmartScheduleOptimizer:
 
         return False
 
-    def _build_conflict_graph(self, sections):
-        """Build a graph where nodes are sections and edges represent conflicts"""
-        conflict_graph = defaultdict(set)
-
-        for i, section1 in enumerate(sections):
-            for j, section2 in enumerate(sections[i+1:], i+1):
-                if self._check_conflicts(section1, section2):
-                    conflict_graph[i].add(j)
-                    conflict_graph[j].add(i)
-
-        return conflict_graph
-
-    def _find_independent_sets(self, sections, conflict_graph):
-        """Find sets of non-conflicting sections using graph coloring"""
-        # Simple greedy coloring algorithm
-        colors = {}
-        available_colors = set()
-
-        for node in range(len(sections)):
-            # Find used colors in neighbors
-            used_colors = set()
-            for neighbor in conflict_graph[node]:
-                if neighbor in colors:
-                    used_colors.add(colors[neighbor])
-
-            # Find first available color
-            color = 0
-            while color in used_colors:
-                color += 1
-
-            colors[node] = color
-            available_colors.add(color)
-
-        # Group sections by color (each color represents a non-conflicting set)
-        color_groups = defaultdict(list)
-        for node, color in colors.items():
-            color_groups[color].append(sections[node])
-
-        return list(color_groups.values())
-
     def _calculate_schedule_score(self, schedule, preferences=""):
         """Calculate a score for a schedule based on preferences"""
         score = 0
@@ -1193,45 +2091,48 @@ class SmartScheduleOptimizer:
 
         return score
 
-    def _generate_optimal_schedules(self, course_sections, preferences=""):
-        """Generate optimal schedules using constraint satisfaction"""
-        all_sections = []
-        course_to_sections = defaultdict(list)
-
-        # Parse all sections
-        for course_code, sections in course_sections.items():
-            parsed_sections = self._parse_section_times(sections)
-            course_to_sections[course_code] = parsed_sections
-            all_sections.extend(parsed_sections)
-
-        # Build conflict graph
-        conflict_graph = self._build_conflict_graph(all_sections)
-
-        # Find independent sets (non-conflicting section groups)
-        independent_sets = self._find_independent_sets(
-            all_sections, conflict_graph)
-
-        # Generate valid combinations
-        valid_schedules = []
-
-        # For each course, we need exactly one section
-        required_courses = list(course_sections.keys())
-
-        def backtrack(selected_sections, course_index):
+    def _within_daily_limit(self, schedule, max_classes_per_day):
+        """Check the hard limit on classes meeting on any one day"""
+        if not max_classes_per_day:
+            return True
+        classes_per_day = defaultdict(int)
+        for section in schedule:
+            for day in section['days']:
+                classes_per_day[day] += 1
+        return all(count <= max_classes_per_day for count in classes_per_day.values())
+
+    def _search_top_k(self, course_to_sections, required_courses, preferences="",
+                      prefix=(), top_k=10, partition_index=0, max_classes_per_day=None):
+        """Backtrack over all schedules extending a fixed prefix of section
+        choices, keeping only the top_k in a bounded heap"""
+        heap = []
+        counter = itertools.count()
+        selected_indices = list(prefix)
+        selected_sections = [course_to_sections[required_courses[i]][idx]
+                             for i, idx in enumerate(prefix)]
+
+        def backtrack(course_index):
             if course_index >= len(required_courses):
                 # We have a complete schedule
                 if len(selected_sections) == len(required_courses):
                     # Validate that all required components are included
-                    if self._validate_schedule_completeness(selected_sections, course_to_sections):
+                    if (self._validate_schedule_completeness(selected_sections, course_to_sections) and
+                            self._within_daily_limit(selected_sections, max_classes_per_day)):
                         score = self._calculate_schedule_score(
                             selected_sections, preferences)
-                        valid_schedules.append((score, selected_sections))
+                        # Ties keep enumeration order, matching a serial search
+                        entry = (score, -partition_index, -next(counter),
+                                 tuple(selected_indices))
+                        if len(heap) < top_k:
+                            heapq.heappush(heap, entry)
+                        else:
+                            heapq.heappushpop(heap, entry)
                 return
 
             course_code = required_courses[course_index]
             available_sections = course_to_sections[course_code]
 
-            for section in available_sections:
+            for idx, section in enumerate(available_sections):
                 # Check if this section conflicts with already selected sections
                 conflicts = False
                 for selected in selected_sections:
@@ -1241,16 +2142,74 @@ class SmartScheduleOptimizer:
 
                 if not conflicts:
                     selected_sections.append(section)
-                    backtrack(selected_sections, course_index + 1)
+                    selected_indices.append(idx)
+                    backtrack(course_index + 1)
+                    selected_indices.pop()
                     selected_sections.pop()
 
-        # Start backtracking
-        backtrack([], 0)
+        backtrack(len(prefix))
+        return heap
+
+    def _partition_prefixes(self, course_to_sections, required_courses, min_partitions):
+        """Split the search tree into conflict-free prefixes of the first few
+        course choices, in the same order a serial search would visit them"""
+        prefixes = [()]
+        depth = 0
+        while len(prefixes) < min_partitions and depth < len(required_courses) - 1:
+            sections = course_to_sections[required_courses[depth]]
+            expanded = []
+            for prefix in prefixes:
+                chosen = [course_to_sections[required_courses[i]][idx]
+                          for i, idx in enumerate(prefix)]
+                for idx, section in enumerate(sections):
+                    if not any(self._check_conflicts(section, other) for other in chosen):
+                        expanded.append(prefix + (idx,))
+            prefixes = expanded
+            depth += 1
+        return prefixes
+
+    def _generate_optimal_schedules(self, course_sections, preferences="", top_k=10,
+                                    max_classes_per_day=None):
+        """Generate optimal schedules using constraint satisfaction"""
+        course_to_sections = defaultdict(list)
 
-        # Sort by score and return top schedules
-        valid_schedules.sort(key=lambda x: x[0], reverse=True)
+        # Parse all sections
+        for course_code, sections in course_sections.items():
+            course_to_sections[course_code] = self._parse_section_times(sections)
+
+        # For each course, we need exactly one section
+        required_courses = list(course_sections.keys())
+        if not required_courses:
+            return []
+
+        combinations = 1
+        for course_code in required_courses:
+            combinations *= len(course_to_sections[course_code])
 
-        return valid_schedules[:10]  # Return top 10 schedules
+        if self.search_workers > 1 and combinations >= PARALLEL_SEARCH_MIN_COMBINATIONS:
+            # Solve independent subtrees in parallel and merge their heaps
+            prefixes = self._partition_prefixes(
+                course_to_sections, required_courses, self.search_workers * 4)
+            print(
+                f"Exact search split into {len(prefixes)} partitions across {self.search_workers} workers")
+            context = (self, dict(course_to_sections), required_courses,
+                       preferences, top_k, max_classes_per_day)
+            # Chunking keeps the context pickled about once per worker
+            chunksize = max(1, len(prefixes) // self.search_workers)
+            heaps = get_solver_pool().map(
+                _solve_exact_partition,
+                [(context, partition_index, prefix) for partition_index, prefix in enumerate(prefixes)],
+                chunksize=chunksize)
+            entries = [entry for heap in heaps for entry in heap]
+        else:
+            entries = self._search_top_k(
+                course_to_sections, required_courses, preferences, top_k=top_k,
+                max_classes_per_day=max_classes_per_day)
+
+        # Sort by score and return top schedules
+        return [(score, [course_to_sections[required_courses[i]][idx]
+                         for i, idx in enumerate(indices)])
+                for score, _, _, indices in heapq.nlargest(top_k, entries)]
 
     def _validate_schedule_completeness(self, selected_sections, course_to_sections):
         """Validate that all required components (lecture + lab) are included"""
@@ -1277,7 +2236,15 @@ class SmartScheduleOptimizer:
 
         return True
 
-    def optimize_schedule(self, courses_data, preferences=""):
+    def count_combinations(self, courses_data):
+        """Size of the exact search space: the product of the parsed section
+        blocks per course, which is what the backtracking enumerates"""
+        combinations = 1
+        for sections_df in courses_data.values():
+            combinations *= len(self._parse_section_times(sections_df))
+        return combinations
+
+    def optimize_schedule(self, courses_data, preferences="", constraints=None):
         """Main optimization method"""
         start_time = time.time()
 
@@ -1288,7 +2255,8 @@ class SmartScheduleOptimizer:
 
         # Generate optimal schedules
         optimal_schedules = self._generate_optimal_schedules(
-            course_sections, preferences)
+            course_sections, preferences,
+            max_classes_per_day=(constraints or {}).get('max_classes_per_day'))
 
         if not optimal_schedules:
             return {"classes": []}, 0
@@ -1353,6 +2321,16 @@ class SmartScheduleOptimizer:
         return ai_classes
 
 
+def _solve_exact_partition(task):
+    """Solve one prefix subtree of the exact search, returning its top-k heap"""
+    context, partition_index, prefix = task
+    optimizer, course_to_sections, required_courses, preferences, top_k, max_classes_per_day = context
+    return optimizer._search_top_k(
+        course_to_sections, required_courses, preferences,
+        prefix=prefix, top_k=top_k, partition_index=partition_index,
+        max_classes_per_day=max_classes_per_day)
+
+
 # Initialize the smart optimizer
 smart_optimizer = SmartScheduleOptimizer()
 
@@ -1360,14 +2338,376 @@ smart_optimizer = SmartScheduleOptimizer()
 course_cache = {}
 CACHE_DURATION = 3600  # 1 hour cache
 
+# Open-section fetches carry seat counts, which go stale much faster
+seat_cache = {}
+SEAT_CACHE_DURATION = 300  # 5 minute cache
+
+# Solve sessions for incremental re-solves while a user edits their request
+solve_sessions = OrderedDict()  # (session_id, term_year) -> session, least recently used first
+SESSION_DURATION = 1800  # 30 minute idle timeout
+SESSION_MAX_ENTRIES = 256
+_session_lock = threading.Lock()
+
+# Finished responses keyed on a canonical fingerprint of the request
+schedule_result_cache = OrderedDict()
+RESULT_CACHE_DURATION = 900  # 15 minute cache
+RESULT_CACHE_MAX_ENTRIES = 512
+result_cache_stats = {'hits': 0, 'misses': 0}
+
+# Latest data fingerprint per course cache key
+course_fingerprints = {}
+
+# Per-term CRN index over every section fetched from the timetable, with
+# meeting times compiled to (day, start, end) intervals
+section_index = defaultdict(dict)  # term_year -> {crn: section}
+section_index_courses = defaultdict(dict)  # term_year -> {course_code: [crns]}
+section_index_versions = defaultdict(int)  # Bumped on every change to a term's index
+# Per-term, per-day meeting arrays sorted by start, rebuilt lazily when the
+# term's index version changes: term_year -> (version, {day: (starts, meetings, longest)})
+section_day_index = {}
+# CRNs the timetable had no section for: (term_year, crn) -> timestamp
+missing_crn_cache = {}
+CHECK_CRNS_MAX_CRNS = 40  # CRNs accepted per check or free-slot request
+CRN_FETCH_MAX_PER_REQUEST = 5  # Timetable lookups one request may trigger
+_section_index_lock = threading.Lock()
+
+# Packed section-by-section conflict tables shared across requests, keyed on
+# the fingerprints of both courses' compiled meeting times
+conflict_tile_cache = OrderedDict()
+CONFLICT_TILE_CACHE_MAX_ENTRIES = 4096
+
+
+# Thresholds BatchScheduleScorer scores against; the hybrid-mode prompt
+# describes the weights from these so the two cannot drift apart
+MORNING_START_HOUR = 7
+AFTERNOON_START_HOUR = 12
+EVENING_START_HOUR = 17
+LUNCH_GAP_MINUTES = (30, 120)
+REASONABLE_GAP_MINUTES = (15, 60)
+CLOSE_TOGETHER_MAX_GAP_MINUTES = 30
+
+
+def _format_hour(hour):
+    return f"{(hour - 1) % 12 + 1}{'AM' if hour < 12 else 'PM'}"
+
+
+SCORER_WEIGHT_DESCRIPTIONS = {
+    'morning': f"bonus per class meeting starting {_format_hour(MORNING_START_HOUR)}-"
+               f"{_format_hour(AFTERNOON_START_HOUR)}",
+    'afternoon': f"bonus per class meeting starting {_format_hour(AFTERNOON_START_HOUR)}-"
+                 f"{_format_hour(EVENING_START_HOUR)}",
+    'evening': f"bonus per class meeting starting {_format_hour(EVENING_START_HOUR)} or "
+               f"later (or before {_format_hour(MORNING_START_HOUR)})",
+    'before_10_penalty': "penalty per morning class meeting, for users who want "
+                         "late starts",
+    'lunch_break': f"bonus when the week's total gap time is "
+                   f"{LUNCH_GAP_MINUTES[0]}-{LUNCH_GAP_MINUTES[1]} minutes",
+    'close_together': f"bonus per day with classes, less one when the week's total "
+                      f"gap time is over {CLOSE_TOGETHER_MAX_GAP_MINUTES} minutes",
+    'reasonable_gaps': f"bonus when the week's total gap time is "
+                       f"{REASONABLE_GAP_MINUTES[0]}-{REASONABLE_GAP_MINUTES[1]} minutes",
+    'professor': "bonus per class taught by a professor named in the preferences "
+                 "(default 20)"
+}
+
+
+def _preference_weights(preferences=""):
+    """Translate free-text preferences into the weights used for fitness scoring"""
+    prefs = (preferences or "").lower()
+    close_together = "close together" in prefs
+    return {
+        'morning': 15 if "morning" in prefs else 0,
+        'afternoon': 15 if "afternoon" in prefs else 0,
+        'evening': 15 if "evening" in prefs else 0,
+        'before_10_penalty': 25 if "no classes before 10" in prefs else 0,
+        'lunch_break': 10 if "lunch break" in prefs else 0,
+        'close_together': 5 if close_together else 0,
+        'reasonable_gaps': 0 if close_together else 3,
+        'professor': 20
+    }
+
+
+PREFERENCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "weights": {
+            "type": "object",
+            "properties": {key: {"type": "number"} for key in _preference_weights()}
+        },
+        "constraints": {
+            "type": "object",
+            "properties": {
+                "days_off": {"type": "string"},
+                "earliest_start": {"type": "string"},
+                "latest_end": {"type": "string"},
+                "max_classes_per_day": {"type": "integer"},
+                "blocked_windows": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "days": {"type": "string"},
+                            "start": {"type": "string"},
+                            "end": {"type": "string"}
+                        },
+                        "required": ["days", "start", "end"]
+                    }
+                }
+            }
+        }
+    },
+    "required": ["weights", "constraints"]
+}
+
+GEMINI_SCHEMAS = {
+    'schedule': AI_SCHEDULE_SCHEMA,
+    'preferences': PREFERENCE_SCHEMA
+}
+
+
+class BatchScheduleScorer:
+    """Vectorized scoring of many candidate schedules at once.
+
+    A candidate is a row of section indices, one column per course, where
+    column j indexes into course_to_sections[course_codes[j]]. Scoring a
+    (n_candidates, n_courses) matrix gives the same result as scoring each
+    decoded schedule one at a time (see the reference in tests/test_scorer.py).
+    """
+
+    NUM_DAYS = 5
+    GAP_BUFFER = 5  # Minutes required between consecutive classes
+
+    def __init__(self, course_to_sections, preferences="", weights=None,
+                 max_classes_per_day=None):
+        self.course_codes = [code for code, sections in course_to_sections.items()
+                             if sections]
+        self.options = [course_to_sections[code] for code in self.course_codes]
+        self.n_courses = len(self.course_codes)
+        self.option_counts = np.array([len(opts) for opts in self.options],
+                                      dtype=np.int64)
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(self.option_counts)[:-1]]).astype(np.int64)
+        self.weights = weights if weights is not None else _preference_weights(
+            preferences)
+        self.max_classes_per_day = max_classes_per_day
+
+        flat = [section for opts in self.options for section in opts]
+        self.start = np.array([s['start_minutes'] for s in flat], dtype=np.int64)
+        self.end = np.array([s['end_minutes'] for s in flat], dtype=np.int64)
+        self.is_online = np.array([s.get('is_online', False) for s in flat],
+                                  dtype=bool)
+
+        # Meeting days per option; online sections never clash with anything
+        self.meets = np.zeros((len(flat), self.NUM_DAYS), dtype=bool)
+        for i, section in enumerate(flat):
+            for day in section['days']:
+                self.meets[i, day] = True
+        self.conflict_meets = self.meets & ~self.is_online[:, None]
+
+        start_hour = self.start // 60
+        day_count = self.meets.sum(axis=1)
+        is_morning = ((start_hour >= MORNING_START_HOUR) &
+                      (start_hour < AFTERNOON_START_HOUR))
+        is_afternoon = ((start_hour >= AFTERNOON_START_HOUR) &
+                        (start_hour < EVENING_START_HOUR))
+        self.morning = np.where(is_morning, day_count, 0)
+        self.afternoon = np.where(is_afternoon, day_count, 0)
+        self.evening = np.where(~is_morning & ~is_afternoon, day_count, 0)
+
+        prefs = (preferences or "").lower()
+        self.professor_bonus = np.array(
+            [self.weights['professor'] if s['instructor'].lower() in prefs else 0
+             for s in flat], dtype=np.int64)
+
+        # Conflict tables come from the cross-request tile cache where possible
+        self.course_fingerprints = [self._course_fingerprint(i)
+                                    for i in range(self.n_courses)]
+        self.tiles_cached = 0
+        self.tiles_computed = 0
+        self.pair_conflicts = {}
+        for i in range(self.n_courses):
+            for j in range(i + 1, self.n_courses):
+                self.pair_conflicts[(i, j)] = self._cached_conflict_table(i, j)
+
+    def _course_fingerprint(self, course_index):
+        """Hash of the compiled meeting times that decide a course's conflicts"""
+        options = self._course_slice(course_index)
+        digest = hashlib.sha1()
+        for values in (self.start[options], self.end[options],
+                       self.conflict_meets[options]):
+            digest.update(values.tobytes())
+        return digest.hexdigest()
+
+    def _cached_conflict_table(self, i, j):
+        key = (self.course_fingerprints[i], self.course_fingerprints[j])
+        for tile_key, transpose in ((key, False), (key[::-1], True)):
+            tile = conflict_tile_cache.get(tile_key)
+            if tile is not None:
+                conflict_tile_cache.move_to_end(tile_key)
+                self.tiles_cached += 1
+                packed, shape = tile
+                table = np.unpackbits(
+                    packed, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+                return table.T if transpose else table
+
+        table = self._conflict_table(i, j)
+        self.tiles_computed += 1
+        conflict_tile_cache[key] = (np.packbits(table, axis=None), table.shape)
+        while len(conflict_tile_cache) > CONFLICT_TILE_CACHE_MAX_ENTRIES:
+            conflict_tile_cache.popitem(last=False)
+        return table
+
+    def _course_slice(self, course_index):
+        start = self.offsets[course_index]
+        return slice(start, start + self.option_counts[course_index])
+
+    def _conflict_table(self, i, j):
+        """Boolean matrix of which options of course i clash with options of course j"""
+        a, b = self._course_slice(i), self._course_slice(j)
+        shared_day = (self.conflict_meets[a][:, None, :] &
+                      self.conflict_meets[b][None, :, :]).any(axis=2)
+        overlap = ((self.start[a][:, None] < self.end[b][None, :] + self.GAP_BUFFER) &
+                   (self.start[b][None, :] < self.end[a][:, None] + self.GAP_BUFFER))
+        return shared_day & overlap
+
+    def conflict_table(self, i, j):
+        """Conflict matrix with options of course i as rows and course j as columns"""
+        if i < j:
+            return self.pair_conflicts[(i, j)]
+        return self.pair_conflicts[(j, i)].T
+
+    def option_clash_counts(self, candidate, course_index, placed=None):
+        """For each option of course_index, count clashes with the other genes"""
+        others = range(self.n_courses) if placed is None else placed
+        clashes = np.zeros(self.option_counts[course_index], dtype=np.int64)
+        for j in others:
+            if j != course_index:
+                clashes += self.conflict_table(course_index, j)[:, candidate[j]]
+        return clashes
+
+    def gene_conflicts(self, candidate):
+        """Number of other genes each gene of a single candidate clashes with"""
+        counts = np.zeros(self.n_courses, dtype=np.int64)
+        for (i, j), table in self.pair_conflicts.items():
+            if table[candidate[i], candidate[j]]:
+                counts[i] += 1
+                counts[j] += 1
+        return counts
+
+    def random_candidates(self, n, rng=None):
+        """Draw n uniformly random candidates"""
+        rng = rng if rng is not None else np.random.default_rng()
+        return rng.integers(0, self.option_counts,
+                            size=(n, self.n_courses), dtype=np.int32)
+
+    def decode(self, candidate):
+        """Convert a row of section indices back into section dicts"""
+        return [self.options[j][int(idx)] for j, idx in enumerate(candidate)]
+
+    def validity(self, candidates):
+        """Boolean array marking candidates with no pairwise conflicts
+        and no day over the max_classes_per_day limit"""
+        candidates = np.asarray(candidates)
+        valid = np.ones(len(candidates), dtype=bool)
+        for (i, j), table in self.pair_conflicts.items():
+            valid &= ~table[candidates[:, i], candidates[:, j]]
+        if self.max_classes_per_day:
+            classes_per_day = self.meets[candidates + self.offsets[None, :]].sum(axis=1)
+            valid &= (classes_per_day <= self.max_classes_per_day).all(axis=1)
+        return valid
+
+    def score(self, candidates):
+        """Score a candidate matrix, returning a dict of per-candidate arrays"""
+        candidates = np.asarray(candidates).reshape(-1, self.n_courses)
+        n = len(candidates)
+        flat_idx = candidates + self.offsets[None, :]
+        valid = self.validity(candidates)
+
+        starts = self.start[flat_idx]
+        ends = self.end[flat_idx]
+        meets = self.meets[flat_idx]  # (n, courses, days)
+
+        # Sort each day's classes by start time and walk consecutive gaps
+        sentinel = np.iinfo(np.int64).max
+        day_starts = np.where(meets, starts[:, :, None], sentinel)
+        order = np.argsort(day_starts, axis=1, kind='stable')
+        sorted_starts = np.take_along_axis(day_starts, order, axis=1)
+        sorted_ends = np.take_along_axis(
+            np.broadcast_to(ends[:, :, None], meets.shape), order, axis=1)
+        present = sorted_starts != sentinel
+        gap_present = present[:, 1:, :] & present[:, :-1, :]
+        gaps = np.where(gap_present,
+                        sorted_starts[:, 1:, :] - sorted_ends[:, :-1, :], 0)
+
+        total_gap = gaps.sum(axis=(1, 2))
+        gap_count = gap_present.sum(axis=(1, 2))
+        max_gap = gaps.max(axis=(1, 2), initial=0) if gaps.size else np.zeros(
+            n, dtype=np.int64)
+        days_used = meets.any(axis=1).sum(axis=1)
+
+        morning = self.morning[flat_idx].sum(axis=1)
+        afternoon = self.afternoon[flat_idx].sum(axis=1)
+        evening = self.evening[flat_idx].sum(axis=1)
+
+        w = self.weights
+        score = np.full(n, 1000, dtype=np.int64)
+        score += (morning * w['morning'] + afternoon * w['afternoon'] +
+                  evening * w['evening'] - morning * w['before_10_penalty'])
+        score += np.where((total_gap >= LUNCH_GAP_MINUTES[0]) &
+                          (total_gap <= LUNCH_GAP_MINUTES[1]),
+                          w['lunch_break'], 0)
+        score += ((days_used - (total_gap > CLOSE_TOGETHER_MAX_GAP_MINUTES)) *
+                  w['close_together'])
+        score += np.where((total_gap >= REASONABLE_GAP_MINUTES[0]) &
+                          (total_gap <= REASONABLE_GAP_MINUTES[1]),
+                          w['reasonable_gaps'], 0)
+        score += self.professor_bonus[flat_idx].sum(axis=1)
+        score = np.where(valid, score, 0)
+
+        return {
+            'valid': valid,
+            'score': score,
+            'total_gap': total_gap,
+            'max_gap': max_gap,
+            'gap_count': gap_count,
+            'days_used': days_used,
+            'morning_classes': morning,
+            'afternoon_classes': afternoon,
+            'evening_classes': evening
+        }
+
+    def top_k(self, candidates, k):
+        """Return (indices, scores) of the k best candidates, best first"""
+        scores = self.score(candidates)['score']
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=np.int64), scores[:0]
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return best, scores[best]
+
 
 class GeneticScheduleOptimizer:
     """Advanced genetic algorithm for schedule optimization"""
 
-    def __init__(self, population_size=50, generations=100, mutation_rate=0.1):
+    def __init__(self, population_size=50, generations=100, mutation_rate=0.1, seed=None,
+                 patience=25, min_diversity=0.05, cache_size=20000,
+                 seed_fraction=0.5, repair=True, islands=1, migration_interval=10,
+                 migrants=2, island_min_sections=60, incremental_patience=10):
         self.population_size = population_size
         self.generations = generations
         self.mutation_rate = mutation_rate
+        self.seed = seed
+        self.patience = patience  # Generations without improvement before stopping
+        self.min_diversity = min_diversity  # Minimum fraction of unique genomes
+        self.cache_size = cache_size  # Maximum number of memoized fitness values
+        self.seed_fraction = seed_fraction  # Share of population built greedily
+        self.repair = repair  # Repair conflicting individuals before scoring
+        self.islands = islands  # Sub-populations evolved in parallel processes
+        self.migration_interval = migration_interval  # Generations between migrations
+        self.migrants = migrants  # Individuals sent to the next island per migration
+        self.island_min_sections = island_min_sections  # Smaller inputs run in-process
+        self.incremental_patience = incremental_patience  # Patience when seeded from a session
         self.day_mapping = {'M': 0, 'T': 1, 'W': 2, 'R': 3, 'F': 4}
 
     def _time_to_minutes(self, time_str):
@@ -1546,198 +2886,383 @@ class GeneticScheduleOptimizer:
 
         return course_to_sections, all_sections
 
-    def _check_conflicts(self, section1, section2):
-        """Check if two sections conflict"""
-        # Online classes don't conflict with in-person classes
-        if section1.get('is_online', False) or section2.get('is_online', False):
-            return False
-
-        day_overlap = set(section1['days']) & set(section2['days'])
-        if not day_overlap:
-            return False
-
-        for day in day_overlap:
-            if (section1['start_minutes'] < section2['end_minutes'] + 5 and
-                    section2['start_minutes'] < section1['end_minutes'] + 5):
-                return True
-
-        return False
-
-    def _is_valid_schedule(self, schedule):
-        """Check if a schedule is valid (no conflicts)"""
-        for i, section1 in enumerate(schedule):
-            for section2 in schedule[i+1:]:
-                if self._check_conflicts(section1, section2):
-                    return False
-        return True
-
-    def _calculate_fitness(self, schedule, preferences=""):
-        """Calculate fitness score for a schedule"""
-        if not self._is_valid_schedule(schedule):
-            return 0
-
-        score = 1000  # Base score for valid schedule
-
-        # Time distribution analysis
-        daily_schedules = defaultdict(list)
-        for section in schedule:
-            for day in section['days']:
-                daily_schedules[day].append(section)
-
-        total_gaps = 0
-        morning_classes = 0
-        afternoon_classes = 0
-        evening_classes = 0
-
-        for day, day_classes in daily_schedules.items():
-            day_classes.sort(key=lambda x: x['start_minutes'])
-
-            # Count time periods
-            for section in day_classes:
-                start_hour = section['start_minutes'] // 60
-                if 7 <= start_hour < 12:
-                    morning_classes += 1
-                elif 12 <= start_hour < 17:
-                    afternoon_classes += 1
-                else:
-                    evening_classes += 1
-
-            # Calculate gaps
-            for i in range(len(day_classes) - 1):
-                gap = day_classes[i+1]['start_minutes'] - \
-                    day_classes[i]['end_minutes']
-                total_gaps += gap
-
-        # Preference scoring
-        if "morning" in preferences.lower():
-            score += morning_classes * 15
-        if "afternoon" in preferences.lower():
-            score += afternoon_classes * 15
-        if "evening" in preferences.lower():
-            score += evening_classes * 15
-        if "no classes before 10" in preferences.lower():
-            score -= morning_classes * 25
-
-        # Gap preferences
-        if "lunch break" in preferences.lower():
-            lunch_gaps = sum(1 for gap in [total_gaps] if 30 <= gap <= 120)
-            score += lunch_gaps * 10
-
-        if "close together" in preferences.lower():
-            score += (len(daily_schedules) -
-                      len([g for g in [total_gaps] if g > 30])) * 5
-        else:
-            score += len([g for g in [total_gaps] if 15 <= g <= 60]) * 3
-
-        # Professor preference bonus
-        for section in schedule:
-            if section['instructor'].lower() in preferences.lower():
-                score += 20
+    def _greedy_individual(self, scorer, rng, fixed=None):
+        """Build an individual by placing the most constrained courses first,
+        picking a random section among those with the fewest clashes.
+        `fixed` maps course index -> section index for genes to keep as-is"""
+        order = np.lexsort((rng.random(scorer.n_courses), scorer.option_counts))
+        individual = np.zeros(scorer.n_courses, dtype=np.int32)
+        placed = []
+        for course, idx in (fixed or {}).items():
+            individual[course] = idx
+            placed.append(course)
+        for course in order:
+            if course in placed:
+                continue
+            clashes = scorer.option_clash_counts(individual, course, placed)
+            individual[course] = rng.choice(np.flatnonzero(clashes == clashes.min()))
+            placed.append(course)
+        return individual
 
-        return score
+    def _repair(self, individuals, scorer, rng):
+        """Swap conflicting genes for compatible sections until individuals are feasible"""
+        for row in np.nonzero(~scorer.validity(individuals))[0]:
+            individual = individuals[row]
+            for _ in range(scorer.n_courses):
+                gene_clashes = scorer.gene_conflicts(individual)
+                if not gene_clashes.any():
+                    break
 
-    def _create_individual(self, course_to_sections):
-        """Create a random individual (schedule)"""
-        schedule = []
-        for course_code, sections in course_to_sections.items():
-            if sections:
-                schedule.append(random.choice(sections))
-        return schedule
-
-    def _create_population(self, course_to_sections):
-        """Create initial population"""
-        population = []
-        for _ in range(self.population_size):
-            individual = self._create_individual(course_to_sections)
-            population.append(individual)
+                # Re-pick the worst offender among the least clashing sections
+                gene = rng.choice(np.flatnonzero(gene_clashes == gene_clashes.max()))
+                clashes = scorer.option_clash_counts(individual, gene)
+                individual[gene] = rng.choice(np.flatnonzero(clashes == clashes.min()))
+
+        return individuals
+
+    def _encode_crns(self, scorer, seed_crns):
+        """Map {course_code: crn} onto {course index: section index}"""
+        fixed = {}
+        for j, course_code in enumerate(scorer.course_codes):
+            crn = seed_crns.get(course_code)
+            for idx, section in enumerate(scorer.options[j]):
+                if section['crn'] == crn:
+                    fixed[j] = idx
+                    break
+        return fixed
+
+    def _create_population(self, scorer, rng, seed_crns=None):
+        """Create initial population as a (population_size, n_courses) array,
+        seeding part of it from greedy construction and repairing the rest.
+        seed_crns ({course_code: crn}) carries over a previous best schedule"""
+        population = scorer.random_candidates(self.population_size, rng)
+        n_seeded = int(self.population_size * self.seed_fraction)
+        for i in range(n_seeded):
+            population[i] = self._greedy_individual(scorer, rng)
+
+        if seed_crns:
+            fixed = self._encode_crns(scorer, seed_crns)
+            for i in range(max(1, self.population_size // 10)):
+                population[i] = self._greedy_individual(scorer, rng, fixed)
+
+        if self.repair:
+            population = self._repair(population, scorer, rng)
         return population
 
-    def _crossover(self, parent1, parent2):
-        """Perform crossover between two parents"""
-        if len(parent1) != len(parent2):
-            return parent1, parent2
+    def _crossover(self, parents1, parents2, rng):
+        """Single-point crossover applied row-wise to two parent arrays"""
+        n_genes = parents1.shape[1]
+        if n_genes < 2:
+            return parents1.copy(), parents2.copy()
 
-        crossover_point = random.randint(1, len(parent1) - 1)
-        child1 = parent1[:crossover_point] + parent2[crossover_point:]
-        child2 = parent2[:crossover_point] + parent1[crossover_point:]
+        crossover_points = rng.integers(1, n_genes, size=len(parents1))
+        take_first = np.arange(n_genes)[None, :] < crossover_points[:, None]
+        child1 = np.where(take_first, parents1, parents2)
+        child2 = np.where(take_first, parents2, parents1)
 
         return child1, child2
 
-    def _mutate(self, individual, course_to_sections):
-        """Mutate an individual"""
-        if random.random() < self.mutation_rate:
-            # Randomly replace one section
-            course_codes = list(course_to_sections.keys())
-            if course_codes:
-                course_code = random.choice(course_codes)
-                sections = course_to_sections[course_code]
-                if sections:
-                    # Find the section for this course in the individual
-                    for i, section in enumerate(individual):
-                        if section['course_code'] == course_code:
-                            individual[i] = random.choice(sections)
-                            break
-
-        return individual
-
-    def _select_parents(self, population, fitness_scores):
-        """Select parents using tournament selection"""
-        tournament_size = 3
-        parent1_idx = max(random.sample(range(len(population)), tournament_size),
-                          key=lambda i: fitness_scores[i])
-        parent2_idx = max(random.sample(range(len(population)), tournament_size),
-                          key=lambda i: fitness_scores[i])
-
-        return population[parent1_idx], population[parent2_idx]
-
-    def optimize(self, course_sections, preferences=""):
-        """Main genetic algorithm optimization"""
-        course_to_sections, _ = self._parse_sections(course_sections)
-
-        # Create initial population
-        population = self._create_population(course_to_sections)
+    def _mutate(self, individuals, scorer, rng):
+        """Replace one random gene in each individual with probability mutation_rate"""
+        n_individuals, n_genes = individuals.shape
+        if n_genes == 0:
+            return individuals
 
-        best_fitness = 0
-        best_schedule = None
+        mutating = np.nonzero(rng.random(n_individuals) < self.mutation_rate)[0]
+        genes = rng.integers(0, n_genes, size=len(mutating))
+        individuals[mutating, genes] = rng.integers(
+            0, scorer.option_counts[genes])
 
-        for generation in range(self.generations):
-            # Calculate fitness for all individuals
-            fitness_scores = []
-            for individual in population:
-                fitness = self._calculate_fitness(individual, preferences)
-                fitness_scores.append(fitness)
+        return individuals
 
-                if fitness > best_fitness:
-                    best_fitness = fitness
-                    best_schedule = individual.copy()
+    def _select_parents(self, population, fitness_scores, rng, n_pairs):
+        """Select n_pairs of parents using tournament selection"""
+        tournament_size = 3
+        contenders = rng.integers(0, len(population),
+                                  size=(2, n_pairs, tournament_size))
+        winners = np.take_along_axis(
+            contenders, fitness_scores[contenders].argmax(axis=2)[:, :, None],
+            axis=2)[:, :, 0]
+
+        return population[winners[0]], population[winners[1]]
+
+    def _evaluate(self, population, scorer, fitness_cache, stats):
+        """Score a population, reusing cached fitness for genomes seen before"""
+        unique_genomes, inverse = np.unique(
+            population, axis=0, return_inverse=True)
+        keys = [genome.tobytes() for genome in unique_genomes]
+        unique_fitness = np.zeros(len(unique_genomes), dtype=np.int64)
+
+        misses = []
+        for i, key in enumerate(keys):
+            if key in fitness_cache:
+                fitness_cache.move_to_end(key)
+                unique_fitness[i] = fitness_cache[key]
+            else:
+                misses.append(i)
 
-            # Create new population
-            new_population = []
+        if misses:
+            unique_fitness[misses] = scorer.score(unique_genomes[misses])['score']
+            for i in misses:
+                fitness_cache[keys[i]] = int(unique_fitness[i])
+            while len(fitness_cache) > self.cache_size:
+                fitness_cache.popitem(last=False)
 
-            # Elitism: keep best individual
-            best_idx = max(range(len(fitness_scores)),
-                           key=lambda i: fitness_scores[i])
-            new_population.append(population[best_idx])
+        # Duplicates within a generation are scored once, so they count as hits
+        stats['fitness_lookups'] += len(population)
+        stats['cache_misses'] += len(misses)
+        stats['cache_hits'] += len(population) - len(misses)
 
-            # Generate rest of population
-            while len(new_population) < self.population_size:
-                parent1, parent2 = self._select_parents(
-                    population, fitness_scores)
-                child1, child2 = self._crossover(parent1, parent2)
+        return unique_fitness[inverse.reshape(-1)], len(unique_genomes)
 
-                child1 = self._mutate(child1, course_to_sections)
-                child2 = self._mutate(child2, course_to_sections)
+    def _new_run_stats(self):
+        return {
+            'generations_run': 0,
+            'max_generations': self.generations,
+            'stopped_early': False,
+            'stop_reason': None,
+            'fitness_lookups': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'cache_hit_rate': 0.0,
+            'best_fitness': 0
+        }
 
-                new_population.extend([child1, child2])
+    def _new_search_state(self):
+        return {
+            'generation': 0,
+            'best_fitness': 0,
+            'best_individual': None,
+            'stale_generations': 0
+        }
 
-            # Trim to population size
-            population = new_population[:self.population_size]
+    def _evolve(self, scorer, population, rng, generations, fitness_cache, stats, state,
+                patience=None):
+        """Run up to `generations` generations, returning the next population,
+        the convergence reason if the run should stop, and the population's
+        fitness if it was already scored (None for a fresh generation)"""
+        n_pairs = self.population_size // 2
+        patience = patience if patience is not None else self.patience
+
+        for _ in range(generations):
+            generation = state['generation']
+            state['generation'] += 1
+            stats['generations_run'] += 1
+
+            # Calculate fitness for the whole population at once
+            fitness_scores, n_unique = self._evaluate(
+                population, scorer, fitness_cache, stats)
+
+            best_idx = int(fitness_scores.argmax())
+            if fitness_scores[best_idx] > state['best_fitness']:
+                state['best_fitness'] = int(fitness_scores[best_idx])
+                state['best_individual'] = population[best_idx].copy()
+                state['stale_generations'] = 0
+            else:
+                state['stale_generations'] += 1
 
             if generation % 20 == 0:
                 print(
-                    f"Generation {generation}: Best fitness = {best_fitness}")
+                    f"Generation {generation}: Best fitness = {state['best_fitness']}")
+
+            # Convergence: plateaued best fitness or a collapsed population
+            if state['best_fitness'] > 0 and state['stale_generations'] >= patience:
+                return population, 'plateau', fitness_scores
+            if n_unique / len(population) < self.min_diversity:
+                return population, 'diversity_collapse', fitness_scores
+
+            parents1, parents2 = self._select_parents(
+                population, fitness_scores, rng, n_pairs)
+            child1, child2 = self._crossover(parents1, parents2, rng)
+            children = self._mutate(np.vstack([child1, child2]), scorer, rng)
+            if self.repair:
+                children = self._repair(children, scorer, rng)
+
+            # Elitism: keep best individual, then trim to population size
+            population = np.vstack(
+                [population[best_idx][None, :], children])[:self.population_size]
+
+        return population, None, None
+
+    def _optimize_islands(self, scorer, stats):
+        """Evolve independent sub-populations in worker processes, migrating
+        the best individuals around a ring every migration_interval generations"""
+        rngs = [np.random.default_rng(child_seed)
+                for child_seed in np.random.SeedSequence(self.seed).spawn(self.islands)]
+        populations = [None] * self.islands
+        states = [self._new_search_state() for _ in range(self.islands)]
+        island_stats = [self._new_run_stats() for _ in range(self.islands)]
+
+        # Serialized once per run; each worker unpickles it once and keeps it by run id
+        run_id = uuid4().hex
+        payload = pickle.dumps((self, scorer), protocol=pickle.HIGHEST_PROTOCOL)
+        executor = get_solver_pool()
+        generations_done = 0
+        while generations_done < self.generations:
+            epoch = min(self.migration_interval,
+                        self.generations - generations_done)
+            tasks = [(run_id, payload, i, populations[i], rngs[i], states[i], island_stats[i], epoch)
+                     for i in range(self.islands)]
+            results = list(executor.map(_evolve_island, tasks))
+            generations_done += epoch
+
+            fitnesses = []
+            stop_reasons = []
+            for i, (population, fitness, rng, state, run_stats, reason) in enumerate(results):
+                populations[i], rngs[i], states[i], island_stats[i] = population, rng, state, run_stats
+                fitnesses.append(fitness)
+                stop_reasons.append(reason)
+
+            if all(stop_reasons):
+                stats['stop_reason'] = 'islands_converged'
+                break
 
-        return best_schedule if best_schedule else []
+            # Ring migration: island i's best replace island i+1's worst
+            migrants = [populations[i][np.argsort(-fitnesses[i], kind='stable')[:self.migrants]].copy()
+                        for i in range(self.islands)]
+            for i in range(self.islands):
+                target = (i + 1) % self.islands
+                worst = np.argsort(fitnesses[target], kind='stable')[:self.migrants]
+                populations[target][worst] = migrants[i]
+
+        for key in ('fitness_lookups', 'cache_hits', 'cache_misses'):
+            stats[key] = sum(run_stats[key] for run_stats in island_stats)
+        stats['generations_run'] = max(run_stats['generations_run'] for run_stats in island_stats)
+        stats['islands'] = self.islands
+
+        best_island = max(range(self.islands), key=lambda i: states[i]['best_fitness'])
+        return states[best_island]
+
+    def _run(self, course_sections, preferences="", allow_islands=True, session=None,
+             constraints=None, weights=None, stats=None):
+        """Run the search, returning (scorer, best state, fitness cache).
+
+        With a solve session, parsed sections and conflict tables are reused
+        across calls and the previous best schedule seeds the population.
+        The run's statistics are written into stats when a dict is given;
+        the optimizer itself is shared between requests and keeps none.
+        """
+        if stats is None:
+            stats = {}
+        stats.update(self._new_run_stats())
+        max_classes_per_day = (constraints or {}).get('max_classes_per_day')
+
+        if session is not None:
+            # Parsed sections are keyed on content, since constraints can
+            # filter the same course differently between requests
+            parsed = session['parsed_sections']
+            parsed_keys = {code: (code, course_data_fingerprint(df))
+                           for code, df in course_sections.items()}
+            missing = {code: df for code, df in course_sections.items()
+                       if parsed_keys[code] not in parsed}
+            if missing:
+                for code, sections in self._parse_sections(missing)[0].items():
+                    parsed[parsed_keys[code]] = sections
+            course_to_sections = {code: parsed[parsed_keys[code]]
+                                  for code in course_sections}
+            # Only the current request's versions are worth keeping
+            session['parsed_sections'] = {key: parsed[key] for key in parsed_keys.values()}
+            n_sections = sum(len(sections) for sections in course_to_sections.values())
+            seed_crns = session['best_crns']
+            stats['incremental'] = bool(seed_crns)
+        else:
+            course_to_sections, all_sections = self._parse_sections(course_sections)
+            n_sections = len(all_sections)
+            seed_crns = None
+        scorer = BatchScheduleScorer(course_to_sections, preferences, weights=weights,
+                                     max_classes_per_day=max_classes_per_day)
+
+        stats['conflict_tiles_cached'] = scorer.tiles_cached
+        stats['conflict_tiles_computed'] = scorer.tiles_computed
+        fitness_cache = OrderedDict()
+        if scorer.n_courses == 0:
+            return scorer, self._new_search_state(), fitness_cache
+
+        if (allow_islands and not seed_crns and self.islands > 1 and
+                n_sections >= self.island_min_sections):
+            state = self._optimize_islands(scorer, stats)
+        else:
+            rng = np.random.default_rng(self.seed)
+            state = self._new_search_state()
+            population = self._create_population(scorer, rng, seed_crns)
+            patience = self.incremental_patience if seed_crns else self.patience
+            _, stats['stop_reason'], _ = self._evolve(
+                scorer, population, rng, self.generations, fitness_cache, stats, state,
+                patience=patience)
+
+        if session is not None and state['best_individual'] is not None:
+            session['best_crns'].update(
+                {section['course_code']: section['crn']
+                 for section in scorer.decode(state['best_individual'])})
+
+        stats['stopped_early'] = stats['stop_reason'] is not None
+        stats['best_fitness'] = state['best_fitness']
+        if stats['fitness_lookups']:
+            stats['cache_hit_rate'] = round(
+                stats['cache_hits'] / stats['fitness_lookups'] * 100, 1)
+
+        print(
+            f"Genetic optimization ran {stats['generations_run']}/{self.generations} generations "
+            f"(stop reason: {stats['stop_reason'] or 'max_generations'}), "
+            f"fitness cache hit rate: {stats['cache_hit_rate']}%")
+
+        return scorer, state, fitness_cache
+
+    def optimize(self, course_sections, preferences="", session=None, constraints=None,
+                 weights=None, stats=None):
+        """Main genetic algorithm optimization. Pass a dict as stats to get
+        this run's statistics"""
+        scorer, state, _ = self._run(course_sections, preferences, session=session,
+                                     constraints=constraints, weights=weights, stats=stats)
+        best_individual = state['best_individual']
+        return scorer.decode(best_individual) if best_individual is not None else []
+
+    def optimize_top_k(self, course_sections, preferences="", k=3, min_differing_crns=1,
+                       constraints=None, stats=None):
+        """Return up to k (schedule, score) pairs from a single run, best first,
+        where every pair of schedules differs in at least min_differing_crns CRNs.
+        Pass a dict as stats to get this run's statistics"""
+        # Every genome scored during the run is in the fitness cache, so the
+        # run runs in-process and the cache doubles as the candidate archive
+        scorer, state, fitness_cache = self._run(
+            course_sections, preferences, allow_islands=False, constraints=constraints,
+            stats=stats)
+        if state['best_individual'] is None:
+            return []
+
+        genomes = [np.frombuffer(key, dtype=state['best_individual'].dtype)
+                   for key, fitness in fitness_cache.items() if fitness > 0]
+        candidates = np.unique(np.array(genomes), axis=0)
+        scores = scorer.score(candidates)['score']
+
+        # Top up a small archive with repaired random samples
+        if len(candidates) < k * 10:
+            rng = np.random.default_rng(self.seed)
+            extra = self._repair(scorer.random_candidates(
+                self.population_size * k, rng), scorer, rng)
+            extra_scores = scorer.score(extra)['score']
+            candidates = np.vstack([candidates, extra[extra_scores > 0]])
+            scores = np.concatenate([scores, extra_scores[extra_scores > 0]])
+            candidates, first = np.unique(candidates, axis=0, return_index=True)
+            scores = scores[first]
+
+        # Compare schedules by CRN, since one CRN can span several options
+        crn_ids = {}
+        option_crns = [np.array([crn_ids.setdefault(section['crn'], len(crn_ids))
+                                 for section in options])
+                       for options in scorer.options]
+        candidate_crns = np.column_stack(
+            [option_crns[j][candidates[:, j]] for j in range(scorer.n_courses)])
+
+        selected = []
+        for idx in np.argsort(-scores, kind='stable'):
+            if all(np.count_nonzero(candidate_crns[idx] != candidate_crns[chosen])
+                   >= min_differing_crns for chosen in selected):
+                selected.append(idx)
+                if len(selected) == k:
+                    break
+
+        return [(scorer.decode(candidates[idx]), int(scores[idx])) for idx in selected]
 
     def _convert_to_ai_format(self, schedule):
         """Convert genetic algorithm schedule to AI format"""
@@ -1790,13 +3315,58 @@ class GeneticScheduleOptimizer:
         return ai_classes
 
 
+# Per-process state for island-model GA workers in the shared solver pool:
+# run id -> read-only GA inputs and per-island fitness caches
+_island_context = OrderedDict()
+ISLAND_CONTEXT_MAX_RUNS = 4
+
+
+def _island_run_context(run_id, payload):
+    """This worker's context for a GA run, unpickled on first use"""
+    context = _island_context.get(run_id)
+    if context is None:
+        optimizer, scorer = pickle.loads(payload)
+        context = _island_context[run_id] = {
+            'optimizer': optimizer, 'scorer': scorer, 'fitness_caches': {}}
+        while len(_island_context) > ISLAND_CONTEXT_MAX_RUNS:
+            _island_context.popitem(last=False)
+    return context
+
+
+def _evolve_island(task):
+    """Evolve one island for a single migration epoch inside a worker process"""
+    run_id, payload, island, population, rng, state, stats, generations = task
+    context = _island_run_context(run_id, payload)
+    optimizer = context['optimizer']
+    scorer = context['scorer']
+    # Caches only affect speed, so it doesn't matter which worker holds them
+    fitness_cache = context['fitness_caches'].setdefault(island, OrderedDict())
+
+    if population is None:
+        population = optimizer._create_population(scorer, rng)
+
+    population, stop_reason, fitness = optimizer._evolve(
+        scorer, population, rng, generations, fitness_cache, stats, state)
+    if fitness is None:
+        # Scored only to pick migrants, so these lookups stay out of the stats
+        fitness, _ = optimizer._evaluate(
+            population, scorer, fitness_cache, optimizer._new_run_stats())
+
+    return population, fitness, rng, state, stats, stop_reason
+
+
+# Number of GA islands (worker processes) used for large schedules
+GA_ISLANDS = int(os.getenv("GA_ISLANDS", "1"))
+
 # Initialize genetic optimizer
-genetic_optimizer = GeneticScheduleOptimizer()
+genetic_optimizer = GeneticScheduleOptimizer(islands=GA_ISLANDS)
 
 
-def get_cached_course_data(department, coursenumber, term_year):
+def get_cached_course_data(department, coursenumber, term_year, open_only=False):
     """Get course data from cache or fetch if not available"""
     cache_key = f"{department}_{coursenumber}_{term_year}"
+    if open_only:
+        return get_cached_open_sections(department, coursenumber, term_year)
 
     # Check if data is in cache and not expired
     if cache_key in course_cache:
@@ -1808,10 +3378,390 @@ def get_cached_course_data(department, coursenumber, term_year):
     fresh_data = courseDetailsExractor(department, coursenumber, term_year)
     if fresh_data is not None:
         course_cache[cache_key] = (fresh_data, time.time())
+        index_course_sections(term_year, fresh_data)
+
+        # Drop cached results built from an older version of this course
+        fingerprint = course_data_fingerprint(fresh_data)
+        previous = course_fingerprints.get(cache_key)
+        course_fingerprints[cache_key] = fingerprint
+        if previous is not None and previous != fingerprint:
+            invalidate_result_cache(department + coursenumber, term_year)
 
     return fresh_data
 
 
+def get_cached_open_sections(department, coursenumber, term_year):
+    """Get only the sections with open seats, cached for SEAT_CACHE_DURATION"""
+    cache_key = f"{department}_{coursenumber}_{term_year}"
+    if cache_key in seat_cache:
+        cached_data, timestamp = seat_cache[cache_key]
+        if time.time() - timestamp < SEAT_CACHE_DURATION:
+            return cached_data
+
+    fresh_data = courseDetailsExractor(
+        department, coursenumber, term_year, open_only=True)
+    if fresh_data is not None:
+        fresh_data = filter_full_sections(fresh_data)
+        seat_cache[cache_key] = (fresh_data, time.time())
+    return fresh_data
+
+
+def index_course_sections(term_year, df, replace=True):
+    """Add a timetable DataFrame's sections to the term's CRN index.
+
+    With replace the frame holds the full section lists of the courses in
+    it (one course or a whole subject) and replaces what was indexed for
+    them; otherwise sections are only added.
+    """
+    if df is None or df.empty:
+        return
+    sections = _merge_section_rows(df)
+    course_by_crn = {}
+    for _, row in df.iterrows():
+        crn = str(row.get('CRN', '') or '').strip()
+        course = str(row.get('Course', '') or '')
+        if crn and 'additional times' not in course.lower():
+            course_by_crn[crn] = course.replace('-', '').upper().strip()
+
+    now = time.time()
+    with _section_index_lock:
+        index = section_index[term_year]
+        if replace:
+            for code in set(course_by_crn.values()):
+                for crn in section_index_courses[term_year].pop(code, []):
+                    index.pop(crn, None)
+        section_index_versions[term_year] += 1
+        for section in sections:
+            code = course_by_crn.get(section['crn'], '')
+            section = dict(section, course_code=code, indexed_at=now,
+                           intervals=_meeting_intervals(section))
+            index[section['crn']] = section
+            crns = section_index_courses[term_year].setdefault(code, [])
+            if section['crn'] not in crns:
+                crns.append(section['crn'])
+
+
+def lookup_sections(term_year, crns, fetch_missing=False, max_fetches=CRN_FETCH_MAX_PER_REQUEST):
+    """Indexed sections for crns. With fetch_missing, up to max_fetches CRNs
+    that are unknown or older than CACHE_DURATION are fetched from the
+    timetable; CRNs the timetable doesn't know are remembered for
+    CACHE_DURATION. Returns ({crn: section}, unknown_crns)."""
+    index = section_index.get(term_year, {})
+    cutoff = time.time() - CACHE_DURATION
+    found = {}
+    unknown = []
+    for crn in crns:
+        section = index.get(crn)
+        if section is not None and section['indexed_at'] >= cutoff:
+            found[crn] = section
+        else:
+            unknown.append(crn)
+
+    if unknown and fetch_missing:
+        to_fetch = [crn for crn in unknown
+                    if time.time() - missing_crn_cache.get((term_year, crn), 0) >= CACHE_DURATION]
+        for crn in to_fetch[:max_fetches]:
+            df = courseDetailsExractor('%', '', term_year, crn=crn)
+            if df is not None and df.empty:
+                missing_crn_cache[(term_year, crn)] = time.time()
+            index_course_sections(term_year, df, replace=False)
+        index = section_index.get(term_year, {})
+        found.update((crn, index[crn]) for crn in unknown if crn in index)
+        unknown = [crn for crn in unknown if crn not in index]
+    return found, unknown
+
+
+def prune_section_index(now=None):
+    """Drop indexed sections and negative CRN lookups older than
+    CACHE_DURATION, so the index only holds what the catalog cache does"""
+    cutoff = (now or time.time()) - CACHE_DURATION
+    for key in [key for key, timestamp in missing_crn_cache.items() if timestamp < cutoff]:
+        missing_crn_cache.pop(key, None)
+
+    with _section_index_lock:
+        for term_year in list(section_index):
+            index = section_index[term_year]
+            stale = {crn for crn, section in index.items() if section['indexed_at'] < cutoff}
+            if not stale:
+                continue
+            for crn in stale:
+                del index[crn]
+            courses = section_index_courses[term_year]
+            for code in list(courses):
+                courses[code] = [crn for crn in courses[code] if crn not in stale]
+                if not courses[code]:
+                    del courses[code]
+            section_index_versions[term_year] += 1
+            if not index:
+                del section_index[term_year]
+                section_index_courses.pop(term_year, None)
+                section_day_index.pop(term_year, None)
+
+
+def get_section_day_index(term_year):
+    """Per-day meetings of every indexed section in the term, sorted by start"""
+    with _section_index_lock:
+        version = section_index_versions[term_year]
+        cached = section_day_index.get(term_year)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        meetings_by_day = defaultdict(list)
+        for crn, section in section_index[term_year].items():
+            for day, start, end in section['intervals']:
+                meetings_by_day[day].append((start, end, crn))
+        days = {}
+        for day, meetings in meetings_by_day.items():
+            meetings.sort()
+            days[day] = ([meeting[0] for meeting in meetings], meetings,
+                         max(end - start for start, end, _ in meetings))
+        section_day_index[term_year] = (version, days)
+        return days
+
+
+def sections_meeting_during(term_year, day, start, end, min_gap=0):
+    """CRNs with a meeting on day that overlaps [start, end) or sits closer
+    than min_gap minutes to it"""
+    day_index = get_section_day_index(term_year).get(day)
+    if day_index is None:
+        return set()
+    starts, meetings, longest = day_index
+    # Only meetings starting in this window can reach the busy interval
+    low = bisect.bisect_left(starts, start - min_gap - longest)
+    high = bisect.bisect_left(starts, end + min_gap)
+    return {crn for meeting_start, meeting_end, crn in meetings[low:high]
+            if meeting_end + min_gap > start}
+
+
+def parse_int_field(data, key, default, minimum=0, maximum=None):
+    """Optional integer field of a request body; raises ValueError when it
+    is not an integer within [minimum, maximum]"""
+    value = data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key} must be an integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{key} must be between {minimum} and {maximum}" if maximum is not None
+                         else f"{key} must be at least {minimum}")
+    return value
+
+
+def parse_float_field(data, key, default, minimum=0.0, maximum=None):
+    """Optional numeric field of a request body; raises ValueError when it
+    is not a number within [minimum, maximum]"""
+    value = data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{key} must be a number")
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a number")
+    if not math.isfinite(value) or value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{key} must be between {minimum} and {maximum}" if maximum is not None
+                         else f"{key} must be at least {minimum}")
+    return value
+
+
+COURSE_CODE_PATTERN = re.compile(r"^\s*([A-Za-z]+)[\s-]*([0-9][0-9A-Za-z]*)\s*$")
+# Banner treats '%' as a wildcard, so anything else is rejected before a scrape
+DEPARTMENT_PATTERN = re.compile(r"^[A-Z]{1,8}$")
+COURSE_NUMBER_PATTERN = re.compile(r"^[0-9][0-9A-Z]{0,7}$")
+COURSE_HINTS_MAX = 8  # Courses one check or free-slot request may load
+
+
+def parse_course_hints(raw):
+    """Normalize a list of {department, number} dicts or codes like
+    'cs-1114' to (department, number) pairs; raises ValueError on
+    malformed entries"""
+    if not isinstance(raw, list):
+        raise ValueError("courses must be a list")
+    if len(raw) > COURSE_HINTS_MAX:
+        raise ValueError(f"At most {COURSE_HINTS_MAX} courses per request")
+    parsed = []
+    for course in raw:
+        if isinstance(course, str):
+            match = COURSE_CODE_PATTERN.match(course)
+            course = {'department': match.group(1), 'number': match.group(2)} if match else {}
+        if not isinstance(course, dict):
+            raise ValueError("each course needs a department and number")
+        department = str(course.get('department') or '').upper().strip()
+        number = str(course.get('number') or '').upper().strip()
+        if not DEPARTMENT_PATTERN.match(department) or not COURSE_NUMBER_PATTERN.match(number):
+            raise ValueError("each course needs a department and number")
+        if (department, number) not in parsed:
+            parsed.append((department, number))
+    return parsed
+
+
+def schedule_gap_stats(intervals_by_day):
+    """Per-day span and idle time between classes for {day: [(start, end, ...)]}"""
+    days = {}
+    for day in 'MTWRF':
+        intervals = sorted(intervals_by_day.get(day, []))
+        if not intervals:
+            continue
+        gaps = []
+        busy_until = intervals[0][1]
+        for interval in intervals[1:]:
+            if interval[0] > busy_until:
+                gaps.append(interval[0] - busy_until)
+            busy_until = max(busy_until, interval[1])
+        days[day] = {
+            'first_start': minutes_to_time_string(intervals[0][0]),
+            'last_end': minutes_to_time_string(busy_until),
+            'class_minutes': sum(interval[1] - interval[0] for interval in intervals),
+            'gap_minutes': sum(gaps),
+            'longest_gap_minutes': max(gaps, default=0)
+        }
+    return {
+        'days': days,
+        'days_on_campus': len(days),
+        'total_gap_minutes': sum(stats['gap_minutes'] for stats in days.values()),
+        'longest_gap_minutes': max((stats['longest_gap_minutes'] for stats in days.values()), default=0)
+    }
+
+
+def parse_capacity(capacity):
+    """Parse a timetable capacity cell into (open_seats, total_seats).
+
+    Handles plain totals ('30'), open/total pairs ('4/30') and full
+    markers ('Full', 'Full 0/30'). Unknown parts come back as None.
+    """
+    text = str(capacity or '').strip().upper()
+    numbers = [int(n) for n in re.findall(r'-?\d+', text)]
+    if 'FULL' in text:
+        return 0, numbers[-1] if numbers else None
+    if '/' in text and len(numbers) >= 2:
+        return max(numbers[0], 0), numbers[1]
+    if numbers:
+        return None, numbers[0]
+    return None, None
+
+
+def section_row_crns(df):
+    """The CRN each timetable row belongs to; "Additional Times" rows have
+    no CRN of their own and belong to the row above"""
+    owners = df['CRN'].astype(str).str.strip()
+    return owners.mask((owners == '') | df['Course'].astype(str).str.contains(
+        'additional times', case=False)).ffill()
+
+
+def filter_full_sections(df):
+    """Drop every row of a CRN that has no open seats"""
+    if df is None or df.empty or 'Capacity' not in df.columns:
+        return df
+    seats = df['Capacity'].map(parse_capacity)
+    full = seats.map(lambda s: s[0] == 0 or s[1] == 0)
+    if not full.any():
+        return df
+    owners = section_row_crns(df)
+    full_crns = set(owners[full].dropna())
+    print(f"Dropped {len(full_crns)} full sections")
+    return df[~owners.isin(full_crns)].reset_index(drop=True)
+
+
+def course_data_fingerprint(df):
+    """Content hash of a course's section data, memoized on the DataFrame"""
+    # pandas copies attrs onto filtered frames, so the memo records its owner
+    owner, fingerprint = df.attrs.get('fingerprint', (None, None))
+    if owner != id(df):
+        row_hashes = pd.util.hash_pandas_object(df, index=False).values
+        fingerprint = hashlib.sha1(row_hashes.tobytes()).hexdigest()
+        df.attrs['fingerprint'] = (id(df), fingerprint)
+    return fingerprint
+
+
+def schedule_request_fingerprint(term_year, courses, preferences, courses_data, extra=None):
+    """Canonical hash of everything that determines a schedule response"""
+    canonical = {
+        'term_year': term_year,
+        'courses': sorted(
+            [course['department'].upper() + course['number'],
+             ' '.join(str(course.get('professor') or '').lower().split())]
+            for course in courses),
+        'preferences': ' '.join((preferences or '').lower().split()),
+        'data_version': sorted(
+            [course_code, course_data_fingerprint(df)]
+            for course_code, df in courses_data.items()),
+        'extra': extra or {}
+    }
+    return hashlib.sha256(
+        json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def get_cached_result(fingerprint):
+    """Return a copy of a cached response, or None if missing or expired"""
+    entry = schedule_result_cache.get(fingerprint)
+    if entry is None or time.time() - entry['timestamp'] > RESULT_CACHE_DURATION:
+        if entry is not None:
+            del schedule_result_cache[fingerprint]
+        result_cache_stats['misses'] += 1
+        return None
+
+    schedule_result_cache.move_to_end(fingerprint)
+    result_cache_stats['hits'] += 1
+    return copy.deepcopy(entry['response'])
+
+
+def store_cached_result(fingerprint, response, term_year, course_codes):
+    """Cache a response, evicting the least recently used entries. The
+    session_id belongs to the requesting client and is never cached."""
+    response = copy.deepcopy(response)
+    response.pop('session_id', None)
+    schedule_result_cache[fingerprint] = {
+        'response': response,
+        'timestamp': time.time(),
+        'term_year': term_year,
+        'course_codes': set(course_codes)
+    }
+    schedule_result_cache.move_to_end(fingerprint)
+    while len(schedule_result_cache) > RESULT_CACHE_MAX_ENTRIES:
+        schedule_result_cache.popitem(last=False)
+
+
+def invalidate_result_cache(course_code, term_year):
+    """Remove cached results that include the given course"""
+    stale = [key for key, entry in schedule_result_cache.items()
+             if entry['term_year'] == term_year and course_code in entry['course_codes']]
+    for key in stale:
+        del schedule_result_cache[key]
+
+
+def cached_result_metrics(performance_metrics, start_time):
+    """Performance metrics for a response served from the result cache"""
+    metrics = dict(performance_metrics)
+    metrics.update({
+        'cached_optimization_method': performance_metrics.get('optimization_method'),
+        'optimization_method': 'result_cache',
+        'total_tokens': 0,
+        'time_taken_seconds': round(time.time() - start_time, 6),
+        'result_cache_hits': result_cache_stats['hits'],
+        'result_cache_misses': result_cache_stats['misses'],
+        'cost_info': {
+            'input_cost': 0.0,
+            'output_cost': 0.0,
+            'total_cost': 0.0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'model_used': 'result_cache',
+            'cumulative_cost': 0.0,
+            'total_attempts': 0,
+            'models_used': ['result_cache'],
+            'model_usage_breakdown': [],
+            'model_cost_breakdown': {},
+            'total_cost_all_models': 0.0
+        }
+    })
+    metrics.pop('cost_breakdown', None)
+    return metrics
+
+
 def _calculate_model_breakdown(model_usage):
     """Calculate detailed breakdown for each model used"""
     model_stats = {}
@@ -1911,8 +3861,594 @@ def clear_expired_cache():
     for key in expired_keys:
         del course_cache[key]
 
+    expired_seats = [
+        key for key, (_, timestamp) in seat_cache.items()
+        if current_time - timestamp > SEAT_CACHE_DURATION
+    ]
+    for key in expired_seats:
+        del seat_cache[key]
+
+    prune_section_index(current_time)
+
+    with _session_lock:
+        expired_sessions = [
+            key for key, session in solve_sessions.items()
+            if current_time - session['last_used'] > SESSION_DURATION
+        ]
+        for key in expired_sessions:
+            del solve_sessions[key]
+
+
+def get_solve_session(session_id, term_year, create=False):
+    """Get the solve session for this id and term, starting one when the
+    client sent a session_id or asked for one with create. Returns None
+    otherwise, so one-off requests don't hold memory.
+
+    A session keeps the parsed sections and best CRN per course from
+    earlier solves of one term, so an edited request only parses the
+    courses that changed. Course data itself always comes from
+    get_cached_course_data and is refreshed on its TTL. Sessions are
+    evicted least recently used first beyond SESSION_MAX_ENTRIES.
+    """
+    if not session_id and not create:
+        return None
+    session_id = str(session_id)[:64] if session_id else str(uuid4())
+    key = (session_id, term_year)
+    now = time.time()
+    with _session_lock:
+        session = solve_sessions.get(key)
+        if session is None or now - session['last_used'] > SESSION_DURATION:
+            session = solve_sessions[key] = {
+                'id': session_id,
+                'term_year': term_year,
+                'parsed_sections': {},
+                'best_crns': {}
+            }
+        solve_sessions.move_to_end(key)
+        session['last_used'] = now
+        while len(solve_sessions) > SESSION_MAX_ENTRIES:
+            solve_sessions.popitem(last=False)
+    return session
+
+
+def parse_time_minutes(time_str):
+    """Parse '9:30AM', '9:30 AM', '2PM' or '14:30' into minutes since midnight"""
+    text = str(time_str).strip().upper().replace(' ', '')
+    period = ''
+    if text.endswith(('AM', 'PM')):
+        text, period = text[:-2], text[-2:]
+    hours, _, minutes = text.partition(':')
+    hours, minutes = int(hours), int(minutes or 0)
+    if period == 'PM' and hours != 12:
+        hours += 12
+    elif period == 'AM' and hours == 12:
+        hours = 0
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time: {time_str}")
+    return hours * 60 + minutes
+
+
+def minutes_to_time_string(minutes):
+    """Format minutes since midnight as 12-hour time like '9:05AM'"""
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{(hours - 1) % 12 + 1}:{minutes:02d}{'AM' if hours < 12 else 'PM'}"
+
+
+def _parse_day_codes(days):
+    """Normalize 'MWF' or ['M', 'W', 'F'] into a set of day letters"""
+    if isinstance(days, (list, tuple)):
+        days = ''.join(days)
+    return {day for day in str(days or '').upper() if day in 'MTWRF'}
+
+
+def parse_schedule_constraints(raw):
+    """Normalize the optional `constraints` object of a schedule request.
+
+    Supported keys: blocked_windows ([{days, start, end}]), days_off,
+    max_classes_per_day, earliest_start and latest_end. Raises ValueError
+    on malformed input.
+    """
+    raw = raw or {}
+    blocked_windows = []
+    for window in raw.get('blocked_windows') or []:
+        blocked_windows.append({
+            'days': _parse_day_codes(window.get('days', 'MTWRF')),
+            'start': parse_time_minutes(window['start']),
+            'end': parse_time_minutes(window['end'])
+        })
+
+    return {
+        'blocked_windows': blocked_windows,
+        'days_off': _parse_day_codes(raw.get('days_off')),
+        'max_classes_per_day': parse_int_field(raw, 'max_classes_per_day', None, 1),
+        'earliest_start': parse_time_minutes(raw['earliest_start']) if raw.get('earliest_start') else None,
+        'latest_end': parse_time_minutes(raw['latest_end']) if raw.get('latest_end') else None
+    }
+
+
+def has_schedule_constraints(constraints):
+    return any(constraints.get(key) for key in (
+        'blocked_windows', 'days_off', 'max_classes_per_day', 'earliest_start', 'latest_end'))
+
+
+def _row_violates_constraints(row, constraints):
+    """Check one meeting row against the time-window and day-off constraints"""
+    days = _parse_day_codes(row.get('Days', ''))
+    if days & constraints['days_off']:
+        return True
 
-def courseDetailsExractor(department: str, coursenumber, term_year: str):
+    begin_time = str(row.get('Begin Time', '')).strip()
+    end_time = str(row.get('End Time', '')).strip()
+    if not days or not begin_time or not end_time:
+        return False
+    try:
+        start, end = parse_time_minutes(begin_time), parse_time_minutes(end_time)
+    except ValueError:
+        return False
+
+    if constraints['earliest_start'] is not None and start < constraints['earliest_start']:
+        return True
+    if constraints['latest_end'] is not None and end > constraints['latest_end']:
+        return True
+    for window in constraints['blocked_windows']:
+        if days & window['days'] and start < window['end'] and window['start'] < end:
+            return True
+    return False
+
+
+def apply_schedule_constraints(courses_data, constraints):
+    """Drop every CRN with a meeting that breaks a hard constraint before search.
+
+    Returns (filtered courses_data, course codes left with no sections).
+    """
+    if not any(constraints.get(key) for key in (
+            'blocked_windows', 'days_off', 'earliest_start', 'latest_end')):
+        return courses_data, []
+
+    filtered_data = {}
+    unsatisfiable = []
+    for course_code, df in courses_data.items():
+        violating = df.apply(
+            lambda row: _row_violates_constraints(row, constraints), axis=1)
+        owners = section_row_crns(df)
+        blocked_crns = set(owners[violating].dropna()) if violating.any() else set()
+        filtered = df[~owners.isin(blocked_crns)].reset_index(drop=True)
+        if blocked_crns:
+            print(
+                f"Constraints removed {len(blocked_crns)} CRNs from {course_code}")
+        if filtered.empty:
+            unsatisfiable.append(course_code)
+        else:
+            filtered_data[course_code] = filtered
+    return filtered_data, unsatisfiable
+
+
+def describe_schedule_constraints(constraints):
+    """Plain-text summary of hard constraints for the AI prompt"""
+    lines = []
+    if constraints.get('max_classes_per_day'):
+        lines.append(
+            f"- At most {constraints['max_classes_per_day']} classes on any single day")
+    if constraints.get('days_off'):
+        lines.append(
+            f"- No classes on: {''.join(sorted(constraints['days_off']))}")
+    if constraints.get('earliest_start') is not None:
+        lines.append(
+            f"- No class may start before {constraints['earliest_start'] // 60:02d}:{constraints['earliest_start'] % 60:02d}")
+    if constraints.get('latest_end') is not None:
+        lines.append(
+            f"- No class may end after {constraints['latest_end'] // 60:02d}:{constraints['latest_end'] % 60:02d}")
+    for window in constraints.get('blocked_windows', []):
+        lines.append(
+            f"- Keep {''.join(sorted(window['days']))} free from "
+            f"{window['start'] // 60:02d}:{window['start'] % 60:02d} to {window['end'] // 60:02d}:{window['end'] % 60:02d}")
+    return "\n".join(lines)
+
+
+# Minimum gap ai_maker enforces between consecutive classes
+AI_MIN_GAP_MINUTES = 5
+
+COMPACT_SECTION_FORMAT = (
+    "Each section line is CRN|schedule type|modality|instructor|meetings. "
+    "Meetings are separated by ';' and written as DAYS START-END @LOCATION; "
+    "a CRN's meetings (including additional times) are scheduled together or not at all. "
+    "I#/L# are codes from the instructor and location tables: always output the full names.")
+
+
+def estimate_tokens(text):
+    """Rough Gemini token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def _build_raw_ai_prompt(courses, courses_data, preferences, constraints=None):
+    """The original prompt with every CSV column, kept for token comparisons"""
+    ai_prompt = ""
+    ai_prompt += f"<preferences_by_user>\n{preferences}\n</preferences_by_user>\n"
+    if constraints and has_schedule_constraints(constraints):
+        ai_prompt += f"<hard_constraints>\n{describe_schedule_constraints(constraints)}\n</hard_constraints>\n"
+    for course in courses:
+        course_code = course['department'] + course['number']
+        ai_prompt += f"<course_number>{course_code}</course_number>\n"
+        ai_prompt += f"<professor_preference>{course['professor']}</professor_preference>\n"
+        ai_prompt += f"<timetable_of_classes_for_the_course>\n"
+        df = courses_data.get(course_code)
+        if df is not None:
+            ai_prompt += df.to_csv(index=False)
+        ai_prompt += "\n</timetable_of_classes_for_the_course>"
+    return ai_prompt
+
+
+def _merge_section_rows(df):
+    """Group timetable rows by CRN, folding "Additional Times" rows into
+    the CRN they belong to. Returns a list of section dicts in row order."""
+    sections = OrderedDict()
+    last_crn = None
+    for _, row in df.iterrows():
+        crn = str(row.get('CRN', '') or '').strip()
+        course = str(row.get('Course', '') or '')
+        if not crn or 'additional times' in course.lower():
+            crn = last_crn
+        if crn is None:
+            continue
+        last_crn = crn
+
+        section = sections.get(crn)
+        if section is None:
+            section = sections[crn] = {
+                'crn': crn,
+                'title': str(row.get('Title', '') or '').strip(),
+                'schedule_type': str(row.get('Schedule Type', '') or '').strip(),
+                'modality': str(row.get('Modality', '') or '').strip(),
+                'instructor': str(row.get('Instructor', '') or '').strip(),
+                'meetings': []
+            }
+        section['meetings'].append({
+            'days': str(row.get('Days', '') or '').strip(),
+            'begin': str(row.get('Begin Time', '') or '').strip(),
+            'end': str(row.get('End Time', '') or '').strip(),
+            'location': str(row.get('Location', '') or '').strip()
+        })
+    return list(sections.values())
+
+
+def _meeting_intervals(section):
+    """(day, start, end) intervals for a section's timed meetings"""
+    intervals = []
+    for meeting in section['meetings']:
+        if not meeting['begin'] or not meeting['end']:
+            continue
+        try:
+            start = parse_time_minutes(meeting['begin'])
+            end = parse_time_minutes(meeting['end'])
+        except ValueError:
+            continue
+        for day in _parse_day_codes(meeting['days']):
+            intervals.append((day, start, end))
+    return intervals
+
+
+def _sections_clash(intervals_a, intervals_b):
+    """True when two sections overlap or sit closer than AI_MIN_GAP_MINUTES"""
+    for day_a, start_a, end_a in intervals_a:
+        for day_b, start_b, end_b in intervals_b:
+            if (day_a == day_b and start_a < end_b + AI_MIN_GAP_MINUTES and
+                    start_b < end_a + AI_MIN_GAP_MINUTES):
+                return True
+    return False
+
+
+def _schedule_components(course_code, sections):
+    """Group a course's sections into the components every schedule covers.
+
+    A (course, schedule type) group is only certain to be needed when every
+    section of the course has that type. Otherwise, as in the solvers, the
+    whole course is a single component keyed (course_code, None). Pruning
+    against these groups is safe under the AI's stricter one-CRN-per-type
+    rule too, which repair_ai_schedule enforces.
+    """
+    types = {section['schedule_type'].lower() for section in sections}
+    if len(types) == 1:
+        return {(course_code, types.pop()): list(sections)}
+    return {(course_code, None): list(sections)} if sections else {}
+
+
+def prune_infeasible_sections(course_sections):
+    """Remove sections that cannot appear in any valid schedule.
+
+    Each required component (see _schedule_components) needs one CRN, so a
+    CRN that clashes with every CRN of another component can never be
+    picked. Pruning repeats until nothing changes; a component is never
+    emptied, so an impossible request still reaches the model and fails the
+    usual way.
+    """
+    groups = {}
+    for course_code, sections in course_sections.items():
+        for section in sections:
+            section['intervals'] = _meeting_intervals(section)
+        groups.update(_schedule_components(course_code, sections))
+
+    pruned = 0
+    changed = True
+    while changed:
+        changed = False
+        for key, members in groups.items():
+            survivors = [
+                section for section in members
+                if not any(
+                    other_key != key and all(
+                        _sections_clash(section['intervals'], other['intervals'])
+                        for other in other_members)
+                    for other_key, other_members in groups.items())
+            ]
+            if survivors and len(survivors) < len(members):
+                pruned += len(members) - len(survivors)
+                groups[key] = survivors
+                changed = True
+
+    kept = {id(section) for members in groups.values() for section in members}
+    return {
+        course_code: [section for section in sections if id(section) in kept]
+        for course_code, sections in course_sections.items()
+    }, pruned
+
+
+# Search budget for repairing a near-miss AI schedule locally
+AI_REPAIR_MAX_NODES = 20000
+
+
+def _section_to_ai_classes(section):
+    """Response rows (one per meeting) for a catalog section"""
+    is_lab = section['schedule_type'].upper() == 'B' or 'lab' in section['schedule_type'].lower()
+    rows = []
+    for meeting in section['meetings']:
+        if meeting['begin'] and meeting['end']:
+            days, meeting_time = meeting['days'], f"{meeting['begin']} - {meeting['end']}"
+        else:
+            days = meeting_time = "Online" if 'online' in section['modality'].lower() else "ARR"
+        rows.append({
+            "crn": section['crn'],
+            "courseNumber": section['course_code'],
+            "courseName": section['title'],
+            "professorName": section['instructor'],
+            "days": days,
+            "time": meeting_time,
+            "location": meeting['location'] or "Online",
+            "isLab": is_lab
+        })
+    return rows
+
+
+def _section_violates_constraints(section, constraints):
+    """Check a merged section's meetings against the time-window and day-off
+    constraints, the same test apply_schedule_constraints runs per row"""
+    return any(_row_violates_constraints(
+        {'Days': meeting['days'], 'Begin Time': meeting['begin'], 'End Time': meeting['end']},
+        constraints) for meeting in section['meetings'])
+
+
+def _section_preference_score(section, weights, preferences):
+    """Rough per-section preference bonus, used to order repair candidates"""
+    score = 0
+    if section['instructor'] and section['instructor'].lower() in preferences:
+        score += weights['professor']
+    for _, start, _ in section['intervals']:
+        hour = start // 60
+        if MORNING_START_HOUR <= hour < AFTERNOON_START_HOUR:
+            score += weights['morning'] - weights['before_10_penalty']
+        elif AFTERNOON_START_HOUR <= hour < EVENING_START_HOUR:
+            score += weights['afternoon']
+        else:
+            score += weights['evening']
+    return score
+
+
+def repair_ai_schedule(classes, courses, courses_data, constraints=None, preferences=""):
+    """Salvage a near-miss AI schedule without another API call.
+
+    As the AI instructions require, every (course, schedule type) component
+    the course has needs one CRN, so a lecture is never kept without its
+    lab. Components the AI left out, invented a CRN for, or placed in a clash are
+    re-chosen from the catalog while the rest of the AI's picks stay fixed,
+    trying the AI's pick and then the sections the preferences favour first.
+    If that fails, all components are searched again. Sections breaking the
+    hard constraints are never picked, and no day may go over
+    max_classes_per_day. Returns the repaired class rows, or None if no valid
+    schedule was found within AI_REPAIR_MAX_NODES.
+    """
+    if not courses_data:
+        return None
+    constraints = constraints or {}
+    max_classes_per_day = constraints.get('max_classes_per_day')
+    weights = _preference_weights(preferences)
+    prefs = (preferences or "").lower()
+
+    components = OrderedDict()
+    by_crn = {}
+    for course in courses:
+        course_code = course['department'] + course['number']
+        df = courses_data.get(course_code)
+        if df is None or df.empty:
+            return None
+        sections = _merge_section_rows(df)
+        course_components = OrderedDict(
+            ((course_code, section['schedule_type'].lower()), []) for section in sections)
+        for section in sections:
+            if constraints and _section_violates_constraints(section, constraints):
+                continue
+            section['course_code'] = course_code
+            section['intervals'] = _meeting_intervals(section)
+            section['meeting_days'] = {day for day, _, _ in section['intervals']}
+            course_components[(course_code, section['schedule_type'].lower())].append(section)
+            by_crn[section['crn']] = section
+        # A component the constraints emptied can't be covered at all
+        if not all(course_components.values()):
+            return None
+        for key, options in course_components.items():
+            options.sort(key=lambda section: -_section_preference_score(section, weights, prefs))
+            components[key] = options
+
+    chosen = {}
+    for cls in classes:
+        section = by_crn.get(str(cls.get('crn', '')).strip())
+        if section is not None:
+            chosen.setdefault(
+                (section['course_code'], section['schedule_type'].lower()), section)
+
+    def fits(section, assignment):
+        if any(_sections_clash(section['intervals'], other['intervals'])
+               for other in assignment.values()):
+            return False
+        if max_classes_per_day:
+            for day in section['meeting_days']:
+                if 1 + sum(day in other['meeting_days']
+                           for other in assignment.values()) > max_classes_per_day:
+                    return False
+        return True
+
+    bad = {key for key in components if key not in chosen}
+    picked = [key for key in components if key in chosen]
+    kept = {}
+    for key in picked:
+        if fits(chosen[key], kept):
+            kept[key] = chosen[key]
+        else:
+            bad.add(key)
+
+    def search(fixed, free):
+        # Most constrained components first, the AI's pick tried first
+        free = sorted(free, key=lambda key: len(components[key]))
+        budget = [AI_REPAIR_MAX_NODES]
+        assignment = dict(fixed)
+
+        def place(index):
+            if index == len(free):
+                return True
+            key = free[index]
+            options = components[key]
+            if key in chosen:
+                options = [chosen[key]] + [s for s in options if s is not chosen[key]]
+            for section in options:
+                budget[0] -= 1
+                if budget[0] < 0:
+                    return False
+                if not fits(section, assignment):
+                    continue
+                assignment[key] = section
+                if place(index + 1):
+                    return True
+                del assignment[key]
+            return False
+
+        return assignment if place(0) else None
+
+    assignment = search(kept, bad)
+    if assignment is None and kept:
+        assignment = search({}, list(components))
+    if assignment is None:
+        return None
+
+    swapped = [key for key in components if chosen.get(key) is not assignment[key]]
+    print(
+        f"Repaired AI schedule locally, re-chose {len(swapped)} of {len(components)} components")
+    repaired = []
+    for key in components:
+        repaired.extend(_section_to_ai_classes(assignment[key]))
+
+    # The rows are rebuilt from catalog data, so check them the same way as
+    # the model's answer before handing them back
+    result = validate_schedule(
+        repaired, [course['department'] + course['number'] for course in courses])
+    if not result['valid'] or classes_over_daily_limit(repaired, max_classes_per_day):
+        return None
+    return repaired
+
+
+def build_ai_prompt(courses, courses_data, preferences, constraints=None, with_stats=True):
+    """Build a compact Gemini prompt from the (already filtered) course data.
+
+    Only the columns the model needs are kept, instructors and locations are
+    dictionary-encoded, additional-time rows are merged into their CRN and
+    sections that clash with every option of another component are dropped.
+    Returns (prompt, stats) where stats compares estimated token counts
+    against the raw CSV prompt; stats is None when with_stats is False,
+    which skips building the raw prompt.
+    """
+    course_sections = {}
+    for course in courses:
+        course_code = course['department'] + course['number']
+        df = courses_data.get(course_code)
+        course_sections[course_code] = _merge_section_rows(
+            df) if df is not None else []
+    sections_before = sum(len(sections) for sections in course_sections.values())
+    course_sections, pruned = prune_infeasible_sections(course_sections)
+
+    instructor_codes = {}
+    location_codes = {}
+
+    def encode(value, table, prefix):
+        if not value:
+            return ''
+        if value not in table:
+            table[value] = f"{prefix}{len(table) + 1}"
+        return table[value]
+
+    course_blocks = []
+    for course in courses:
+        course_code = course['department'] + course['number']
+        sections = course_sections[course_code]
+        lines = []
+        for section in sections:
+            meetings = []
+            for meeting in section['meetings']:
+                if meeting['begin'] and meeting['end']:
+                    meeting_time = f"{meeting['begin']}-{meeting['end']}".replace(' ', '')
+                else:
+                    meeting_time = meeting['begin'] or 'ARR'
+                location = encode(meeting['location'], location_codes, 'L')
+                meetings.append(
+                    f"{meeting['days'] or '-'} {meeting_time}" + (f" @{location}" if location else ''))
+            lines.append('|'.join([
+                section['crn'],
+                section['schedule_type'],
+                section['modality'],
+                encode(section['instructor'], instructor_codes, 'I'),
+                ';'.join(meetings)
+            ]))
+        title = sections[0]['title'] if sections else ''
+        block = f"<course_number>{course_code}</course_number>\n"
+        block += f"<course_name>{title}</course_name>\n"
+        block += f"<professor_preference>{course['professor']}</professor_preference>\n"
+        block += "<sections>\n" + "\n".join(lines) + "\n</sections>\n"
+        course_blocks.append(block)
+
+    ai_prompt = f"<preferences_by_user>\n{preferences}\n</preferences_by_user>\n"
+    if constraints and has_schedule_constraints(constraints):
+        ai_prompt += f"<hard_constraints>\n{describe_schedule_constraints(constraints)}\n</hard_constraints>\n"
+    ai_prompt += f"<section_format>{COMPACT_SECTION_FORMAT}</section_format>\n"
+    ai_prompt += "<instructors>" + ";".join(
+        f"{code}={name}" for name, code in instructor_codes.items()) + "</instructors>\n"
+    ai_prompt += "<locations>" + ";".join(
+        f"{code}={name}" for name, code in location_codes.items()) + "</locations>\n"
+    ai_prompt += "".join(course_blocks)
+    if not with_stats:
+        return ai_prompt, None
+
+    raw_tokens = estimate_tokens(_build_raw_ai_prompt(
+        courses, courses_data, preferences, constraints))
+    compact_tokens = estimate_tokens(ai_prompt)
+    stats = {
+        'raw_tokens_estimate': raw_tokens,
+        'compact_tokens_estimate': compact_tokens,
+        'token_reduction_percent': round(100 * (1 - compact_tokens / raw_tokens), 1) if raw_tokens else 0.0,
+        'sections_before': sections_before,
+        'sections_pruned': pruned
+    }
+    print(
+        f"Compact prompt: ~{compact_tokens} tokens (raw ~{raw_tokens}), {pruned} infeasible sections pruned")
+    return ai_prompt, stats
+
+
+def courseDetailsExractor(department: str, coursenumber, term_year: str, open_only: bool = False, crn: str = ""):
     try:
         url = "https://selfservice.banner.vt.edu/ssb/HZSKVTSC.P_ProcRequest"
         form_data = {
@@ -1922,8 +4458,8 @@ def courseDetailsExractor(department: str, coursenumber, term_year: str):
             "subj_code": department.upper(),
             "SCHDTYPE": "%",
             "CRSE_NUMBER": coursenumber,
-            "crn": "",
-            "open_only": "",
+            "crn": crn,
+            "open_only": "on" if open_only else "",
             "disp_comments_in": "Y",
             "sess_code": "%",
             "BTN_PRESSED": "FIND class sections",
@@ -1977,35 +4513,87 @@ def courseDetailsExractor(department: str, coursenumber, term_year: str):
         save_log_entry(message=f"Error extracting course details: {str(e)}")
 
 
+def best_local_schedule(courses_data, preferences, session=None, constraints=None):
+    """Best schedule the local solvers can find, used when the AI path is
+    stopped by its budget or the circuit breaker"""
+    genetic_stats = {}
+    genetic_schedule = genetic_optimizer.optimize(
+        courses_data, preferences, session=session, constraints=constraints,
+        stats=genetic_stats)
+    if genetic_schedule:
+        return {"classes": genetic_optimizer._convert_to_ai_format(genetic_schedule)}, genetic_stats
+    schedule, _ = smart_optimizer.optimize_schedule(
+        courses_data, preferences, constraints)
+    return schedule, genetic_stats
+
+
 @app.route("/api/generate_schedule", methods=['POST'])
 def generate_schedule():
     start_time = time.time()
     total_tokens_used = 0
     optimization_method = "unknown"
+    genetic_stats = None
+    prompt_stats = None
 
     print("Starting smart schedule generation")
     data = request.json
     courses = data.get("courses", [])
     preferences = data.get("preferences", "")
     email = data.get("email", None)
+    open_only = bool(data.get("open_only", False))
+    mode = data.get("mode", "auto")
+    try:
+        hedge_attempts = parse_int_field(data, "ai_hedge_attempts", None, 1, AI_HEDGE_POOL_SIZE)
+        ai_max_cost = parse_float_field(data, "ai_max_cost", None)
+    except ValueError as e:
+        return jsonify({"classes": [], "error": str(e)}), 400
+    try:
+        constraints = parse_schedule_constraints(data.get("constraints"))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return jsonify({"classes": [], "error": f"Invalid constraints: {e}"}), 400
 
     # Use smart optimization first
     try:
         # Clear expired cache entries
         clear_expired_cache()
+        session = get_solve_session(
+            data.get("session_id"), data['term_year'], create=bool(data.get("reuse_session")))
 
-        # Extract course data with caching
+        # Extract course data with caching; sessions never pin frames, so
+        # course data and seat counts refresh on their own TTLs
         courses_data = {}
         for course in courses:
             course_code = course['department'] + course['number']
             df = get_cached_course_data(
-                course['department'], course['number'], data['term_year'])
+                course['department'], course['number'], data['term_year'], open_only)
             if df is not None and not df.empty:
                 courses_data[course_code] = df
 
         if not courses_data:
             return jsonify({"classes": []}), 400
 
+        # Apply hard constraints as domain filters before any search
+        courses_data, unsatisfiable = apply_schedule_constraints(
+            courses_data, constraints)
+        if unsatisfiable:
+            return jsonify({"classes": [], "error": f"No sections satisfy the constraints for: {', '.join(unsatisfiable)}"}), 400
+
+        # Serve identical requests straight from the result cache
+        result_fingerprint = schedule_request_fingerprint(
+            data['term_year'], courses, preferences, courses_data,
+            extra={'endpoint': 'generate_schedule',
+                   'mode': mode,
+                   'max_classes_per_day': constraints['max_classes_per_day']})
+        cached_schedule = get_cached_result(result_fingerprint)
+        if cached_schedule is not None:
+            cached_schedule['performance_metrics'] = cached_result_metrics(
+                cached_schedule['performance_metrics'], start_time)
+            cached_schedule.pop('session_id', None)
+            if session is not None:
+                cached_schedule['session_id'] = session['id']
+            print("Serving schedule from result cache")
+            return jsonify(cached_schedule)
+
             # Check if courses have complex structures (labs, online, hybrid, multiple time blocks)
         has_complex_structure = False
         for course_code, df in courses_data.items():
@@ -2054,34 +4642,69 @@ def generate_schedule():
         print(
             f"Schedule complexity: {num_courses} courses, {total_sections} total sections, complex structure: {has_complex_structure}")
 
-        # Use AI approach for complex structures, smart optimization for simple ones
-        if has_complex_structure:
+        # Hybrid mode: one small AI call reads the preferences, the GA builds
+        # the schedule. Otherwise AI for complex structures, smart
+        # optimization for simple ones
+        if mode == "hybrid":
+            optimization_method = "hybrid"
+            print("Using hybrid mode: AI-interpreted preferences, local solver")
+            interpretation = interpret_preferences(preferences)
+            hybrid_data, hybrid_constraints = courses_data, constraints
+            try:
+                hybrid_constraints = merge_schedule_constraints(
+                    constraints, parse_schedule_constraints(interpretation['constraints']))
+                hybrid_data, unsatisfiable = apply_schedule_constraints(
+                    courses_data, hybrid_constraints)
+                if unsatisfiable:
+                    # Inferred constraints are best effort, the request's own still hold
+                    print(f"Ignoring inferred constraints, unsatisfiable for: {unsatisfiable}")
+                    hybrid_data, hybrid_constraints = courses_data, constraints
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"Ignoring malformed inferred constraints: {e}")
+
+            genetic_stats = {}
+            genetic_schedule = genetic_optimizer.optimize(
+                hybrid_data, preferences, session=session,
+                constraints=hybrid_constraints, weights=interpretation['weights'],
+                stats=genetic_stats)
+            schedule = {"classes": genetic_optimizer._convert_to_ai_format(
+                genetic_schedule) if genetic_schedule else []}
+            cost_info = interpretation['cost_info']
+            total_tokens_used = interpretation['tokens_used']
+            total_tokens = update_total_tokens(total_tokens_used)
+        elif has_complex_structure:
             optimization_method = "ai"
             print(
                 "Using AI approach for complex course structures (labs, online, hybrid)")
-            # Build AI prompt with raw data
-            ai_prompt = ""
-            ai_prompt += f"<preferences_by_user>\n{preferences}\n</preferences_by_user>\n"
-            for course in courses:
-                ai_prompt += f"<course_number>{course['department']+course['number']}</course_number>\n"
-                ai_prompt += f"<professor_preference>{course['professor']}</professor_preference>\n"
-                ai_prompt += f"<timetable_of_classes_for_the_course>\n"
-                df = get_cached_course_data(
-                    course['department'], course['number'], data['term_year'])
-                ai_prompt += df.to_csv(index=False)
-                ai_prompt += "\n</timetable_of_classes_for_the_course>"
-
-            schedule, tokens_used, cost_info = ai_maker(ai_prompt, courses)
+            # Build a compact AI prompt from the filtered data
+            ai_prompt, prompt_stats = build_ai_prompt(
+                courses, courses_data, preferences, constraints)
+
+            schedule, tokens_used, cost_info = ai_maker(
+                ai_prompt, courses, courses_data, hedge_attempts,
+                SEAT_CACHE_DURATION if open_only else CACHE_DURATION, ai_max_cost,
+                constraints, preferences)
             total_tokens_used = tokens_used
             total_tokens = update_total_tokens(tokens_used)
+            if not schedule['classes'] and cost_info.get('status') in AI_BUDGET_STOP_STATUSES:
+                optimization_method = "local_fallback"
+                print(f"AI stopped ({cost_info['status']}), using best local result")
+                schedule, genetic_stats = best_local_schedule(
+                    courses_data, preferences, session, constraints)
         else:
             # Use smart optimization for simple schedules
             print("Using smart optimization for simple schedule")
-            if num_courses > 3 or total_sections > 20:
+            exact_search_feasible = (
+                smart_optimizer.search_workers > 1 and
+                smart_optimizer.count_combinations(courses_data) <= EXACT_SEARCH_MAX_COMBINATIONS)
+
+            if (num_courses > 3 or total_sections > 20) and not exact_search_feasible:
                 optimization_method = "genetic"
                 print("Using genetic algorithm for complex schedule")
+                genetic_stats = {}
                 genetic_schedule = genetic_optimizer.optimize(
-                    courses_data, preferences)
+                    courses_data, preferences, session=session, constraints=constraints,
+                    stats=genetic_stats)
                 if genetic_schedule:
                     ai_schedule = genetic_optimizer._convert_to_ai_format(
                         genetic_schedule)
@@ -2091,12 +4714,12 @@ def generate_schedule():
                     print("Genetic algorithm failed, trying smart optimizer")
                     optimization_method = "constraint_satisfaction"
                     schedule, tokens_used = smart_optimizer.optimize_schedule(
-                        courses_data, preferences)
+                        courses_data, preferences, constraints)
             else:
                 optimization_method = "constraint_satisfaction"
                 print("Using smart optimizer for simple schedule")
                 schedule, tokens_used = smart_optimizer.optimize_schedule(
-                    courses_data, preferences)
+                    courses_data, preferences, constraints)
 
             if schedule['classes']:
                 total_tokens = get_total_tokens()  # No tokens used for smart optimization
@@ -2104,20 +4727,15 @@ def generate_schedule():
                 total_tokens = get_total_tokens()
 
         # If both optimizers fail, fall back to AI
-        if not schedule['classes']:
+        if not schedule['classes'] and optimization_method != "local_fallback":
             optimization_method = "ai_fallback"
             print("All optimizers failed, falling back to AI")
-            ai_prompt = ""
-            ai_prompt += f"<preferences_by_user>\n{preferences}\n</preferences_by_user>\n"
-            for course in courses:
-                ai_prompt += f"<course_number>{course['department']+course['number']}</course_number>\n"
-                ai_prompt += f"<professor_preference>{course['professor']}</professor_preference>\n"
-                ai_prompt += f"<timetable_of_classes_for_the_course>\n"
-                df = courseDetailsExractor(
-                    course['department'], course['number'], data['term_year'])
-                ai_prompt += df.to_csv(index=False)
-                ai_prompt += "\n</timetable_of_classes_for_the_course>"
-            schedule, tokens_used, cost_info = ai_maker(ai_prompt, courses)
+            ai_prompt, prompt_stats = build_ai_prompt(
+                courses, courses_data, preferences, constraints)
+            schedule, tokens_used, cost_info = ai_maker(
+                ai_prompt, courses, courses_data, hedge_attempts,
+                SEAT_CACHE_DURATION if open_only else CACHE_DURATION, ai_max_cost,
+                constraints, preferences)
             total_tokens_used = tokens_used
             total_tokens = update_total_tokens(tokens_used)
         else:
@@ -2139,9 +4757,15 @@ def generate_schedule():
             'courses_processed': len(courses),
             'total_sections_analyzed': sum(len(df) for df in courses_data.values())
         }
+        if genetic_stats:
+            schedule['performance_metrics']['genetic_stats'] = genetic_stats
+        if prompt_stats:
+            schedule['performance_metrics']['prompt_stats'] = prompt_stats
+        if session is not None:
+            schedule['session_id'] = session['id']
 
         # Add cost information if AI was used
-        if optimization_method in ['ai', 'ai_fallback', 'ai_exception_fallback']:
+        if optimization_method in ['ai', 'ai_fallback', 'ai_exception_fallback', 'hybrid', 'local_fallback']:
             schedule['performance_metrics']['cost_info'] = cost_info
             # Add detailed cost breakdown
             schedule['performance_metrics']['cost_breakdown'] = {
@@ -2176,6 +4800,11 @@ def generate_schedule():
         log_cost_data(request_data, schedule['performance_metrics'],
                       schedule['performance_metrics']['cost_info'], 'success')
 
+        # Degraded results made while the AI path was blocked aren't cached
+        if schedule['classes'] and optimization_method != "local_fallback":
+            store_cached_result(result_fingerprint, schedule,
+                                data['term_year'], courses_data.keys())
+
         return jsonify(schedule)
 
     except Exception as e:
@@ -2186,18 +4815,20 @@ def generate_schedule():
         print(f"Smart optimization error: {e}")
         save_log_entry(message=f"Smart optimization failed: {str(e)}")
 
-        # Fall back to AI method
-        ai_prompt = ""
-        ai_prompt += f"<preferences_by_user>\n{preferences}\n</preferences_by_user>\n"
+        # Fall back to AI method, still under the request's hard constraints
+        fallback_data = {}
         for course in courses:
-            ai_prompt += f"<course_number>{course['department']+course['number']}</course_number>\n"
-            ai_prompt += f"<professor_preference>{course['professor']}</professor_preference>\n"
-            ai_prompt += f"<timetable_of_classes_for_the_course>\n"
-            df = courseDetailsExractor(
-                course['department'], course['number'], data['term_year'])
-            ai_prompt += df.to_csv(index=False)
-            ai_prompt += "\n</timetable_of_classes_for_the_course>"
-        schedule, tokens_used, cost_info = ai_maker(ai_prompt, courses)
+            df = get_cached_course_data(
+                course['department'], course['number'], data['term_year'], open_only)
+            if df is not None and not df.empty:
+                fallback_data[course['department'] + course['number']] = df
+        fallback_data, _ = apply_schedule_constraints(fallback_data, constraints)
+        ai_prompt, _ = build_ai_prompt(
+            courses, fallback_data, preferences, constraints, with_stats=False)
+        schedule, tokens_used, cost_info = ai_maker(
+            ai_prompt, courses, fallback_data, hedge_attempts,
+            SEAT_CACHE_DURATION if open_only else CACHE_DURATION, ai_max_cost,
+            constraints, preferences)
         total_tokens_used = tokens_used
         total_tokens = update_total_tokens(tokens_used)
         log_msg = f"AI fallback schedule generation completed with {len(schedule['classes'])} classes | tokens used: {tokens_used} | total tokens: {total_tokens}"
@@ -2225,6 +4856,11 @@ def generate_schedule():
         return jsonify(schedule)
 
 
+# Request limits for generate_multiple_schedules
+MULTIPLE_SCHEDULES_MAX_OPTIONS = 10
+MULTIPLE_SCHEDULES_MAX_DIFFERING_CRNS = 20
+
+
 @app.route("/api/generate_multiple_schedules", methods=['POST'])
 def generate_multiple_schedules():
     """Generate multiple schedule options for comparison"""
@@ -2237,7 +4873,21 @@ def generate_multiple_schedules():
     courses = data.get("courses", [])
     preferences = data.get("preferences", "")
     email = data.get("email", None)
-    num_options = data.get("num_options", 3)
+    open_only = bool(data.get("open_only", False))
+    genetic_stats = None
+    prompt_stats = None
+    try:
+        hedge_attempts = parse_int_field(data, "ai_hedge_attempts", None, 1, AI_HEDGE_POOL_SIZE)
+        ai_max_cost = parse_float_field(data, "ai_max_cost", None)
+        num_options = parse_int_field(data, "num_options", 3, 1, MULTIPLE_SCHEDULES_MAX_OPTIONS)
+        min_differing_crns = parse_int_field(
+            data, "min_differing_crns", 1, 1, MULTIPLE_SCHEDULES_MAX_DIFFERING_CRNS)
+    except ValueError as e:
+        return jsonify({"schedules": [], "error": str(e)}), 400
+    try:
+        constraints = parse_schedule_constraints(data.get("constraints"))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return jsonify({"schedules": [], "error": f"Invalid constraints: {e}"}), 400
 
     try:
         # Extract course data with caching
@@ -2246,13 +4896,33 @@ def generate_multiple_schedules():
         for course in courses:
             course_code = course['department'] + course['number']
             df = get_cached_course_data(
-                course['department'], course['number'], data['term_year'])
+                course['department'], course['number'], data['term_year'], open_only)
             if df is not None and not df.empty:
                 courses_data[course_code] = df
 
         if not courses_data:
             return jsonify({"schedules": []}), 400
 
+        # Apply hard constraints as domain filters before any search
+        courses_data, unsatisfiable = apply_schedule_constraints(
+            courses_data, constraints)
+        if unsatisfiable:
+            return jsonify({"schedules": [], "error": f"No sections satisfy the constraints for: {', '.join(unsatisfiable)}"}), 400
+
+        # Serve identical requests straight from the result cache
+        result_fingerprint = schedule_request_fingerprint(
+            data['term_year'], courses, preferences, courses_data,
+            extra={'endpoint': 'generate_multiple_schedules',
+                   'num_options': num_options,
+                   'min_differing_crns': min_differing_crns,
+                   'max_classes_per_day': constraints['max_classes_per_day']})
+        cached_response = get_cached_result(result_fingerprint)
+        if cached_response is not None:
+            cached_response['performance_metrics'] = cached_result_metrics(
+                cached_response['performance_metrics'], start_time)
+            print("Serving schedule options from result cache")
+            return jsonify(cached_response)
+
             # Check if courses have complex structures (labs, online, hybrid, multiple time blocks)
         has_complex_structure = False
         for course_code, df in courses_data.items():
@@ -2281,19 +4951,28 @@ def generate_multiple_schedules():
             optimization_method = "ai"
             print("Using AI approach for multiple schedules with complex structures")
             # For complex structures, generate one AI schedule
-            ai_prompt = ""
-            ai_prompt += f"<preferences_by_user>\n{preferences}\n</preferences_by_user>\n"
-            for course in courses:
-                ai_prompt += f"<course_number>{course['department']+course['number']}</course_number>\n"
-                ai_prompt += f"<professor_preference>{course['professor']}</professor_preference>\n"
-                ai_prompt += f"<timetable_of_classes_for_the_course>\n"
-                df = get_cached_course_data(
-                    course['department'], course['number'], data['term_year'])
-                ai_prompt += df.to_csv(index=False)
-                ai_prompt += "\n</timetable_of_classes_for_the_course>"
-
-            schedule, tokens_used, cost_info = ai_maker(ai_prompt, courses)
+            ai_prompt, prompt_stats = build_ai_prompt(
+                courses, courses_data, preferences, constraints)
+
+            schedule, tokens_used, cost_info = ai_maker(
+                ai_prompt, courses, courses_data, hedge_attempts,
+                SEAT_CACHE_DURATION if open_only else CACHE_DURATION, ai_max_cost,
+                constraints, preferences)
             total_tokens_used = tokens_used
+            schedules = []
+            if not schedule['classes'] and cost_info.get('status') in AI_BUDGET_STOP_STATUSES:
+                optimization_method = "local_fallback"
+                print(f"AI stopped ({cost_info['status']}), using best local results")
+                genetic_stats = {}
+                top_schedules = genetic_optimizer.optimize_top_k(
+                    courses_data, preferences, k=num_options,
+                    min_differing_crns=min_differing_crns, constraints=constraints,
+                    stats=genetic_stats)
+                schedules = [{
+                    "id": i + 1,
+                    "classes": genetic_optimizer._convert_to_ai_format(genetic_schedule),
+                    "score": score
+                } for i, (genetic_schedule, score) in enumerate(top_schedules)]
             if schedule['classes']:
                 schedules = [{
                     "id": 1,
@@ -2302,7 +4981,7 @@ def generate_multiple_schedules():
                 }]
         else:
             optimization_method = "genetic_multiple"
-            # Generate multiple schedules using genetic algorithm
+            # Generate multiple schedules from a single genetic run
             print(f"Generating {num_options} schedule options")
 
             # Configure genetic optimizer for multiple solutions
@@ -2312,30 +4991,19 @@ def generate_multiple_schedules():
                 mutation_rate=0.15
             )
 
-            schedules = []
-            seen_schedules = set()
-
-            for i in range(num_options):
-                print(f"Generating schedule option {i+1}")
-                genetic_schedule = multi_optimizer.optimize(
-                    courses_data, preferences)
-
-                if genetic_schedule:
-                    # Convert to AI format
-                    ai_schedule = multi_optimizer._convert_to_ai_format(
-                        genetic_schedule)
-
-                    # Create unique identifier for this schedule
-                    schedule_id = hash(
-                        tuple(sorted([(cls['crn'], cls['time'], cls['days']) for cls in ai_schedule])))
+            genetic_stats = {}
+            top_schedules = multi_optimizer.optimize_top_k(
+                courses_data, preferences, k=num_options,
+                min_differing_crns=min_differing_crns, constraints=constraints,
+                stats=genetic_stats)
 
-                    if schedule_id not in seen_schedules:
-                        seen_schedules.add(schedule_id)
-                        schedules.append({
-                            "id": i + 1,
-                            "classes": ai_schedule,
-                            "score": multi_optimizer._calculate_fitness(genetic_schedule, preferences)
-                        })
+            schedules = []
+            for i, (genetic_schedule, score) in enumerate(top_schedules):
+                schedules.append({
+                    "id": i + 1,
+                    "classes": multi_optimizer._convert_to_ai_format(genetic_schedule),
+                    "score": score
+                })
 
         # Sort by score
         schedules.sort(key=lambda x: x['score'], reverse=True)
@@ -2360,9 +5028,13 @@ def generate_multiple_schedules():
                 'schedules_generated': len(schedules)
             }
         }
+        if genetic_stats:
+            response_data['performance_metrics']['genetic_stats'] = genetic_stats
+        if prompt_stats:
+            response_data['performance_metrics']['prompt_stats'] = prompt_stats
 
         # Add cost information if AI was used
-        if optimization_method == 'ai':
+        if optimization_method in ['ai', 'local_fallback']:
             response_data['performance_metrics']['cost_info'] = cost_info
             # Add detailed cost breakdown
             response_data['performance_metrics']['cost_breakdown'] = {
@@ -2394,6 +5066,11 @@ def generate_multiple_schedules():
         log_cost_data(request_data, response_data['performance_metrics'],
                       response_data['performance_metrics']['cost_info'], 'success')
 
+        # Degraded results made while the AI path was blocked aren't cached
+        if schedules and optimization_method != "local_fallback":
+            store_cached_result(result_fingerprint, response_data,
+                                data['term_year'], courses_data.keys())
+
         return jsonify(response_data)
 
     except Exception as e:
@@ -2420,14 +5097,177 @@ def downloadSchedule():
         schedule = request.json.get("schedule", [])
         schedule = schedule['classes']
         colorsV = request.json.get("crnColors")
-        pdf_buffer = generate_schedule_pdf(schedule, colorsV)
+        validation = validate_schedule(schedule)
+        conflict_crns = set()
+        for conflict in validation['conflicts']:
+            conflict_crns.update((conflict['crn_a'], conflict['crn_b']))
+        if conflict_crns:
+            save_log_entry(
+                message=f"PDF requested for a schedule with {len(validation['conflicts'])} conflicts")
+        pdf_buffer = generate_schedule_pdf(schedule, colorsV, conflict_crns)
         save_log_entry(message="PDF generated successfully")
-        return send_file(pdf_buffer, as_attachment=True, download_name="schedule.pdf", mimetype='application/pdf')
+        response = send_file(pdf_buffer, as_attachment=True, download_name="schedule.pdf", mimetype='application/pdf')
+        response.headers['X-Schedule-Conflicts'] = str(len(validation['conflicts']))
+        return response
     except Exception as e:
         save_log_entry(message=e)
         return {"error": str(e)}, 500
 
 
+@app.route("/api/validate_schedule", methods=['POST'])
+def validate_schedule_endpoint():
+    """Check a schedule for clashes and, given courses, for missing courses"""
+    data = request.json or {}
+    classes = data.get("classes")
+    if classes is None and isinstance(data.get("schedule"), dict):
+        classes = data["schedule"].get("classes")
+    if not isinstance(classes, list):
+        return jsonify({"error": "classes must be a list"}), 400
+
+    required_courses = None
+    if data.get("courses") is not None:
+        required_courses = [course if isinstance(course, str) else course['department'] + course['number']
+                            for course in data["courses"]]
+    try:
+        min_gap = parse_int_field(data, "min_gap_minutes", AI_MIN_GAP_MINUTES, 0, 240)
+        return jsonify(validate_schedule(classes, required_courses, min_gap))
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        return jsonify({"error": f"Invalid schedule: {e}"}), 400
+
+
+@app.route("/api/check_crns", methods=['POST'])
+def check_crns():
+    """Check a candidate set of CRNs for clashes and gaps without a solve"""
+    start_time = time.perf_counter()
+    data = request.json or {}
+    term_year = data.get("term_year")
+    crns = list(dict.fromkeys(str(crn).strip() for crn in data.get("crns") or [] if str(crn).strip()))
+    if not term_year or not crns:
+        return jsonify({"error": "term_year and crns are required"}), 400
+    if len(crns) > CHECK_CRNS_MAX_CRNS:
+        return jsonify({"error": f"At most {CHECK_CRNS_MAX_CRNS} CRNs per request"}), 400
+    try:
+        min_gap = parse_int_field(data, "min_gap_minutes", AI_MIN_GAP_MINUTES, 0, 240)
+        hints = parse_course_hints(data.get("courses") or [])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    prune_section_index()
+    # Optional course hints load each course's full section list into the index
+    for department, number in hints:
+        get_cached_course_data(department, number, term_year)
+    found, unknown = lookup_sections(
+        term_year, crns, fetch_missing=bool(data.get("fetch_missing", True)))
+
+    intervals_by_day = defaultdict(list)
+    components = defaultdict(list)
+    for crn, section in found.items():
+        components[(section['course_code'], section['schedule_type'])].append(crn)
+        for day, start, end in section['intervals']:
+            intervals_by_day[day].append((start, end, crn))
+
+    conflicts = []
+    for day, crn_a, crn_b, overlap in _sweep_conflicts(intervals_by_day, min_gap):
+        if crn_a == crn_b:
+            continue
+        conflicts.append({
+            'day': day,
+            'crn_a': crn_a,
+            'course_a': found[crn_a]['course_code'],
+            'crn_b': crn_b,
+            'course_b': found[crn_b]['course_code'],
+            'overlap_minutes': max(0, overlap),
+            'kind': 'overlap' if overlap > 0 else 'gap'
+        })
+    duplicates = [{'course': course_code, 'schedule_type': schedule_type, 'crns': component_crns}
+                  for (course_code, schedule_type), component_crns in components.items()
+                  if len(component_crns) > 1]
+
+    return jsonify({
+        'valid': not conflicts and not duplicates and not unknown,
+        'sections': [{key: found[crn][key] for key in
+                      ('crn', 'course_code', 'title', 'schedule_type', 'modality', 'instructor', 'meetings')}
+                     for crn in crns if crn in found],
+        'unknown_crns': unknown,
+        'conflicts': conflicts,
+        'duplicate_components': duplicates,
+        'gap_stats': schedule_gap_stats(intervals_by_day),
+        'server_time_ms': round((time.perf_counter() - start_time) * 1000, 3)
+    })
+
+
+@app.route("/api/find_free_sections", methods=['POST'])
+def find_free_sections():
+    """Sections of the given courses (or a whole subject) that fit into the
+    free time of a current schedule"""
+    start_time = time.perf_counter()
+    data = request.json or {}
+    term_year = data.get("term_year")
+    subject = str(data.get("subject") or "").upper().strip()
+    schedule_crns = list(dict.fromkeys(
+        str(crn).strip() for crn in data.get("crns") or [] if str(crn).strip()))
+    classes = data.get("classes") or []
+    try:
+        courses = parse_course_hints(data.get("courses") or [])
+        min_gap = parse_int_field(data, "min_gap_minutes", AI_MIN_GAP_MINUTES, 0, 240)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if subject and not DEPARTMENT_PATTERN.match(subject):
+        return jsonify({"error": "subject must be a department code like CS"}), 400
+    if not isinstance(classes, list) or not all(isinstance(cls, dict) for cls in classes):
+        return jsonify({"error": "classes must be a list of class objects"}), 400
+    if not term_year or not (courses or subject):
+        return jsonify({"error": "term_year and courses or subject are required"}), 400
+    if len(schedule_crns) > CHECK_CRNS_MAX_CRNS:
+        return jsonify({"error": f"At most {CHECK_CRNS_MAX_CRNS} CRNs per request"}), 400
+
+    prune_section_index()
+    # Load the target courses into the section index from the cached catalog
+    if subject:
+        get_cached_course_data(subject, "", term_year)
+        target_codes = [code for code in section_index_courses[term_year]
+                        if code.startswith(subject) and code[len(subject):][:1].isdigit()]
+    else:
+        target_codes = []
+        for department, number in courses:
+            get_cached_course_data(department, number, term_year)
+            target_codes.append(department + number)
+
+    # Busy time from the current schedule's CRNs and/or response-format classes
+    busy = []
+    found, unknown = lookup_sections(term_year, schedule_crns, fetch_missing=True)
+    for section in found.values():
+        busy.extend(section['intervals'])
+    for cls in classes:
+        interval = parse_time_range(cls.get("time"))
+        if interval is not None:
+            busy.extend((day, interval[0], interval[1]) for day in _parse_day_codes(cls.get("days", "")))
+
+    blocked = set(schedule_crns)
+    for day, busy_start, busy_end in busy:
+        blocked |= sections_meeting_during(term_year, day, busy_start, busy_end, min_gap)
+
+    include_untimed = data.get("include_untimed", True)
+    index = section_index[term_year]
+    fitting = []
+    for code in target_codes:
+        for crn in section_index_courses[term_year].get(code, []):
+            section = index.get(crn)
+            if section is None or crn in blocked:
+                continue
+            if not section['intervals'] and not include_untimed:
+                continue
+            fitting.append({key: section[key] for key in
+                            ('crn', 'course_code', 'title', 'schedule_type', 'modality', 'instructor', 'meetings')})
+
+    return jsonify({
+        'sections': fitting,
+        'courses_searched': target_codes,
+        'unknown_crns': unknown,
+        'server_time_ms': round((time.perf_counter() - start_time) * 1000, 3)
+    })
+
+
 @app.route("/api/get_logs", methods=['POST'])
 def get_logs():
     try:
@@ -2466,6 +5306,31 @@ def company_cost_summary():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/ai_cache_stats", methods=['GET'])
+def ai_cache_stats():
+    """Hit rate and savings of the on-disk AI response cache"""
+    lookups = ai_response_cache_stats['hits'] + ai_response_cache_stats['misses']
+    return jsonify({
+        **ai_response_cache_stats,
+        'cost_saved': round(ai_response_cache_stats['cost_saved'], 4),
+        'hit_rate': round(ai_response_cache_stats['hits'] / lookups, 3) if lookups else 0.0
+    }), 200
+
+
+@app.route("/api/model_routing_stats", methods=['GET'])
+def model_routing_stats():
+    """Router view of each model for a prompt of ?prompt_tokens= size"""
+    prompt_tokens = request.args.get('prompt_tokens', 5000, type=int)
+    models = list(dict.fromkeys(
+        [os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp"), "gemini-2.5-pro",
+         "gemini-2.5-flash-lite"] + list(model_telemetry)))
+    return jsonify({
+        'routing': AI_MODEL_ROUTING,
+        'prompt_tokens': prompt_tokens,
+        'models': {model: model_route_stats(model, prompt_tokens) for model in models}
+    }), 200
+
+
 @app.route("/api/download_cost_data", methods=['GET'])
 def download_cost_data():
     """Download cost tracking CSV file"""
@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# app writes its logs, token totals and caches to the working directory on
+# import, so the tests run from a scratch directory with the mock backend
+os.chdir(tempfile.mkdtemp(prefix="schedule-tests-"))
+os.environ["GEMINI_BACKEND"] = "mock"
+os.environ["MOCK_GEMINI_LATENCY"] = "0"
+os.environ["MOCK_GEMINI_SEED"] = "1"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def timetable_row(crn, course, schedule_type, instructor, days, begin, end, location,
+                  title="Data Structures"):
+    return {
+        'CRN': crn, 'Course': course, 'Title': title, 'Schedule Type': schedule_type,
+        'Modality': 'Face-to-Face Instruction', 'Credit Hours': '3', 'Capacity': '30',
+        'Instructor': instructor, 'Days': days, 'Begin Time': begin, 'End Time': end,
+        'Location': location, 'Exam Code': '03T'
+    }
+
+
+@pytest.fixture
+def courses_data():
+    """Two small courses; CS2114 has an additional-times row and a lab"""
+    cs = pd.DataFrame([
+        timetable_row('1', 'CS-2114', 'L', 'Smith J', 'MWF', '9:05AM', '9:55AM', 'MCB 100'),
+        timetable_row('', '* Additional Times *', '', '', 'T', '2:00PM', '3:15PM', 'MCB 200'),
+        timetable_row('2', 'CS-2114', 'L', 'Smith J', 'MWF', '10:10AM', '11:00AM', 'MCB 100'),
+        timetable_row('3', 'CS-2114', 'B', 'Lee K', 'R', '9:00AM', '9:50AM', 'MCB 300'),
+    ])
+    math = pd.DataFrame([
+        timetable_row('9', 'MATH-1225', 'L', 'Jones', 'MWF', '9:05AM', '9:55AM', 'MCB 100', 'Calc'),
+        timetable_row('8', 'MATH-1225', 'L', 'Jones', 'MWF', '10:00AM', '10:50AM', 'MCB 100', 'Calc'),
+    ])
+    return {'CS2114': cs, 'MATH1225': math}
+
+
+@pytest.fixture
+def courses():
+    return [{'department': 'CS', 'number': '2114', 'professor': ''},
+            {'department': 'MATH', 'number': '1225', 'professor': 'Jones'}]
+
+
+@pytest.fixture(autouse=True)
+def reset_ai_state(monkeypatch):
+    """Fresh breaker, spend window and response cache for every test"""
+    app.ai_breaker.update(opened_at=None, trial_in_flight=False)
+    app.upstream_outcomes.clear()
+    app.ai_spend_log.clear()
+    monkeypatch.setattr(app, "save_log_entry", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, "load_ai_response", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, "store_ai_response", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, "record_model_attempt", lambda *args, **kwargs: None)
+    yield
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+@pytest.fixture
+def serve_catalog(monkeypatch):
+    """Serve schedule endpoints from in-memory course data instead of Banner"""
+    def serve(data):
+        monkeypatch.setattr(app, "get_cached_course_data",
+                            lambda department, number, term_year, open_only=False:
+                            data.get(department + number))
+        monkeypatch.setattr(app, "schedule_result_cache", app.OrderedDict())
+        monkeypatch.setattr(app, "solve_sessions", app.OrderedDict())
+        monkeypatch.setattr(app, "log_cost_data", lambda *args, **kwargs: None)
+        monkeypatch.setattr(app, "update_total_tokens", lambda tokens: 0)
+        return data
+    return serve
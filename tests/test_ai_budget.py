@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+
+import app
+
+# conftest stubs save_log_entry out for every test; keep the real one
+save_log_entry = app.save_log_entry
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def open_breaker(age):
+    app.ai_breaker.update(opened_at=time.time() - age, trial_in_flight=False)
+
+
+def count_mock_calls(monkeypatch):
+    calls = []
+    original = app.MockGenerativeModel.generate_content
+
+    def generate_content(self, prompt, generation_config=None):
+        calls.append(self.model_name)
+        return original(self, prompt, generation_config)
+    monkeypatch.setattr(app.MockGenerativeModel, "generate_content", generate_content)
+    return calls
+
+
+def test_breaker_opens_on_error_rate():
+    for _ in range(app.AI_BREAKER_MIN_CALLS):
+        app.record_upstream_result(False)
+    assert app.ai_breaker['opened_at'] is not None
+    assert app.ai_breaker_acquire() is None
+
+
+def test_breaker_stays_closed_below_min_calls():
+    for _ in range(app.AI_BREAKER_MIN_CALLS - 1):
+        app.record_upstream_result(False)
+    assert app.ai_breaker_acquire() == 'closed'
+
+
+def test_half_open_hands_out_one_trial():
+    open_breaker(app.AI_BREAKER_COOLDOWN + 1)
+    assert app.ai_breaker_acquire() == 'trial'
+    assert app.ai_breaker_acquire() is None
+    app.record_upstream_result(True, trial=True)
+    assert app.ai_breaker['opened_at'] is None
+    assert app.ai_breaker_acquire() == 'closed'
+
+
+def test_failed_trial_reopens():
+    open_breaker(app.AI_BREAKER_COOLDOWN + 1)
+    assert app.ai_breaker_acquire() == 'trial'
+    app.record_upstream_result(False, trial=True)
+    assert not app.ai_breaker['trial_in_flight']
+    assert app.ai_breaker_acquire() is None
+
+
+def test_released_trial_can_be_taken_again():
+    open_breaker(app.AI_BREAKER_COOLDOWN + 1)
+    assert app.ai_breaker_acquire() == 'trial'
+    app.ai_breaker_release_trial()
+    assert app.ai_breaker_acquire() == 'trial'
+
+
+def test_open_breaker_stops_ai_maker(monkeypatch, courses, courses_data):
+    calls = count_mock_calls(monkeypatch)
+    open_breaker(0)
+    prompt, _ = app.build_ai_prompt(courses, courses_data, "")
+    schedule, _, cost_info = app.ai_maker(prompt, courses, courses_data)
+    assert schedule['classes'] == []
+    assert cost_info['status'] == 'circuit_open'
+    assert calls == []
+
+
+def test_half_open_round_sends_a_single_call(monkeypatch, courses, courses_data):
+    calls = count_mock_calls(monkeypatch)
+    open_breaker(app.AI_BREAKER_COOLDOWN + 1)
+    prompt, _ = app.build_ai_prompt(courses, courses_data, "")
+    schedule, _, _ = app.ai_maker(prompt, courses, courses_data, hedge_attempts=3)
+    assert schedule['classes']
+    assert len(calls) == 1
+    wait_for(lambda: not app.ai_breaker['trial_in_flight'])
+    assert app.ai_breaker['opened_at'] is None
+
+
+def test_hedge_cap_stop_does_not_leak_trial(monkeypatch, courses, courses_data):
+    calls = count_mock_calls(monkeypatch)
+    monkeypatch.setattr(app, "AI_HEDGE_MAX_COST", 0.0)
+    open_breaker(app.AI_BREAKER_COOLDOWN + 1)
+    prompt, _ = app.build_ai_prompt(courses, courses_data, "")
+    app.ai_maker(prompt, courses, courses_data, hedge_attempts=2)
+    assert calls == []
+    assert not app.ai_breaker['trial_in_flight']
+    assert app.ai_breaker_acquire() == 'trial'
+
+
+def test_request_cap_stops_before_calling(monkeypatch, courses, courses_data):
+    calls = count_mock_calls(monkeypatch)
+    prompt, _ = app.build_ai_prompt(courses, courses_data, "")
+    _, _, cost_info = app.ai_maker(prompt, courses, courses_data, max_cost=0.0)
+    assert cost_info['status'] == 'request_budget_exceeded'
+    assert calls == []
+
+
+def test_global_budget_stop_reason(monkeypatch):
+    monkeypatch.setattr(app, "AI_GLOBAL_DAILY_BUDGET", 1.0)
+    app.record_ai_spend(0.99)
+    assert app.ai_budget_stop_reason(0.0, 0, 0.02, 100) == 'global_budget_exceeded'
+    assert app.ai_budget_stop_reason(0.0, 0, 0.005, 100) is None
+
+
+def test_abandoned_hedged_attempts_are_billed(monkeypatch, courses, courses_data):
+    original = app.MockGenerativeModel.generate_content
+
+    def generate_content(self, prompt, generation_config=None):
+        if self.model_name == "gemini-2.5-pro":
+            time.sleep(0.3)
+        return original(self, prompt, generation_config)
+    monkeypatch.setattr(app.MockGenerativeModel, "generate_content", generate_content)
+    monkeypatch.setattr(app, "AI_HEDGE_MODELS", ["gemini-2.5-pro"])
+    monkeypatch.setattr(app, "AI_MODEL_ROUTING", "static")
+
+    prompt, _ = app.build_ai_prompt(courses, courses_data, "")
+    schedule, _, cost_info = app.ai_maker(prompt, courses, courses_data, hedge_attempts=2)
+    assert schedule['classes']
+    assert cost_info['attempts_in_flight'] == 1
+    assert wait_for(lambda: len(app.ai_spend_log) == 2)
+    assert app.global_ai_spend() > cost_info['cumulative_cost']
+
+
+def test_log_entries_from_many_threads_keep_the_log_valid():
+    with open(app.log_file) as f:
+        before = len(json.load(f))
+    threads = [threading.Thread(target=lambda: [save_log_entry(message=f"entry {i}")
+                                                for i in range(10)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(app.log_file) as f:
+        assert len(json.load(f)) == before + 80
+
+
+def test_invalid_json_reply_is_logged_by_the_caller(monkeypatch):
+    logged = []
+    monkeypatch.setattr(app, "save_log_entry", lambda *a, **kw: logged.append(
+        (threading.current_thread(), kw.get('message'))))
+    monkeypatch.setattr(app.MockGenerativeModel, "generate_content", lambda self, prompt, generation_config=None: type(
+        "Reply", (), {"text": "not json", "usage_metadata": None})())
+    app.ai_maker("prompt", [{'department': 'CS', 'number': '2114', 'professor': ''}],
+                 hedge_attempts=2, max_cost=0.001)
+    assert "Invalid JSON response, retrying..." in [message for _, message in logged]
+    assert all(thread is threading.current_thread() for thread, _ in logged)
@@ -0,0 +1,135 @@
+import pandas as pd
+
+import app
+from conftest import timetable_row
+
+
+def merged(courses_data):
+    return {code: app._merge_section_rows(df) for code, df in courses_data.items()}
+
+
+def crns(course_sections, code):
+    return [section['crn'] for section in course_sections[code]]
+
+
+def test_prune_keeps_sections_clashing_only_with_an_optional_lab(courses_data):
+    # MATH CRN 7 clashes with the only CS lab, but CS can be covered by a
+    # lecture alone, so CRN 7 is still a valid pick
+    courses_data['MATH1225'] = pd.concat([courses_data['MATH1225'], pd.DataFrame([
+        timetable_row('7', 'MATH-1225', 'L', 'Jones', 'R', '9:00AM', '9:50AM', 'MCB 100'),
+    ])], ignore_index=True)
+    pruned, count = app.prune_infeasible_sections(merged(courses_data))
+    assert count == 0
+    assert '7' in crns(pruned, 'MATH1225')
+    assert crns(pruned, 'CS2114') == ['1', '2', '3']
+
+
+def test_prune_drops_sections_clashing_with_a_required_course(courses_data):
+    courses_data['ENGL1105'] = pd.DataFrame([
+        timetable_row('5', 'ENGL-1105', 'L', 'Park', 'MWF', '9:05AM', '9:55AM', 'SHN 1'),
+    ])
+    pruned, count = app.prune_infeasible_sections(merged(courses_data))
+    # ENGL forces MATH into CRN 8, which in turn rules out CS lecture 2
+    assert count == 3
+    assert crns(pruned, 'MATH1225') == ['8']
+    assert crns(pruned, 'CS2114') == ['3']
+
+
+def ai_rows(courses_data, *picks):
+    """Response rows for (course_code, crn) picks, as the model would send them"""
+    rows = []
+    for course_code, crn in picks:
+        for section in app._merge_section_rows(courses_data[course_code]):
+            if section['crn'] == crn:
+                section['course_code'] = course_code
+                rows.extend(app._section_to_ai_classes(section))
+    return rows
+
+
+def scheduled_crns(classes):
+    return {cls['crn'] for cls in classes}
+
+
+def test_repair_keeps_the_lab_and_fixes_clash(courses_data, courses):
+    classes, repaired, problems = app.validate_ai_schedule(
+        {"classes": ai_rows(courses_data, ('CS2114', '1'), ('CS2114', '3'), ('MATH1225', '9'))},
+        courses, courses_data)
+    assert repaired and problems['conflicts']
+    assert scheduled_crns(classes) == {'1', '3', '8'}
+
+
+def with_lab_clash(courses_data, math_crns):
+    """Keep only the given MATH sections plus CRN 7, which clashes with the CS lab"""
+    math = courses_data['MATH1225']
+    courses_data['MATH1225'] = pd.concat([math[math['CRN'].isin(math_crns)], pd.DataFrame([
+        timetable_row('7', 'MATH-1225', 'L', 'Jones', 'R', '9:00AM', '9:50AM', 'MCB 100'),
+    ])], ignore_index=True)
+    return ai_rows(courses_data, ('CS2114', '1'), ('CS2114', '3'), ('MATH1225', '7'))
+
+
+def test_repair_moves_the_other_course_off_a_clashing_lab(courses_data, courses):
+    classes, repaired, _ = app.validate_ai_schedule(
+        {"classes": with_lab_clash(courses_data, ['9', '8'])}, courses, courses_data)
+    assert repaired
+    assert scheduled_crns(classes) == {'1', '3', '8'}
+
+
+def test_repair_never_drops_a_lab(courses_data, courses):
+    classes, repaired, _ = app.validate_ai_schedule(
+        {"classes": with_lab_clash(courses_data, [])}, courses, courses_data)
+    assert classes is None and not repaired
+
+
+def test_repair_respects_max_classes_per_day(courses_data, courses):
+    courses_data['ENGL1105'] = pd.DataFrame([
+        timetable_row('5', 'ENGL-1105', 'L', 'Park', 'MWF', '1:00PM', '1:50PM', 'SHN 1'),
+        timetable_row('6', 'ENGL-1105', 'L', 'Park', 'TR', '1:00PM', '1:50PM', 'SHN 1'),
+    ])
+    courses = courses + [{'department': 'ENGL', 'number': '1105', 'professor': ''}]
+    constraints = app.parse_schedule_constraints({'max_classes_per_day': 2})
+    classes, repaired, _ = app.validate_ai_schedule(
+        {"classes": ai_rows(courses_data, ('CS2114', '1'), ('CS2114', '3'),
+                            ('MATH1225', '8'), ('ENGL1105', '5'))},
+        courses, courses_data, constraints)
+    assert repaired
+    assert scheduled_crns(classes) == {'1', '3', '8', '6'}
+    assert not app.classes_over_daily_limit(classes, 2)
+
+
+def test_repair_never_picks_sections_breaking_constraints(courses_data, courses):
+    constraints = app.parse_schedule_constraints({'days_off': 'MW'})
+    classes, repaired, _ = app.validate_ai_schedule(
+        {"classes": ai_rows(courses_data, ('CS2114', '3'))},
+        courses, courses_data, constraints)
+    # Every MATH section meets MWF, so nothing can satisfy the request
+    assert classes is None and not repaired
+
+
+def test_repair_prefers_named_professor(courses_data, courses):
+    courses_data['MATH1225'].loc[1, 'Instructor'] = 'Nguyen'
+    classes, repaired, _ = app.validate_ai_schedule(
+        {"classes": ai_rows(courses_data, ('CS2114', '3'))},
+        courses, courses_data, preferences="I like Nguyen")
+    assert repaired
+    assert scheduled_crns(classes) == {'1', '3', '8'}
+
+
+def test_retry_prompt_keeps_preferences_and_constraints(monkeypatch, courses_data, courses):
+    def raw_prompt(*args, **kwargs):
+        raise AssertionError("retries don't need the raw prompt stats")
+    monkeypatch.setattr(app, "_build_raw_ai_prompt", raw_prompt)
+    constraints = app.parse_schedule_constraints({'earliest_start': '9:00AM'})
+    problems = {'missing': [], 'extra': [], 'unknown_crns': [],
+                'conflicts': [('CS2114', 'MATH1225', 'M')]}
+    prompt, kept, retry_courses = app.build_ai_retry_prompt(
+        ai_rows(courses_data, ('CS2114', '1'), ('MATH1225', '9')), problems,
+        courses, courses_data, "No Friday labs", constraints)
+
+    assert retry_courses == [courses[1]]
+    assert scheduled_crns(kept) == {'1'}
+    assert "- CS2114 and MATH1225 overlap on M" in prompt
+    assert "<fixed_classes>\nCS2114|1|MWF|9:05AM - 9:55AM" in prompt
+    assert "<preferences_by_user>\nNo Friday labs\n</preferences_by_user>" in prompt
+    assert f"<hard_constraints>\n{app.describe_schedule_constraints(constraints)}\n" in prompt
+    assert "<course_number>MATH1225</course_number>" in prompt
+    assert "<course_number>CS2114</course_number>" not in prompt
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("capacity, expected", [
+    ('30', (None, 30)),
+    ('4/30', (4, 30)),
+    (' 0 / 25 ', (0, 25)),
+    ('-2/30', (0, 30)),
+    ('Full', (0, None)),
+    ('FULL 0/30', (0, 30)),
+    ('', (None, None)),
+    (None, (None, None)),
+    ('TBA', (None, None)),
+])
+def test_parse_capacity(capacity, expected):
+    assert app.parse_capacity(capacity) == expected
+
+
+def test_filter_full_sections_drops_every_row_of_a_full_crn(courses_data):
+    df = courses_data['CS2114'].copy()
+    df.loc[0, 'Capacity'] = 'Full 0/30'
+    df.loc[1, 'Capacity'] = ''
+    df.loc[2, 'Capacity'] = '5/30'
+    filtered = app.filter_full_sections(df)
+    # CRN 1's additional-times row goes with it instead of attaching to CRN 2
+    assert filtered['CRN'].tolist() == ['2', '3']
+
+
+def test_filter_full_sections_drops_crn_with_full_additional_times(courses_data):
+    df = courses_data['CS2114'].copy()
+    df.loc[1, 'Capacity'] = '0/30'
+    assert app.filter_full_sections(df)['CRN'].tolist() == ['2', '3']
+
+
+def test_filter_full_sections_keeps_open_and_unknown_capacity(courses_data):
+    df = courses_data['MATH1225'].copy()
+    df['Capacity'] = ['TBA', '1/40']
+    assert app.filter_full_sections(df) is df
+    assert app.filter_full_sections(pd.DataFrame()).empty
+    assert app.filter_full_sections(None) is None
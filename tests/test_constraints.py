@@ -0,0 +1,55 @@
+import pytest
+
+import app
+
+
+def crns(df):
+    return sorted(crn for crn in df['CRN'] if crn)
+
+
+@pytest.mark.parametrize("value", [-1, 0, "0", "two", 2.5, True])
+def test_bad_max_classes_per_day_is_rejected(value):
+    with pytest.raises(ValueError):
+        app.parse_schedule_constraints({'max_classes_per_day': value})
+
+
+def test_constraints_are_normalized():
+    constraints = app.parse_schedule_constraints({
+        'max_classes_per_day': "3", 'days_off': 'f', 'earliest_start': '9:30 am',
+        'blocked_windows': [{'days': 'TR', 'start': '12PM', 'end': '1:15PM'}]})
+    assert constraints['max_classes_per_day'] == 3
+    assert constraints['days_off'] == {'F'}
+    assert constraints['earliest_start'] == 570
+    assert constraints['latest_end'] is None
+    assert constraints['blocked_windows'] == [{'days': {'T', 'R'}, 'start': 720, 'end': 795}]
+
+
+def test_endpoint_rejects_bad_constraint_values(client):
+    response = client.post("/api/generate_schedule", json={
+        "courses": [], "term_year": "202601", "constraints": {"max_classes_per_day": -1}})
+    assert response.status_code == 400
+    assert "max_classes_per_day" in response.get_json()['error']
+
+
+def test_days_off_and_time_windows_drop_whole_crns(courses_data):
+    constraints = app.parse_schedule_constraints({'days_off': 'R', 'earliest_start': '10:00AM'})
+    filtered, unsatisfiable = app.apply_schedule_constraints(courses_data, constraints)
+    assert unsatisfiable == []
+    assert crns(filtered['CS2114']) == ['2']
+    assert crns(filtered['MATH1225']) == ['8']
+
+
+def test_additional_times_rows_count_against_their_crn(courses_data):
+    # CRN 1's Tuesday afternoon meeting is on an "Additional Times" row
+    constraints = app.parse_schedule_constraints(
+        {'blocked_windows': [{'days': 'T', 'start': '2:30PM', 'end': '3:00PM'}]})
+    filtered, _ = app.apply_schedule_constraints(courses_data, constraints)
+    assert crns(filtered['CS2114']) == ['2', '3']
+    assert len(filtered['CS2114']) == 2
+
+
+def test_course_with_no_sections_left_is_unsatisfiable(courses_data):
+    constraints = app.parse_schedule_constraints({'days_off': 'MWF'})
+    filtered, unsatisfiable = app.apply_schedule_constraints(courses_data, constraints)
+    assert unsatisfiable == ['MATH1225']
+    assert crns(filtered['CS2114']) == ['3']
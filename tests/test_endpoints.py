@@ -0,0 +1,60 @@
+import time
+
+import app
+
+
+def test_multiple_schedules_rejects_bad_option_fields(client):
+    for field, value in (("min_differing_crns", "two"), ("min_differing_crns", 0),
+                         ("min_differing_crns", 500), ("num_options", 1000),
+                         ("num_options", True)):
+        response = client.post("/api/generate_multiple_schedules", json={
+            "courses": [], "term_year": "202601", field: value})
+        assert response.status_code == 400
+        assert field in response.get_json()['error']
+
+
+def test_generate_schedule_rejects_malformed_constraints(client):
+    response = client.post("/api/generate_schedule", json={
+        "courses": [], "term_year": "202601",
+        "constraints": {"blocked_windows": [{"days": "M"}]}})
+    assert response.status_code == 400
+    assert "Invalid constraints" in response.get_json()['error']
+
+
+def test_validate_schedule_requires_a_class_list(client):
+    response = client.post("/api/validate_schedule", json={"classes": "CS2114"})
+    assert response.status_code == 400
+
+
+def test_ai_max_cost_must_be_a_number(client):
+    for endpoint in ("/api/generate_schedule", "/api/generate_multiple_schedules"):
+        for value in ("cheap", -1, [1]):
+            response = client.post(endpoint, json={
+                "courses": [], "term_year": "202601", "ai_max_cost": value})
+            assert response.status_code == 400
+            assert "ai_max_cost" in response.get_json()['error']
+
+
+def test_local_fallback_results_are_not_cached(client, courses_data, courses, serve_catalog):
+    courses_data['CS2114'].loc[3, 'Schedule Type'] = 'Lab'  # Routes to the AI path
+    serve_catalog(courses_data)
+    app.ai_breaker.update(opened_at=time.time(), trial_in_flight=False)
+    body = {"courses": courses, "term_year": "202601", "preferences": ""}
+    response = client.post("/api/generate_schedule", json=body)
+    metrics = response.get_json()['performance_metrics']
+    assert metrics['optimization_method'] == "local_fallback"
+    assert response.get_json()['classes']
+    assert not app.schedule_result_cache
+
+    response = client.post("/api/generate_multiple_schedules", json=body)
+    assert response.get_json()['performance_metrics']['optimization_method'] == "local_fallback"
+    assert not app.schedule_result_cache
+
+
+def test_ai_hedge_attempts_must_be_a_small_integer(client):
+    for endpoint in ("/api/generate_schedule", "/api/generate_multiple_schedules"):
+        for value in ("many", 0, app.AI_HEDGE_POOL_SIZE + 1, 1.5):
+            response = client.post(endpoint, json={
+                "courses": [], "term_year": "202601", "ai_hedge_attempts": value})
+            assert response.status_code == 400
+            assert "ai_hedge_attempts" in response.get_json()['error']
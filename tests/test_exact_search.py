@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+import app
+
+
+def test_parallel_exact_search_matches_serial(monkeypatch, courses_data):
+    serial = app.SmartScheduleOptimizer(search_workers=1)._generate_optimal_schedules(
+        courses_data, top_k=5)
+    monkeypatch.setattr(app, "PARALLEL_SEARCH_MIN_COMBINATIONS", 1)
+    parallel = app.SmartScheduleOptimizer(search_workers=2)._generate_optimal_schedules(
+        courses_data, top_k=5)
+    assert [(score, [s['crn'] for s in schedule]) for score, schedule in parallel] == \
+        [(score, [s['crn'] for s in schedule]) for score, schedule in serial]
+    assert app.get_solver_pool() is app.get_solver_pool()
+
+
+def test_combinations_counted_from_parsed_sections(courses_data):
+    optimizer = app.SmartScheduleOptimizer()
+    expected = 1
+    for df in courses_data.values():
+        expected *= len(optimizer._parse_section_times(df))
+    assert optimizer.count_combinations(courses_data) == expected
+
+
+@pytest.mark.skipif("EXACT_SEARCH_WORKERS" in os.environ, reason="overridden by the environment")
+def test_exact_search_routing_is_opt_in():
+    assert app.EXACT_SEARCH_WORKERS == 1
+    assert app.smart_optimizer.search_workers == 1
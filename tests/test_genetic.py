@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+
+
+def test_island_lookups_are_not_double_counted(courses_data):
+    optimizer = app.GeneticScheduleOptimizer(
+        population_size=20, generations=30, islands=2, island_min_sections=1,
+        migration_interval=5, patience=1000, seed=3)
+    optimizer.min_diversity = 0.0
+    pool = app.get_solver_pool()
+    stats = {}
+    schedule = optimizer.optimize(courses_data, stats=stats)
+    assert schedule
+    assert stats['islands'] == 2
+    assert stats['fitness_lookups'] <= 2 * 20 * stats['generations_run']
+    assert stats['cache_hits'] + stats['cache_misses'] == stats['fitness_lookups']
+    assert app.get_solver_pool() is pool
+
+
+def test_single_population_run(courses_data):
+    optimizer = app.GeneticScheduleOptimizer(population_size=20, generations=10, seed=1)
+    schedule = optimizer.optimize(courses_data)
+    assert {section['course_code'] for section in schedule} == {'CS2114', 'MATH1225'}
+
+
+def test_concurrent_runs_keep_their_own_stats(courses_data):
+    optimizer = app.GeneticScheduleOptimizer(population_size=20, generations=10, seed=1)
+    inputs = [courses_data, {'MATH1225': courses_data['MATH1225']}] * 4
+
+    def run(course_sections):
+        stats = {}
+        schedule = optimizer.optimize(course_sections, stats=stats)
+        return len(schedule), stats['best_fitness']
+
+    expected = [run(course_sections) for course_sections in inputs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(run, inputs)) == expected
+    assert expected[0] != expected[1]
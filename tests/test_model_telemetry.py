@@ -0,0 +1,31 @@
+import json
+import os
+from collections import defaultdict, deque
+
+import pytest
+
+import app
+
+# conftest stubs record_model_attempt out for every test; keep the real one
+record_model_attempt = app.record_model_attempt
+
+
+@pytest.mark.skipif("AI_MODEL_ROUTING" in os.environ, reason="routing set by environment")
+def test_routing_defaults_to_static():
+    assert app.AI_MODEL_ROUTING == "static"
+
+
+def test_telemetry_file_is_compacted_to_the_window(monkeypatch, tmp_path):
+    path = tmp_path / "telemetry.jsonl"
+    monkeypatch.setattr(app, "MODEL_TELEMETRY_FILE", str(path))
+    monkeypatch.setattr(app, "MODEL_TELEMETRY_MAX_LINES", 5)
+    monkeypatch.setattr(app, "telemetry_file_lines", 0)
+    monkeypatch.setattr(app, "model_telemetry", defaultdict(lambda: deque(maxlen=3)))
+
+    for attempt in range(12):
+        record_model_attempt("gemini-test", attempt, True, 0.1, 0.001)
+        assert len(path.read_text().splitlines()) <= 5
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert entries[-1]['input_tokens'] == 11
+    assert [e['input_tokens'] for e in app.model_telemetry["gemini-test"]] == [9, 10, 11]
@@ -0,0 +1,36 @@
+import os
+import time
+
+import app
+
+# conftest stubs the response cache out for every test; keep the real functions
+load_ai_response = app.load_ai_response
+store_ai_response = app.store_ai_response
+
+
+def test_cache_directory_is_created_on_first_store(monkeypatch, tmp_path):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(app, "AI_RESPONSE_CACHE_DIR", str(cache_dir))
+    assert not cache_dir.exists()
+    store_ai_response("gemini-test", "prompt", [{"crn": "1"}], 100, 0.01)
+    entry = load_ai_response(["gemini-test"], "prompt", 60)
+    assert entry['classes'] == [{"crn": "1"}]
+
+
+def test_cache_is_bounded_by_entries_and_age(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "AI_RESPONSE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "AI_RESPONSE_CACHE_MAX_ENTRIES", 2)
+    for index in range(3):
+        store_ai_response("gemini-test", f"prompt {index}", [], 0, 0.0)
+        path = os.path.join(str(tmp_path), app.ai_response_cache_key(
+            "gemini-test", f"prompt {index}") + ".json")
+        os.utime(path, (time.time() + index, time.time() + index))
+    app.prune_ai_response_cache()
+    assert len(os.listdir(tmp_path)) == 2
+    assert load_ai_response(["gemini-test"], "prompt 0", 60) is None
+
+    old = time.time() - app.CACHE_DURATION - 10
+    for name in os.listdir(tmp_path):
+        os.utime(os.path.join(str(tmp_path), name), (old, old))
+    assert app.prune_ai_response_cache() == 2
+    assert os.listdir(tmp_path) == []
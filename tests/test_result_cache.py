@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import app
+from conftest import timetable_row
+
+TERM = "202609"
+
+
+@pytest.fixture
+def simple_data(serve_catalog):
+    """Lecture-only courses, so requests stay on the local solvers"""
+    return serve_catalog({
+        'CS3114': pd.DataFrame([
+            timetable_row('11', 'CS-3114', 'L', 'Smith J', 'MWF', '9:05AM', '9:55AM', 'MCB 100'),
+            timetable_row('12', 'CS-3114', 'L', 'Smith J', 'TR', '11:00AM', '12:15PM', 'MCB 100'),
+        ]),
+        'MATH1225': pd.DataFrame([
+            timetable_row('9', 'MATH-1225', 'L', 'Jones', 'MWF', '9:05AM', '9:55AM', 'MCB 100', 'Calc'),
+            timetable_row('8', 'MATH-1225', 'L', 'Jones', 'MWF', '10:10AM', '11:00AM', 'MCB 100', 'Calc'),
+        ]),
+    })
+
+
+def request_body(**extra):
+    body = {"term_year": TERM, "preferences": "morning",
+            "courses": [{'department': 'CS', 'number': '3114', 'professor': ''},
+                        {'department': 'MATH', 'number': '1225', 'professor': ''}]}
+    body.update(extra)
+    return body
+
+
+def method(response):
+    return response.get_json()['performance_metrics']['optimization_method']
+
+
+def test_identical_request_is_served_from_cache(client, simple_data):
+    first = client.post("/api/generate_schedule", json=request_body())
+    assert first.status_code == 200 and method(first) != "result_cache"
+    second = client.post("/api/generate_schedule", json=request_body())
+    assert method(second) == "result_cache"
+    assert second.get_json()['classes'] == first.get_json()['classes']
+
+
+def test_different_preferences_miss(client, simple_data):
+    client.post("/api/generate_schedule", json=request_body())
+    other = client.post("/api/generate_schedule", json=request_body(preferences="afternoon"))
+    assert method(other) != "result_cache"
+
+
+def test_refreshed_course_data_invalidates(client, simple_data):
+    client.post("/api/generate_schedule", json=request_body())
+    app.invalidate_result_cache("MATH1225", TERM)
+    assert method(client.post("/api/generate_schedule", json=request_body())) != "result_cache"
+
+
+def test_session_id_is_not_shared_through_the_cache(client, simple_data):
+    first = client.post("/api/generate_schedule", json=request_body(reuse_session=True))
+    session_id = first.get_json()['session_id']
+    assert all('session_id' not in entry['response']
+               for entry in app.schedule_result_cache.values())
+
+    anonymous = client.post("/api/generate_schedule", json=request_body())
+    assert method(anonymous) == "result_cache"
+    assert 'session_id' not in anonymous.get_json()
+
+    own = client.post("/api/generate_schedule", json=request_body(session_id="mine"))
+    assert method(own) == "result_cache"
+    assert own.get_json()['session_id'] == "mine" != session_id
@@ -0,0 +1,167 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from conftest import timetable_row
+
+
+def test_prompt_describes_every_scorer_weight():
+    assert set(app.SCORER_WEIGHT_DESCRIPTIONS) == set(app._preference_weights())
+
+
+def test_interpret_preferences_prompt_uses_scorer_descriptions(monkeypatch):
+    prompts = []
+    model = app.get_gemini_model(app.HYBRID_MODEL)
+    real_generate = model.generate_content
+
+    def capture(prompt, **kwargs):
+        prompts.append(prompt)
+        return real_generate(prompt, **kwargs)
+
+    monkeypatch.setattr(model, "generate_content", capture)
+    monkeypatch.setattr(app, "get_gemini_model", lambda name: model)
+    app.interpret_preferences("mornings and a lunch break please")
+    assert prompts
+    for key, description in app.SCORER_WEIGHT_DESCRIPTIONS.items():
+        assert f"- {key}: {description}" in prompts[0]
+
+
+def test_scorer_uses_described_thresholds(courses_data):
+    course_to_sections, _ = app.GeneticScheduleOptimizer()._parse_sections(courses_data)
+    weights = dict.fromkeys(app._preference_weights(), 0)
+    weights['lunch_break'] = 7
+    scorer = app.BatchScheduleScorer(course_to_sections, weights=weights)
+    candidates = scorer.random_candidates(50, np.random.default_rng(0))
+    result = scorer.score(candidates)
+    low, high = app.LUNCH_GAP_MINUTES
+    in_window = (result['total_gap'] >= low) & (result['total_gap'] <= high)
+    expected = np.where(result['valid'], 1000 + 7 * in_window, 0)
+    assert (result['score'] == expected).all()
+
+
+def reference_fitness(schedule, preferences=""):
+    """Score one decoded schedule section by section, the way the GA did
+    before BatchScheduleScorer; kept as the scorer's parity reference"""
+    prefs = preferences.lower()
+    for i, first in enumerate(schedule):
+        for second in schedule[i + 1:]:
+            if first.get('is_online') or second.get('is_online'):
+                continue
+            if set(first['days']) & set(second['days']) and (
+                    first['start_minutes'] < second['end_minutes'] + 5 and
+                    second['start_minutes'] < first['end_minutes'] + 5):
+                return 0
+
+    score = 1000
+    daily_schedules = defaultdict(list)
+    for section in schedule:
+        for day in section['days']:
+            daily_schedules[day].append(section)
+
+    total_gaps = morning = afternoon = evening = 0
+    for day_classes in daily_schedules.values():
+        day_classes.sort(key=lambda section: section['start_minutes'])
+        for section in day_classes:
+            start_hour = section['start_minutes'] // 60
+            if 7 <= start_hour < 12:
+                morning += 1
+            elif 12 <= start_hour < 17:
+                afternoon += 1
+            else:
+                evening += 1
+        for before, after in zip(day_classes, day_classes[1:]):
+            total_gaps += after['start_minutes'] - before['end_minutes']
+
+    if "morning" in prefs:
+        score += morning * 15
+    if "afternoon" in prefs:
+        score += afternoon * 15
+    if "evening" in prefs:
+        score += evening * 15
+    if "no classes before 10" in prefs:
+        score -= morning * 25
+    if "lunch break" in prefs and 30 <= total_gaps <= 120:
+        score += 10
+    if "close together" in prefs:
+        score += (len(daily_schedules) - (total_gaps > 30)) * 5
+    elif 15 <= total_gaps <= 60:
+        score += 3
+    for section in schedule:
+        if section['instructor'].lower() in prefs:
+            score += 20
+    return score
+
+
+def random_courses_data(rng, n_courses=4, n_sections=6):
+    day_patterns = ['MWF', 'TR', 'MW', 'R', 'F']
+    courses_data = {}
+    for course in range(n_courses):
+        rows = []
+        for crn in range(n_sections):
+            start = int(rng.integers(8 * 12, 18 * 12)) * 5
+            end = start + int(rng.choice([50, 75, 110]))
+            rows.append(timetable_row(
+                f"{course}{crn:02d}", f"CS-{3000 + course}", 'L', f"Prof {crn % 3}",
+                str(rng.choice(day_patterns)), clock(start), clock(end), 'MCB 100'))
+        courses_data[f"CS{3000 + course}"] = pd.DataFrame(rows)
+    return courses_data
+
+
+def clock(minutes):
+    hours, minutes = divmod(minutes, 60)
+    return f"{(hours - 1) % 12 + 1}:{minutes:02d}{'AM' if hours < 12 else 'PM'}"
+
+
+@pytest.mark.parametrize("preferences", [
+    "", "morning classes with a lunch break", "afternoon, close together",
+    "evening please, no classes before 10", "I like prof 1"])
+def test_scorer_matches_reference_fitness(preferences):
+    rng = np.random.default_rng(7)
+    for courses_data in (random_courses_data(rng), random_courses_data(rng, 3, 10)):
+        course_to_sections, _ = app.GeneticScheduleOptimizer()._parse_sections(courses_data)
+        scorer = app.BatchScheduleScorer(course_to_sections, preferences)
+        candidates = scorer.random_candidates(300, rng)
+        scores = scorer.score(candidates)['score']
+        expected = [reference_fitness(scorer.decode(candidate), preferences)
+                    for candidate in candidates]
+        assert scores.tolist() == expected
+        assert any(expected)
+
+
+def test_conflict_tiles_are_shared_across_scorers(monkeypatch):
+    monkeypatch.setattr(app, "conflict_tile_cache", app.OrderedDict())
+    course_to_sections, _ = app.GeneticScheduleOptimizer()._parse_sections(
+        random_courses_data(np.random.default_rng(3)))
+    first = app.BatchScheduleScorer(course_to_sections)
+    pairs = first.n_courses * (first.n_courses - 1) // 2
+    assert (first.tiles_cached, first.tiles_computed) == (0, pairs)
+
+    second = app.BatchScheduleScorer(course_to_sections, "mornings")
+    assert (second.tiles_cached, second.tiles_computed) == (pairs, 0)
+    for (i, j), table in second.pair_conflicts.items():
+        assert (table == second._conflict_table(i, j)).all()
+
+
+def test_conflict_tiles_hit_with_courses_reordered(monkeypatch):
+    monkeypatch.setattr(app, "conflict_tile_cache", app.OrderedDict())
+    course_to_sections, _ = app.GeneticScheduleOptimizer()._parse_sections(
+        random_courses_data(np.random.default_rng(5), 3, 4))
+    app.BatchScheduleScorer(course_to_sections)
+    reordered = app.BatchScheduleScorer(dict(reversed(list(course_to_sections.items()))))
+    assert reordered.tiles_computed == 0
+    for (i, j), table in reordered.pair_conflicts.items():
+        assert table.shape == (reordered.option_counts[i], reordered.option_counts[j])
+        assert (table == reordered._conflict_table(i, j)).all()
+
+
+def test_conflict_tile_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(app, "conflict_tile_cache", app.OrderedDict())
+    monkeypatch.setattr(app, "CONFLICT_TILE_CACHE_MAX_ENTRIES", 2)
+    course_to_sections, _ = app.GeneticScheduleOptimizer()._parse_sections(
+        random_courses_data(np.random.default_rng(9)))
+    scorer = app.BatchScheduleScorer(course_to_sections)
+    assert scorer.tiles_computed == 6
+    assert len(app.conflict_tile_cache) == 2
@@ -0,0 +1,135 @@
+import time
+
+import pandas as pd
+import pytest
+
+import app
+
+TERM = "209901"
+
+
+@pytest.fixture
+def fetches(monkeypatch, courses_data):
+    """Serve the timetable from the fixture frames and record every fetch"""
+    calls = []
+
+    def extractor(department, number, term_year, open_only=False, crn=""):
+        calls.append((department, number, crn))
+        if crn:
+            for df in courses_data.values():
+                if crn in set(df['CRN']):
+                    return df[df['CRN'] == crn]
+            return pd.DataFrame()
+        return courses_data.get(department + number, pd.DataFrame())
+    monkeypatch.setattr(app, "courseDetailsExractor", extractor)
+    monkeypatch.setattr(app, "course_cache", {})
+    app.section_index.pop(TERM, None)
+    app.section_index_courses.pop(TERM, None)
+    app.missing_crn_cache.clear()
+    return calls
+
+
+def test_check_crns_reports_conflicts_from_index(client, fetches):
+    hints = [{'department': 'CS', 'number': '2114'}, {'department': 'math', 'number': '1225'}]
+    body = client.post('/api/check_crns', json={
+        'term_year': TERM, 'crns': ['1', '9'], 'courses': hints}).get_json()
+    assert not body['valid']
+    assert {(c['crn_a'], c['crn_b'], c['day']) for c in body['conflicts']} == {
+        ('1', '9', 'M'), ('1', '9', 'W'), ('1', '9', 'F')}
+    assert body['unknown_crns'] == []
+    assert body['gap_stats']['days_on_campus'] == 4
+
+
+def test_check_crns_flags_duplicate_components(client, fetches):
+    client.post('/api/check_crns', json={
+        'term_year': TERM, 'crns': ['1'], 'courses': [{'department': 'CS', 'number': '2114'}]})
+    body = client.post('/api/check_crns', json={'term_year': TERM, 'crns': ['1', '2']}).get_json()
+    assert body['duplicate_components'] == [{'course': 'CS2114', 'schedule_type': 'L', 'crns': ['1', '2']}]
+
+
+@pytest.mark.parametrize("payload", [
+    {'crns': ['1'], 'courses': [{'department': 'CS'}]},
+    {'crns': ['1'], 'courses': ['2114-CS']},
+    {'crns': ['1'], 'min_gap_minutes': 'soon'},
+    {'crns': ['1'], 'min_gap_minutes': -5},
+    {'crns': [str(n) for n in range(app.CHECK_CRNS_MAX_CRNS + 1)]},
+    {'crns': []},
+])
+def test_check_crns_rejects_bad_input(client, fetches, payload):
+    response = client.post('/api/check_crns', json=dict(payload, term_year=TERM))
+    assert response.status_code == 400
+    assert fetches == []
+
+
+def test_unknown_crn_fetches_are_capped_and_cached(client, fetches):
+    crns = [str(n) for n in range(100, 100 + app.CRN_FETCH_MAX_PER_REQUEST + 3)]
+    body = client.post('/api/check_crns', json={'term_year': TERM, 'crns': crns}).get_json()
+    assert sorted(body['unknown_crns']) == sorted(crns)
+    assert len(fetches) == app.CRN_FETCH_MAX_PER_REQUEST
+
+    fetches.clear()
+    client.post('/api/check_crns', json={'term_year': TERM, 'crns': crns[:app.CRN_FETCH_MAX_PER_REQUEST]})
+    assert fetches == []
+
+
+def test_lookup_sections_does_not_fetch_by_default(fetches):
+    found, unknown = app.lookup_sections(TERM, ['1'])
+    assert found == {} and unknown == ['1']
+    assert fetches == []
+
+
+def test_free_sections_fit_around_schedule(client, fetches):
+    body = client.post('/api/find_free_sections', json={
+        'term_year': TERM, 'crns': ['9'], 'courses': ['cs-2114', {'department': 'math', 'number': '1225'}],
+    }).get_json()
+    assert body['courses_searched'] == ['CS2114', 'MATH1225']
+    # CRN 1 clashes with MATH 9; 2, 3 and MATH 8 fit (a 5 minute gap is enough)
+    assert [section['crn'] for section in body['sections']] == ['2', '3', '8']
+
+
+def test_free_sections_respect_min_gap(client, fetches):
+    body = client.post('/api/find_free_sections', json={
+        'term_year': TERM, 'crns': ['9'], 'courses': ['MATH1225'], 'min_gap_minutes': 10,
+    }).get_json()
+    assert body['sections'] == []
+
+
+@pytest.mark.parametrize("payload", [
+    {'courses': ['CS2114'], 'min_gap_minutes': 'x'},
+    {'courses': [{'number': '2114'}]},
+    {'courses': []},
+    {'subject': '%'},
+    {'subject': 'C%'},
+    {'courses': [{'department': '%', 'number': '2114'}]},
+    {'courses': [f'CS{n}' for n in range(1000, 1001 + app.COURSE_HINTS_MAX)]},
+    {'courses': ['CS2114'], 'classes': ['MWF 9:05AM']},
+    {'courses': ['CS2114'], 'classes': {'time': '9:05AM - 9:55AM'}},
+])
+def test_free_sections_reject_bad_input(client, fetches, payload):
+    response = client.post('/api/find_free_sections', json=dict(payload, term_year=TERM))
+    assert response.status_code == 400
+    assert fetches == []
+
+
+def test_expired_sections_are_pruned(fetches):
+    app.get_cached_course_data('MATH', '1225', TERM)
+    app.lookup_sections(TERM, ['404'], fetch_missing=True)
+    assert (TERM, '404') in app.missing_crn_cache
+    version = app.section_index_versions[TERM]
+
+    stale = time.time() - app.CACHE_DURATION - 1
+    for section in app.section_index[TERM].values():
+        section['indexed_at'] = stale
+    app.missing_crn_cache[(TERM, '404')] = stale
+    app.prune_section_index()
+    assert TERM not in app.section_index
+    assert TERM not in app.section_index_courses
+    assert (TERM, '404') not in app.missing_crn_cache
+    assert app.section_index_versions[TERM] > version
+
+
+def test_sections_meeting_during_uses_gap(fetches):
+    app.get_cached_course_data('MATH', '1225', TERM)
+    assert app.sections_meeting_during(TERM, 'M', 9 * 60 + 55, 10 * 60 + 30) == {'8'}
+    assert app.sections_meeting_during(TERM, 'M', 11 * 60, 11 * 60 + 30, min_gap=5) == set()
+    assert app.sections_meeting_during(TERM, 'M', 10 * 60 + 52, 11 * 60, min_gap=5) == {'8'}
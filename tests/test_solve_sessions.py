@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def empty_sessions(monkeypatch):
+    monkeypatch.setattr(app, "solve_sessions", app.OrderedDict())
+
+
+def test_no_session_unless_requested():
+    assert app.get_solve_session(None, "202609") is None
+    assert len(app.solve_sessions) == 0
+
+
+def test_session_reused_by_id_and_keyed_by_term():
+    session = app.get_solve_session(None, "202609", create=True)
+    assert app.get_solve_session(session['id'], "202609") is session
+    other_term = app.get_solve_session(session['id'], "202701")
+    assert other_term is not session and other_term['id'] == session['id']
+
+
+def test_sessions_evicted_least_recently_used(monkeypatch):
+    monkeypatch.setattr(app, "SESSION_MAX_ENTRIES", 2)
+    first = app.get_solve_session("a", "202609")
+    app.get_solve_session("b", "202609")
+    app.get_solve_session("a", "202609")
+    app.get_solve_session("c", "202609")
+    assert set(app.solve_sessions) == {("a", "202609"), ("c", "202609")}
+    assert app.get_solve_session("a", "202609") is first
+
+
+def test_expired_session_starts_fresh():
+    session = app.get_solve_session("a", "202609")
+    session['best_crns']['CS2114'] = '1'
+    session['last_used'] = time.time() - app.SESSION_DURATION - 1
+    assert app.get_solve_session("a", "202609")['best_crns'] == {}
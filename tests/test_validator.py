@@ -0,0 +1,72 @@
+import app
+
+
+def row(crn, course, days, time):
+    return {"crn": crn, "courseNumber": course, "days": days, "time": time}
+
+
+def test_extra_courses_and_unknown_crns_are_invalid():
+    classes = [row("1", "CS-2114", "MWF", "9:05AM - 9:55AM"),
+               row("77", "HIST-1115", "TR", "11:00AM - 12:15PM")]
+    result = app.validate_schedule(classes, ["CS2114"], known_crns={"1"})
+    assert not result['valid']
+    assert result['extra'] == ["HIST1115"]
+    assert result['unknown_crns'] == ["77"]
+    assert result['missing'] == [] and result['conflicts'] == []
+
+
+def test_invented_course_is_repaired_away(courses_data, courses):
+    classes = [row("1", "CS-2114", "MWF", "9:05AM - 9:55AM"),
+               row("8", "MATH-1225", "MWF", "10:00AM - 10:50AM"),
+               row("77", "HIST-1115", "TR", "11:00AM - 12:15PM")]
+    repaired_classes, repaired, problems = app.validate_ai_schedule(
+        {"classes": classes}, courses, courses_data)
+    assert repaired and problems['extra'] == {"HIST1115"}
+    assert {cls['courseNumber'] for cls in repaired_classes} == {"CS2114", "MATH1225"}
+
+
+def test_unknown_crn_is_rejected_without_catalog(courses):
+    classes = [row("1", "CS-2114", "MWF", "9:05AM - 9:55AM"),
+               row("8", "MATH-1225", "MWF", "10:00AM - 10:50AM"),
+               row("77", "HIST-1115", "TR", "11:00AM - 12:15PM")]
+    repaired_classes, repaired, problems = app.validate_ai_schedule({"classes": classes}, courses)
+    assert repaired_classes is None and not repaired
+
+
+def test_validate_endpoint_reports_extra_courses(client):
+    response = client.post("/api/validate_schedule", json={
+        "classes": [row("1", "CS-2114", "MWF", "9:05AM - 9:55AM")],
+        "courses": ["MATH1225"]})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['extra'] == ["CS2114"] and body['missing'] == ["MATH1225"]
+
+
+def test_validate_endpoint_rejects_bad_min_gap(client):
+    for value in ("soon", -5, 10000):
+        response = client.post("/api/validate_schedule", json={
+            "classes": [], "min_gap_minutes": value})
+        assert response.status_code == 400
+
+
+def test_every_overlapping_pair_is_reported():
+    # A long class overlaps two short ones that don't touch each other
+    classes = [row("1", "CS-2114", "MW", "9:00AM - 11:45AM"),
+               row("2", "MATH-1225", "MW", "9:30AM - 10:20AM"),
+               row("3", "PHYS-2305", "M", "11:00AM - 11:50AM"),
+               row("4", "ENGL-1105", "TR", "9:30AM - 10:45AM")]
+    result = app.validate_schedule(classes)
+    pairs = {(c['day'], c['crn_a'], c['crn_b'], c['kind']) for c in result['conflicts']}
+    assert pairs == {("M", "1", "2", "overlap"), ("W", "1", "2", "overlap"),
+                     ("M", "1", "3", "overlap")}
+    assert not result['valid']
+
+
+def test_too_small_gap_is_a_conflict_and_unparsed_times_are_skipped():
+    classes = [row("1", "CS-2114", "T", "9:00AM - 9:50AM"),
+               row("2", "MATH-1225", "T", "9:52 - 10:40AM"),
+               row("3", "PHYS-2305", "Online", "Online")]
+    result = app.validate_schedule(classes, min_gap=5)
+    assert [(c['kind'], c['overlap_minutes']) for c in result['conflicts']] == [("gap", 0)]
+    assert result['unparsed'] == [2]
+    assert app.validate_schedule(classes, min_gap=0)['valid']